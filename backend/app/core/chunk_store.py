@@ -0,0 +1,371 @@
+"""Columnar, memory-mapped storage for chunk metadata.
+
+Replaces the pickled ``List[Dict]`` that used to sit next to every FAISS
+index. A chunk store file holds one row per vector:
+
+- chunk text as offsets into a single UTF-8 blob
+- filename, document_id and client_id as int32 codes into interned string
+  tables (client_id tags the rows of tenants sharing a packed index)
+- chunk_index as an int32 array
+- any remaining fields as a compact JSON blob per row
+
+Files are opened through ``mmap``, so loading costs one header parse and
+rows are only decoded when a search actually returns them.
+
+File layout::
+
+    MAGIC | uint64 header length | JSON header | 8-byte aligned columns
+
+Column offsets in the header are relative to the aligned end of the header.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+MAGIC = b"CLCHUNK1"
+_HEADER_LEN = struct.Struct("<Q")
+_ALIGN = 8
+
+HAS_TEXT = 1
+HAS_METADATA = 2
+
+_MISSING = -1
+
+
+def _intern(value: Optional[str], table: Dict[str, int]) -> int:
+    """Return the code for a string, adding it to the table if new."""
+    if value is None:
+        return _MISSING
+    code = table.get(value)
+    if code is None:
+        code = table[value] = len(table)
+    return code
+
+
+def _split_row(row: Dict) -> tuple:
+    """Split a metadata row into columnar fields and leftover extras."""
+    rest = dict(row)
+    flags = 0
+
+    text = rest.pop("text", None)
+    if isinstance(text, str):
+        flags |= HAS_TEXT
+    elif text is not None:
+        rest["text"] = text
+        text = None
+
+    document_id = rest.pop("document_id", None)
+    if document_id is not None and not isinstance(document_id, str):
+        rest["document_id"] = document_id
+        document_id = None
+
+    client_id = rest.pop("client_id", None)
+    if client_id is not None and not isinstance(client_id, str):
+        rest["client_id"] = client_id
+        client_id = None
+
+    chunk_index = rest.pop("chunk_index", None)
+    if chunk_index is not None and (
+        not isinstance(chunk_index, int) or isinstance(chunk_index, bool)
+    ):
+        rest["chunk_index"] = chunk_index
+        chunk_index = None
+
+    metadata = rest.pop("metadata", None)
+    filename = None
+    meta_rest: Dict = {}
+    if isinstance(metadata, dict):
+        flags |= HAS_METADATA
+        meta_rest = dict(metadata)
+        filename = meta_rest.pop("filename", None)
+        if filename is not None and not isinstance(filename, str):
+            meta_rest["filename"] = filename
+            filename = None
+    elif metadata is not None:
+        rest["metadata"] = metadata
+
+    extras: Dict = {}
+    if rest:
+        extras["row"] = rest
+    if meta_rest:
+        extras["metadata"] = meta_rest
+
+    return flags, text, filename, document_id, client_id, chunk_index, extras
+
+
+def _aligned(offset: int) -> int:
+    """Round an offset up to the column alignment."""
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _blob(values: Sequence[bytes]) -> tuple:
+    """Concatenate byte strings into a blob plus an (n + 1) offset array."""
+    offsets = np.zeros(len(values) + 1, dtype="<i8")
+    if values:
+        offsets[1:] = np.cumsum([len(v) for v in values])
+    return offsets, b"".join(values)
+
+
+class ChunkStore:
+    """Read-only columnar view over one segment's chunk metadata."""
+
+    def __init__(self, buffer, header: Dict, handle=None) -> None:
+        """Wrap a buffer laid out by :meth:`write`.
+
+        Use :meth:`open` or :meth:`from_rows` instead of calling this.
+        """
+        self._buffer = buffer
+        self._handle = handle
+        self._rows = header["rows"]
+        self._filenames: List[str] = header["filenames"]
+        self._document_ids: List[str] = header["document_ids"]
+        self._client_ids: List[str] = header.get("client_ids", [])
+        self._nbytes = len(buffer)
+
+        columns = {}
+        for name, (dtype, offset, count) in header["columns"].items():
+            columns[name] = np.frombuffer(
+                buffer,
+                dtype=np.dtype(dtype),
+                count=count,
+                offset=header["data_start"] + offset,
+            )
+
+        self._flags = columns["flags"]
+        self._text_offsets = columns["text_offsets"]
+        self._text_blob = columns["text_blob"]
+        self._filename_codes = columns["filename"]
+        self._document_codes = columns["document_id"]
+        # Files written before packed indexes have no client_id column.
+        self._client_codes = columns.get(
+            "client_id", np.full(self._rows, _MISSING, dtype="<i4")
+        )
+        self._chunk_index = columns["chunk_index"]
+        self._extra_offsets = columns["extra_offsets"]
+        self._extra_blob = columns["extra_blob"]
+
+    # Construction
+
+    @staticmethod
+    def encode(rows: Sequence[Dict]) -> bytes:
+        """Serialize metadata rows into the columnar file format."""
+        filenames: Dict[str, int] = {}
+        document_ids: Dict[str, int] = {}
+        client_ids: Dict[str, int] = {}
+
+        n = len(rows)
+        flags = np.zeros(n, dtype="<u1")
+        filename_codes = np.full(n, _MISSING, dtype="<i4")
+        document_codes = np.full(n, _MISSING, dtype="<i4")
+        client_codes = np.full(n, _MISSING, dtype="<i4")
+        chunk_index = np.full(n, _MISSING, dtype="<i4")
+        texts: List[bytes] = []
+        extras: List[bytes] = []
+
+        for i, row in enumerate(rows):
+            flag, text, filename, document_id, client_id, index, extra = _split_row(row)
+            flags[i] = flag
+            texts.append(text.encode("utf-8") if text is not None else b"")
+            filename_codes[i] = _intern(filename, filenames)
+            document_codes[i] = _intern(document_id, document_ids)
+            client_codes[i] = _intern(client_id, client_ids)
+            if index is not None:
+                chunk_index[i] = index
+            extras.append(
+                json.dumps(extra, separators=(",", ":"), default=str).encode("utf-8")
+                if extra
+                else b""
+            )
+
+        text_offsets, text_blob = _blob(texts)
+        extra_offsets, extra_blob = _blob(extras)
+
+        arrays = {
+            "flags": flags,
+            "text_offsets": text_offsets,
+            "text_blob": np.frombuffer(text_blob, dtype="<u1"),
+            "filename": filename_codes,
+            "document_id": document_codes,
+            "client_id": client_codes,
+            "chunk_index": chunk_index,
+            "extra_offsets": extra_offsets,
+            "extra_blob": np.frombuffer(extra_blob, dtype="<u1"),
+        }
+
+        columns = {}
+        cursor = 0
+        for name, array in arrays.items():
+            cursor = _aligned(cursor)
+            columns[name] = (array.dtype.str, cursor, int(array.size))
+            cursor += array.nbytes
+
+        header_bytes = json.dumps(
+            {
+                "rows": n,
+                "filenames": list(filenames),
+                "document_ids": list(document_ids),
+                "client_ids": list(client_ids),
+                "columns": columns,
+            }
+        ).encode("utf-8")
+
+        start = len(MAGIC) + _HEADER_LEN.size
+        data_start = _aligned(start + len(header_bytes))
+
+        out = bytearray(data_start + cursor)
+        out[: len(MAGIC)] = MAGIC
+        _HEADER_LEN.pack_into(out, len(MAGIC), len(header_bytes))
+        out[start : start + len(header_bytes)] = header_bytes
+        for name, array in arrays.items():
+            offset = data_start + columns[name][1]
+            out[offset : offset + array.nbytes] = array.tobytes()
+
+        return bytes(out)
+
+    @classmethod
+    def write(cls, path: str, rows: Sequence[Dict]) -> None:
+        """Write metadata rows to ``path`` in the columnar format."""
+        with open(path, "wb") as f:
+            f.write(cls.encode(rows))
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict]) -> "ChunkStore":
+        """Build an in-memory chunk store from metadata rows."""
+        data = cls.encode(rows)
+        return cls(data, cls._parse_header(data))
+
+    @classmethod
+    def open(cls, path: str) -> "ChunkStore":
+        """Memory-map a chunk store file without decoding any rows.
+
+        Raises:
+            ValueError: If the file is not a chunk store.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Empty chunk store file: {path}")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return cls(mapped, cls._parse_header(mapped), handle=mapped)
+
+    @staticmethod
+    def _parse_header(buffer) -> Dict:
+        """Parse and validate the JSON header of a chunk store buffer."""
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a chunk store file")
+        (length,) = _HEADER_LEN.unpack_from(buffer, len(MAGIC))
+        start = len(MAGIC) + _HEADER_LEN.size
+        header = json.loads(bytes(buffer[start : start + length]))
+        header["data_start"] = _aligned(start + length)
+        return header
+
+    # Access
+
+    def __len__(self) -> int:
+        """Return the number of rows."""
+        return self._rows
+
+    def __getitem__(self, i: int) -> Dict:
+        """Materialize row ``i`` as a fresh metadata dict."""
+        if not 0 <= i < self._rows:
+            raise IndexError(i)
+
+        flags = int(self._flags[i])
+        row: Dict = {}
+        metadata: Dict = {}
+
+        extra = self._slice(self._extra_offsets, self._extra_blob, i)
+        if extra:
+            decoded = json.loads(extra)
+            row.update(decoded.get("row", {}))
+            metadata.update(decoded.get("metadata", {}))
+
+        if flags & HAS_TEXT:
+            row["text"] = self._slice(self._text_offsets, self._text_blob, i).decode(
+                "utf-8"
+            )
+
+        filename = int(self._filename_codes[i])
+        if filename != _MISSING:
+            metadata["filename"] = self._filenames[filename]
+        if flags & HAS_METADATA:
+            row["metadata"] = metadata
+
+        document = int(self._document_codes[i])
+        if document != _MISSING:
+            row["document_id"] = self._document_ids[document]
+
+        client = int(self._client_codes[i])
+        if client != _MISSING:
+            row["client_id"] = self._client_ids[client]
+
+        chunk_index = int(self._chunk_index[i])
+        if chunk_index != _MISSING:
+            row["chunk_index"] = chunk_index
+
+        return row
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Iterate over all rows, materializing each one."""
+        for i in range(self._rows):
+            yield self[i]
+
+    def rows(self, indices: Sequence[int]) -> List[Dict]:
+        """Materialize only the requested rows."""
+        return [self[int(i)] for i in indices]
+
+    def texts(self) -> Iterator[Optional[str]]:
+        """Iterate over the chunk text of every row, None where absent."""
+        for i in range(self._rows):
+            if self._flags[i] & HAS_TEXT:
+                yield self._slice(self._text_offsets, self._text_blob, i).decode(
+                    "utf-8"
+                )
+            else:
+                yield None
+
+    @property
+    def nbytes(self) -> int:
+        """Return the size of the underlying columnar buffer in bytes."""
+        return self._nbytes
+
+    @property
+    def document_ids(self) -> List[str]:
+        """Return the interned document id table."""
+        return list(self._document_ids)
+
+    @property
+    def document_codes(self) -> np.ndarray:
+        """Return each row's code into :attr:`document_ids` (-1 if absent)."""
+        return self._document_codes
+
+    @property
+    def client_ids(self) -> List[str]:
+        """Return the interned client id table."""
+        return list(self._client_ids)
+
+    @property
+    def client_codes(self) -> np.ndarray:
+        """Return each row's code into :attr:`client_ids` (-1 if absent)."""
+        return self._client_codes
+
+    def close(self) -> None:
+        """Release the memory map, if any."""
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except BufferError:
+                # Row views still reference the map; the GC releases it later.
+                pass
+
+    @staticmethod
+    def _slice(offsets: np.ndarray, blob: np.ndarray, i: int) -> bytes:
+        """Return the raw bytes of row ``i`` in a blob column."""
+        return blob[int(offsets[i]) : int(offsets[i + 1])].tobytes()
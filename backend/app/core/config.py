@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import Literal
+from typing import Dict, Literal
 
 from dotenv import load_dotenv
 from pydantic import field_validator, model_validator
@@ -42,6 +42,58 @@ class Settings(BaseSettings):
 
     # Embeddings
     OPENAI_EBD_MODEL: Literal["text-embedding-3-small"] = "text-embedding-3-small"
+    # Per-request limits of the embeddings API.
+    EMBEDDING_BATCH_MAX_ITEMS: int = 2048
+    EMBEDDING_BATCH_MAX_TOKENS: int = 300_000
+    EMBEDDING_MAX_INPUT_TOKENS: int = 8191
+    EMBEDDING_CONCURRENCY: int = 4
+    EMBEDDING_RETRIES: int = 3
+    EMBEDDING_RETRY_DELAY: float = 1.0
+
+    # Vector store
+    FAISS_MAX_SEGMENTS: int = 8
+    FAISS_CACHE_MAX_BYTES: int = 2 * 1024**3
+    FAISS_DISK_CACHE_MAX_BYTES: int = 20 * 1024**3
+    FAISS_IO_WORKERS: int = 4
+    FAISS_SEARCH_WORKERS: int = 4
+    FAISS_EXECUTOR_MAX_QUEUE: int = 256
+    FAISS_UPLOAD_RETRIES: int = 3
+    FAISS_UPLOAD_RETRY_DELAY: float = 60.0
+    FAISS_UPLOAD_FLUSH_TIMEOUT: float = 30.0
+    FAISS_MANIFEST_FETCH_RETRIES: int = 3
+    FAISS_MANIFEST_FETCH_RETRY_DELAY: float = 0.2
+    FAISS_WRITE_LEASE_TTL: float = 300.0
+    FAISS_WRITE_LEASE_WAIT: float = 60.0
+    FAISS_WRITE_BATCH_MAX_VECTORS: int = 50_000
+    FAISS_VERIFY_CHECKSUMS: bool = True
+    FAISS_MMAP_FLAT: bool = True
+    FAISS_TOMBSTONE_COMPACT_RATIO: float = 0.2
+    FAISS_FLAT_MAX_VECTORS: int = 20_000
+    FAISS_HNSW_MAX_VECTORS: int = 1_000_000
+    FAISS_HNSW_M: int = 32
+    FAISS_VECTOR_STORAGE: str = "fp32"
+    FAISS_VECTOR_STORAGE_BY_PLAN: Dict[str, str] = {}
+    FAISS_METRIC: str = "l2"
+    FAISS_HNSW_EF_SEARCH: int = 16
+    FAISS_HNSW_EF_SEARCH_BY_PLAN: Dict[str, int] = {}
+    # Tenants hash to shards, so the count must not change once in use.
+    FAISS_PACKED_SHARDS: int = 0
+    FAISS_PACKED_MAX_VECTORS: int = 2_000
+    FAISS_FILTER_EXACT_MAX_ROWS: int = 2_048
+    # See scripts/benchmark_exact_search.py for the crossover with HNSW.
+    FAISS_EXACT_SEARCH_MAX_VECTORS: int = 512
+    FAISS_PREWARM_ENABLED: bool = True
+    FAISS_PREWARM_MAX_CLIENTS: int = 50
+    FAISS_PREWARM_BUDGET_FRACTION: float = 0.5
+    FAISS_PREWARM_ACTIVITY_HOURS: int = 24
+    FAISS_HOT_SET_SNAPSHOT_INTERVAL: float = 60.0
+    FAISS_HOT_SET_TTL: int = 7 * 24 * 3600
+
+    # Retrieval
+    RAG_MIN_SCORE: float = 0.0
+    RAG_HYBRID_SEARCH: bool = True
+    RAG_HYBRID_CANDIDATES: int = 20
+    RAG_RRF_K: int = 60
 
     # Storage
     DO_SPACES_KEY: str
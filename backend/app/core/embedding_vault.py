@@ -0,0 +1,210 @@
+"""Raw embedding storage, one file per document.
+
+FAISS indexes may hold quantized vectors, and re-embedding a tenant
+through the OpenAI API costs money and hours. A vault file keeps a
+document's float32 embeddings next to its chunk metadata, so any index
+structure can be rebuilt from the vault without calling the API again.
+
+File layout::
+
+    MAGIC | uint64 header length | JSON header | 8-byte aligned sections
+
+Sections are the row-major ``rows x dim`` float32 vectors followed by a
+``chunk_store`` file holding the metadata rows. Section offsets in the
+header are relative to the aligned end of the header.
+
+Local files are stored uncompressed so the vectors can be memory-mapped.
+Copies shipped to S3 go through :func:`compress`, which splits the
+vectors into byte planes before deflating them: the sign and exponent
+bytes of embeddings are nearly constant and compress well once they are
+no longer interleaved with the noisy mantissa bytes.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from backend.app.core.chunk_store import ChunkStore
+
+MAGIC = b"CLVECS01"
+COMPRESSED_MAGIC = b"CLVECZ01"
+_HEADER_LEN = struct.Struct("<Q")
+_ALIGN = 8
+_DTYPE = np.dtype("<f4")
+
+
+def _aligned(offset: int) -> int:
+    """Round an offset up to the section alignment."""
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _parse_header(buffer) -> Dict:
+    """Parse and validate the JSON header of a vault buffer.
+
+    Raises:
+        ValueError: If the buffer is not a complete vault file.
+    """
+    if bytes(buffer[: len(MAGIC)]) != MAGIC:
+        raise ValueError("Not an embedding vault file")
+    (length,) = _HEADER_LEN.unpack_from(buffer, len(MAGIC))
+    start = len(MAGIC) + _HEADER_LEN.size
+    header = json.loads(bytes(buffer[start : start + length]))
+    header["data_start"] = _aligned(start + length)
+
+    if len(buffer) != header["data_start"] + header["size"]:
+        raise ValueError("Truncated embedding vault file")
+    return header
+
+
+def _vector_span(header: Dict) -> slice:
+    """Return the absolute byte range of the vector section."""
+    offset, nbytes = header["vectors"]
+    start = header["data_start"] + offset
+    return slice(start, start + nbytes)
+
+
+class EmbeddingVaultFile:
+    """Read-only view over one document's vault file."""
+
+    def __init__(self, buffer, header: Dict, handle=None) -> None:
+        """Wrap a buffer laid out by :meth:`encode`.
+
+        Use :meth:`open` or :meth:`from_bytes` instead of calling this.
+        """
+        self._buffer = buffer
+        self._handle = handle
+        self.document_id: Optional[str] = header.get("document_id")
+        self.model: Optional[str] = header.get("model")
+
+        self.vectors = np.frombuffer(
+            buffer,
+            dtype=_DTYPE,
+            count=header["rows"] * header["dim"],
+            offset=_vector_span(header).start,
+        ).reshape(header["rows"], header["dim"])
+
+        offset, nbytes = header["chunks"]
+        start = header["data_start"] + offset
+        chunks = memoryview(buffer)[start : start + nbytes]
+        self.chunks = ChunkStore(chunks, ChunkStore._parse_header(chunks))
+
+    # Construction
+
+    @staticmethod
+    def encode(
+        vectors: np.ndarray,
+        rows: Sequence[Dict],
+        document_id: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> bytes:
+        """Serialize a document's vectors and metadata rows.
+
+        Raises:
+            ValueError: If there is not exactly one row per vector.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=_DTYPE)
+        if vectors.ndim != 2 or len(vectors) != len(rows):
+            raise ValueError(
+                f"Expected one metadata row per vector, got {vectors.shape} "
+                f"vectors and {len(rows)} rows"
+            )
+
+        chunks = ChunkStore.encode(rows)
+        chunks_offset = _aligned(vectors.nbytes)
+        header_bytes = json.dumps(
+            {
+                "rows": int(vectors.shape[0]),
+                "dim": int(vectors.shape[1]),
+                "document_id": document_id,
+                "model": model,
+                "vectors": [0, vectors.nbytes],
+                "chunks": [chunks_offset, len(chunks)],
+                "size": chunks_offset + len(chunks),
+            }
+        ).encode("utf-8")
+
+        start = len(MAGIC) + _HEADER_LEN.size
+        data_start = _aligned(start + len(header_bytes))
+
+        out = bytearray(data_start + chunks_offset + len(chunks))
+        out[: len(MAGIC)] = MAGIC
+        _HEADER_LEN.pack_into(out, len(MAGIC), len(header_bytes))
+        out[start : start + len(header_bytes)] = header_bytes
+        out[data_start : data_start + vectors.nbytes] = vectors.tobytes()
+        out[data_start + chunks_offset :] = chunks
+
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EmbeddingVaultFile":
+        """Wrap an in-memory vault file."""
+        return cls(data, _parse_header(data))
+
+    @classmethod
+    def open(cls, path: str) -> "EmbeddingVaultFile":
+        """Memory-map a vault file.
+
+        Raises:
+            ValueError: If the file is empty, truncated or not a vault file.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Empty embedding vault file: {path}")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            return cls(mapped, _parse_header(mapped), handle=mapped)
+        except Exception:
+            mapped.close()
+            raise
+
+    # Access
+
+    def __len__(self) -> int:
+        """Return the number of vectors."""
+        return len(self.vectors)
+
+    def close(self) -> None:
+        """Release the memory map, if any."""
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except BufferError:
+                # Vector views still reference the map; the GC releases it later.
+                pass
+
+
+def compress(data: bytes) -> bytes:
+    """Compress an encoded vault file for shipping to S3."""
+    header = _parse_header(data)
+    span = _vector_span(header)
+    planes = np.frombuffer(data[span], dtype="u1").reshape(-1, _DTYPE.itemsize)
+
+    shuffled = data[: span.start] + planes.T.tobytes() + data[span.stop :]
+    return COMPRESSED_MAGIC + zlib.compress(shuffled, 6)
+
+
+def decompress(blob: bytes) -> bytes:
+    """Invert :func:`compress`.
+
+    Raises:
+        ValueError: If the blob is not a compressed vault file.
+    """
+    if blob[: len(COMPRESSED_MAGIC)] != COMPRESSED_MAGIC:
+        raise ValueError("Not a compressed embedding vault file")
+    try:
+        shuffled = zlib.decompress(blob[len(COMPRESSED_MAGIC) :])
+    except zlib.error as exc:
+        raise ValueError(f"Corrupt embedding vault file: {exc}") from exc
+
+    header = _parse_header(shuffled)
+    span = _vector_span(header)
+    planes = np.frombuffer(shuffled[span], dtype="u1").reshape(_DTYPE.itemsize, -1)
+    return shuffled[: span.start] + planes.T.tobytes() + shuffled[span.stop :]
@@ -0,0 +1,355 @@
+"""FAISS index type selection.
+
+An index kind combines a search structure with a vector storage format.
+Structures are picked from the tenant's vector count and plan:
+
+- ``flat``: exhaustive search, no graph overhead. Used for small tenants,
+  where a linear scan is as fast as a graph walk.
+- ``hnsw``: HNSW graph, for the middle range.
+- ``hnsw_sq8``: HNSW graph over 8-bit vectors, forced for the largest
+  SCALE tenants.
+
+Storage is ``fp32`` (full vectors), ``fp16`` (half the bytes, near-lossless)
+or ``sq8`` (a quarter of the bytes, one trained scalar quantizer per
+segment). It is opt-in per plan through ``FAISS_VECTOR_STORAGE`` and
+``FAISS_VECTOR_STORAGE_BY_PLAN``. Kind names are the structure, suffixed
+with the storage unless it is ``fp32``: ``flat``, ``flat_fp16``,
+``hnsw_sq8``...
+
+Plans cap the structure a tenant may use, so only SCALE tenants are
+quantized automatically.
+
+Every kind can be built for one of two metrics, chosen by
+``FAISS_METRIC``: ``l2`` (squared Euclidean distance, scored as
+``1 / (1 + d)``) or ``cosine`` (inner product over L2-normalized vectors,
+scored as the cosine similarity itself).
+
+HNSW searches take an ``efSearch`` per call, resolved from the request,
+the tenant's tuning recorded in its manifest, or its plan. Segments of up
+to ``FAISS_EXACT_SEARCH_MAX_VECTORS`` vectors skip their index entirely:
+:func:`exact_search` scores every row with one matrix product, which is
+faster than a graph walk at that size and exact.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.core.mapped_index import MappedFlatIndex
+
+INDEX_FLAT = "flat"
+INDEX_HNSW = "hnsw"
+INDEX_HNSW_SQ = "hnsw_sq8"
+
+# Ordered from cheapest to build to most memory-efficient at scale.
+INDEX_KINDS = (INDEX_FLAT, INDEX_HNSW, INDEX_HNSW_SQ)
+
+# Largest index kind each plan may use. Unknown plans never quantize.
+PLAN_MAX_KIND = {
+    "starter": INDEX_FLAT,
+    "growth": INDEX_HNSW,
+    "scale": INDEX_HNSW_SQ,
+}
+
+STORAGE_FP32 = "fp32"
+STORAGE_FP16 = "fp16"
+STORAGE_SQ8 = "sq8"
+
+# Ordered from largest to smallest bytes per vector.
+STORAGE_TYPES = (STORAGE_FP32, STORAGE_FP16, STORAGE_SQ8)
+
+METRIC_L2 = "l2"
+METRIC_COSINE = "cosine"
+
+_FAISS_METRICS = {
+    METRIC_L2: faiss.METRIC_L2,
+    METRIC_COSINE: faiss.METRIC_INNER_PRODUCT,
+}
+
+_QUANTIZERS = {
+    STORAGE_FP16: faiss.ScalarQuantizer.QT_fp16,
+    STORAGE_SQ8: faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def choose_storage(plan: Optional[str] = None) -> str:
+    """Return the configured vector storage format for a plan.
+
+    Raises:
+        ValueError: If the configured format is unknown.
+    """
+    storage = settings.FAISS_VECTOR_STORAGE_BY_PLAN.get(
+        plan, settings.FAISS_VECTOR_STORAGE
+    )
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown vector storage: {storage}")
+    return storage
+
+
+def split_kind(kind: str) -> Tuple[str, str]:
+    """Split an index kind into its structure and storage format.
+
+    Raises:
+        ValueError: If the kind is unknown.
+    """
+    structure, _, storage = kind.partition("_")
+    storage = storage or STORAGE_FP32
+    if structure not in (INDEX_FLAT, INDEX_HNSW) or storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown index kind: {kind}")
+    return structure, storage
+
+
+def join_kind(structure: str, storage: str) -> str:
+    """Return the kind name for a structure and storage format."""
+    return structure if storage == STORAGE_FP32 else f"{structure}_{storage}"
+
+
+def choose_index_kind(ntotal: int, plan: Optional[str] = None) -> str:
+    """Return the index kind for a tenant with ``ntotal`` vectors.
+
+    Args:
+        ntotal: Number of vectors the index will hold.
+        plan: The tenant's plan type, if known. Selects both the largest
+            structure allowed and the configured storage format.
+    """
+    if ntotal <= settings.FAISS_FLAT_MAX_VECTORS:
+        kind = INDEX_FLAT
+    elif ntotal <= settings.FAISS_HNSW_MAX_VECTORS:
+        kind = INDEX_HNSW
+    else:
+        kind = INDEX_HNSW_SQ
+
+    cap = PLAN_MAX_KIND.get(plan, INDEX_HNSW)
+    structure, storage = split_kind(min(kind, cap, key=INDEX_KINDS.index))
+
+    # Opt-in storage only ever shrinks vectors further.
+    storage = max(storage, choose_storage(plan), key=STORAGE_TYPES.index)
+    return join_kind(structure, storage)
+
+
+def choose_metric() -> str:
+    """Return the configured metric for newly built indexes.
+
+    Raises:
+        ValueError: If the configured metric is unknown.
+    """
+    if settings.FAISS_METRIC not in _FAISS_METRICS:
+        raise ValueError(f"Unknown FAISS metric: {settings.FAISS_METRIC}")
+    return settings.FAISS_METRIC
+
+
+def prepare_vectors(vectors: np.ndarray, metric: str) -> np.ndarray:
+    """Return vectors as contiguous float32, L2-normalized for ``cosine``.
+
+    The input is never modified.
+    """
+    vectors = np.array(vectors, dtype="float32", order="C", ndmin=2)
+    if metric == METRIC_COSINE:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def to_scores(distances: np.ndarray, metric: str) -> np.ndarray:
+    """Convert raw FAISS search distances to higher-is-better scores."""
+    if metric == METRIC_COSINE:
+        return distances
+    return 1 / (1 + distances)
+
+
+def build_index(
+    kind: str,
+    dimension: int,
+    training: Optional[np.ndarray] = None,
+    metric: str = METRIC_L2,
+) -> faiss.Index:
+    """Create an empty index of the given kind.
+
+    Args:
+        kind: Index kind, such as ``hnsw`` or ``flat_sq8``.
+        dimension: Vector dimension.
+        training: Sample vectors for kinds that need training, already
+            prepared for the metric.
+        metric: ``l2`` or ``cosine``.
+
+    Raises:
+        ValueError: If the kind or metric is unknown, or the kind needs
+            training and no vectors were given.
+    """
+    structure, storage = split_kind(kind)
+    if metric not in _FAISS_METRICS:
+        raise ValueError(f"Unknown FAISS metric: {metric}")
+    faiss_metric = _FAISS_METRICS[metric]
+
+    if storage == STORAGE_FP32:
+        if structure == INDEX_FLAT:
+            return faiss.IndexFlat(dimension, faiss_metric)
+        return faiss.IndexHNSWFlat(dimension, settings.FAISS_HNSW_M, faiss_metric)
+
+    qtype = _QUANTIZERS[storage]
+    if structure == INDEX_FLAT:
+        index = faiss.IndexScalarQuantizer(dimension, qtype, faiss_metric)
+    else:
+        index = faiss.IndexHNSWSQ(dimension, qtype, settings.FAISS_HNSW_M, faiss_metric)
+
+    if not index.is_trained:
+        if training is None or len(training) == 0:
+            raise ValueError(f"{kind} index needs training vectors")
+        index.train(np.ascontiguousarray(training, dtype="float32"))
+    return index
+
+
+def metric_of(index: faiss.Index) -> str:
+    """Return the metric an existing index was built for."""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return METRIC_COSINE
+    return METRIC_L2
+
+
+def index_kind_of(index: faiss.Index) -> str:
+    """Return the kind of an existing index, looking through id maps."""
+    if isinstance(index, MappedFlatIndex):
+        return INDEX_FLAT
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        index = faiss.downcast_index(index.index)
+
+    structure = INDEX_FLAT
+    if isinstance(index, faiss.IndexHNSW):
+        structure = INDEX_HNSW
+        index = faiss.downcast_index(index.storage)
+
+    if isinstance(index, faiss.IndexFlat):
+        return structure
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        for storage, qtype in _QUANTIZERS.items():
+            if index.sq.qtype == qtype:
+                return join_kind(structure, storage)
+    return type(index).__name__
+
+
+def search_params(
+    index: faiss.Index,
+    ef_search: Optional[int],
+    selector: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Return per-call search parameters for an unwrapped index.
+
+    HNSW indexes take ``ef_search``. Any index can be restricted to the
+    rows ``selector`` accepts; the caller must keep the selector alive for
+    the search. Returns None when there is nothing to set.
+    """
+    if ef_search is not None and isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(ef_search)
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def exact_search(
+    queries: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    metric_type: int,
+    norms: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the ``k`` nearest rows of ``vectors`` for each query.
+
+    Scores all rows with one matrix product and selects the top ``k`` with
+    ``argpartition``, so only those are sorted. Results match
+    ``faiss.knn``: squared L2 distances ascending, or inner products
+    descending.
+
+    Args:
+        queries: Contiguous float32 queries, prepared for the metric.
+        vectors: Contiguous float32 matrix of stored vectors, one per row.
+        k: Number of neighbours; at most the number of rows is returned.
+        metric_type: ``faiss.METRIC_L2`` or ``faiss.METRIC_INNER_PRODUCT``.
+        norms: Squared L2 norm of each row, computed when not given.
+
+    Returns:
+        Distances and row numbers, each of shape ``(len(queries), k)``.
+    """
+    k = min(k, len(vectors))
+    if k <= 0:
+        empty = np.empty((len(queries), 0))
+        return empty.astype("float32"), empty.astype("int64")
+
+    # Rank by ascending keys. The query's own norm does not change the
+    # order of its L2 distances, so it is only added to the selected rows.
+    keys = queries @ vectors.T
+    l2 = metric_type == faiss.METRIC_L2
+    if l2:
+        if norms is None:
+            norms = np.einsum("ij,ij->i", vectors, vectors)
+        keys *= -2
+        keys += norms
+    else:
+        np.negative(keys, out=keys)
+
+    # Fancy indexing, as take_along_axis costs more than the search itself
+    # at these sizes.
+    line = np.arange(len(queries))[:, None]
+    if k < len(vectors):
+        rows = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    else:
+        rows = np.broadcast_to(np.arange(k), keys.shape)
+    selected = keys[line, rows]
+    order = selected.argsort(axis=1, kind="stable")
+    rows = rows[line, order].astype("int64")
+    distances = selected[line, order]
+
+    if l2:
+        distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+        np.maximum(distances, 0, out=distances)
+    else:
+        np.negative(distances, out=distances)
+    return distances, rows
+
+
+def recommend_ef_search(profile: Sequence[Dict], target_recall: float) -> int:
+    """Return the smallest measured efSearch reaching ``target_recall``.
+
+    Falls back to the efSearch with the best recall if none reaches it.
+
+    Args:
+        profile: Measurements with ``ef_search`` and ``recall`` keys.
+        target_recall: Recall@k to reach.
+    """
+    points = sorted(profile, key=lambda point: point["ef_search"])
+    for point in points:
+        if point["recall"] >= target_recall:
+            return point["ef_search"]
+    return max(points, key=lambda point: point["recall"])["ef_search"]
+
+
+def choose_ef_search(
+    plan: Optional[str] = None,
+    tuning: Optional[Dict] = None,
+    ef_search: Optional[int] = None,
+    recall_target: Optional[float] = None,
+) -> int:
+    """Resolve the HNSW efSearch for a search.
+
+    An explicit ``ef_search`` wins. Otherwise a tenant's tuning (see
+    ``scripts/tune_ef_search.py``) answers ``recall_target`` from its
+    measured profile, or gives its recommended value. Untuned tenants use
+    ``FAISS_HNSW_EF_SEARCH_BY_PLAN`` and then ``FAISS_HNSW_EF_SEARCH``.
+    """
+    if ef_search is not None:
+        return ef_search
+    if tuning:
+        if recall_target is not None:
+            return recommend_ef_search(tuning["profile"], recall_target)
+        return tuning["recommended"]
+    return settings.FAISS_HNSW_EF_SEARCH_BY_PLAN.get(
+        plan, settings.FAISS_HNSW_EF_SEARCH
+    )
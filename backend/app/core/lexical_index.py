@@ -0,0 +1,283 @@
+"""Memory-mapped BM25 inverted index over one segment's chunk texts.
+
+Dense embeddings match SKUs, error codes and product names poorly. Each
+index segment therefore also gets a lexical index file, written next to
+its chunk store, so retrieval can score chunks by BM25 and fuse both
+rankings.
+
+Text is lowercased and split into word tokens. Tokens joined by ``-``,
+``_``, ``.`` or ``/`` (``SKU-4411``, ``ERR_TIMEOUT``, ``v2.1``) are kept
+whole and also indexed by their parts, so either form of an identifier
+matches. Single characters and a few English stopwords are skipped.
+
+File layout::
+
+    MAGIC | uint64 header length | JSON header | 8-byte aligned columns
+
+Terms are stored sorted as UTF-8 strings in one blob, so a lookup is a
+binary search over the mapped file. Each term owns a run of postings:
+the rows containing it and the term's frequency in each row.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+import struct
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"CLTERMS1"
+_HEADER_LEN = struct.Struct("<Q")
+_ALIGN = 8
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+(?:[-_./]\w+)*")
+_JOINERS = re.compile(r"[-_./]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i if in is it my of on or "
+    "our so that the this to was we what when where which who why will with "
+    "you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into the terms the lexical index stores."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token not in _STOPWORDS and len(token) > 1:
+            terms.append(token)
+        parts = _JOINERS.split(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if len(p) > 1 and p not in _STOPWORDS)
+    return terms
+
+
+def bm25_idf(n_rows: int, document_frequency: np.ndarray) -> np.ndarray:
+    """Return the BM25 inverse document frequency of terms."""
+    return np.log1p((n_rows - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+def _aligned(offset: int) -> int:
+    """Round an offset up to the column alignment."""
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+class LexicalIndex:
+    """Read-only inverted index with BM25 scoring for one segment."""
+
+    def __init__(self, buffer, header: Dict, handle=None) -> None:
+        """Wrap a buffer laid out by :meth:`encode`.
+
+        Use :meth:`open` or :meth:`from_texts` instead of calling this.
+        """
+        self._handle = handle
+        self._rows = header["rows"]
+        self._terms = header["terms"]
+        self.tokens: int = header["tokens"]
+        self._nbytes = len(buffer)
+
+        columns = {}
+        for name, (dtype, offset, count) in header["columns"].items():
+            columns[name] = np.frombuffer(
+                buffer,
+                dtype=np.dtype(dtype),
+                count=count,
+                offset=header["data_start"] + offset,
+            )
+
+        self._vocab_offsets = columns["vocab_offsets"]
+        self._vocab_blob = columns["vocab_blob"]
+        self._posting_offsets = columns["posting_offsets"]
+        self._posting_rows = columns["posting_rows"]
+        self._posting_counts = columns["posting_counts"]
+        self.lengths = columns["lengths"]
+
+    # Construction
+
+    @staticmethod
+    def encode(texts: Iterable[Optional[str]]) -> bytes:
+        """Serialize the inverted index of one text per row."""
+        postings: Dict[bytes, List[Tuple[int, int]]] = {}
+        lengths: List[int] = []
+
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text) if isinstance(text, str) else ())
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term.encode("utf-8"), []).append((row, count))
+
+        vocab = sorted(postings)
+        vocab_offsets = np.zeros(len(vocab) + 1, dtype="<i8")
+        posting_offsets = np.zeros(len(vocab) + 1, dtype="<i8")
+        if vocab:
+            vocab_offsets[1:] = np.cumsum([len(term) for term in vocab])
+            posting_offsets[1:] = np.cumsum([len(postings[term]) for term in vocab])
+        pairs = [pair for term in vocab for pair in postings[term]]
+
+        arrays = {
+            "vocab_offsets": vocab_offsets,
+            "vocab_blob": np.frombuffer(b"".join(vocab), dtype="<u1"),
+            "posting_offsets": posting_offsets,
+            "posting_rows": np.array([row for row, _ in pairs], dtype="<i4"),
+            "posting_counts": np.array(
+                [min(count, 0xFFFF) for _, count in pairs], dtype="<u2"
+            ),
+            "lengths": np.array(lengths, dtype="<i4"),
+        }
+
+        columns = {}
+        cursor = 0
+        for name, array in arrays.items():
+            cursor = _aligned(cursor)
+            columns[name] = (array.dtype.str, cursor, int(array.size))
+            cursor += array.nbytes
+
+        header_bytes = json.dumps(
+            {
+                "rows": len(lengths),
+                "terms": len(vocab),
+                "tokens": int(sum(lengths)),
+                "columns": columns,
+            }
+        ).encode("utf-8")
+
+        start = len(MAGIC) + _HEADER_LEN.size
+        data_start = _aligned(start + len(header_bytes))
+
+        out = bytearray(data_start + cursor)
+        out[: len(MAGIC)] = MAGIC
+        _HEADER_LEN.pack_into(out, len(MAGIC), len(header_bytes))
+        out[start : start + len(header_bytes)] = header_bytes
+        for name, array in arrays.items():
+            offset = data_start + columns[name][1]
+            out[offset : offset + array.nbytes] = array.tobytes()
+
+        return bytes(out)
+
+    @classmethod
+    def write(cls, path: str, texts: Iterable[Optional[str]]) -> None:
+        """Write the inverted index of ``texts`` to ``path``."""
+        with open(path, "wb") as f:
+            f.write(cls.encode(texts))
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[Optional[str]]) -> "LexicalIndex":
+        """Build an in-memory inverted index of one text per row."""
+        data = cls.encode(texts)
+        return cls(data, cls._parse_header(data))
+
+    @classmethod
+    def open(cls, path: str) -> "LexicalIndex":
+        """Memory-map a lexical index file.
+
+        Raises:
+            ValueError: If the file is not a lexical index.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Empty lexical index file: {path}")
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return cls(mapped, cls._parse_header(mapped), handle=mapped)
+
+    @staticmethod
+    def _parse_header(buffer) -> Dict:
+        """Parse and validate the JSON header of a lexical index buffer."""
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a lexical index file")
+        (length,) = _HEADER_LEN.unpack_from(buffer, len(MAGIC))
+        start = len(MAGIC) + _HEADER_LEN.size
+        header = json.loads(bytes(buffer[start : start + length]))
+        header["data_start"] = _aligned(start + length)
+        return header
+
+    # Access
+
+    def __len__(self) -> int:
+        """Return the number of rows."""
+        return self._rows
+
+    @property
+    def nbytes(self) -> int:
+        """Return the size of the underlying buffer in bytes."""
+        return self._nbytes
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the rows containing a term and its frequency in each."""
+        i = self._find(term.encode("utf-8"))
+        if i < 0:
+            return np.empty(0, dtype="<i4"), np.empty(0, dtype="<u2")
+        start, end = int(self._posting_offsets[i]), int(self._posting_offsets[i + 1])
+        return self._posting_rows[start:end], self._posting_counts[start:end]
+
+    def document_frequency(self, term: str) -> int:
+        """Return the number of rows containing a term."""
+        return len(self.postings(term)[0])
+
+    def score(
+        self, terms: Sequence[str], idf: np.ndarray, average_length: float
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Score every row containing at least one of ``terms`` with BM25.
+
+        Args:
+            terms: Distinct query terms.
+            idf: Inverse document frequency of each term, computed over
+                every segment searched.
+            average_length: Mean row length in tokens over those segments.
+
+        Returns:
+            The matching rows, their BM25 scores, and the summed ``idf`` of
+            the terms each row contains.
+        """
+        rows, gains, weights = [], [], []
+        for term, term_idf in zip(terms, idf):
+            term_rows, counts = self.postings(term)
+            if not term_rows.size:
+                continue
+            counts = counts.astype("float32")
+            norm = BM25_K1 * (
+                1 - BM25_B + BM25_B * self.lengths[term_rows] / average_length
+            )
+            rows.append(term_rows)
+            gains.append(term_idf * counts * (BM25_K1 + 1) / (counts + norm))
+            weights.append(np.full(term_rows.size, term_idf))
+
+        if not rows:
+            empty = np.empty(0, dtype="float64")
+            return np.empty(0, dtype="int64"), empty, empty
+        matched, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(gains))
+        coverage = np.bincount(inverse, weights=np.concatenate(weights))
+        return matched.astype("int64"), scores, coverage
+
+    def close(self) -> None:
+        """Release the memory map, if any."""
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except BufferError:
+                # Postings views still reference the map; the GC releases it.
+                pass
+
+    def _term(self, i: int) -> bytes:
+        """Return the UTF-8 bytes of term ``i``."""
+        start, end = int(self._vocab_offsets[i]), int(self._vocab_offsets[i + 1])
+        return self._vocab_blob[start:end].tobytes()
+
+    def _find(self, term: bytes) -> int:
+        """Return the position of a term in the sorted vocabulary, or -1."""
+        low, high = 0, self._terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self._terms and self._term(low) == term else -1
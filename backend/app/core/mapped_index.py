@@ -0,0 +1,183 @@
+"""Memory-mapped, read-only serving of flat FAISS index files.
+
+``faiss.read_index`` copies vectors into private memory, even with
+``IO_FLAG_MMAP`` (which only maps IVF inverted lists in the FAISS version
+we ship). Every uvicorn worker holding a tenant therefore keeps its own
+copy of the same vectors.
+
+Flat float32 indexes, with or without an ``IndexIDMap``, store their
+vectors and ids as plain arrays in the index file. :class:`MappedFlatIndex`
+maps the file read-only and searches those arrays in place with
+``faiss.knn``, which runs the same kernels as ``IndexFlat``. The pages
+belong to the page cache, so all workers on a node share one copy, and
+nothing is read until a search touches it.
+
+File layout, as written by ``faiss.write_index``::
+
+    [IxMp | header]                       IndexIDMap, optional
+    IxF2 or IxFI | header                 IndexFlatL2 or IndexFlatIP
+    uint64 float count | float32 vectors
+    [uint64 id count | int64 ids]         with the IndexIDMap
+
+Files of any other index type are left to ``faiss.read_index``.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+_ID_MAP_FOURCC = b"IxMp"
+_FLAT_FOURCCS = {
+    b"IxF2": faiss.METRIC_L2,
+    b"IxFI": faiss.METRIC_INNER_PRODUCT,
+}
+
+# d, ntotal, two unused fields, is_trained, metric_type.
+_HEADER = struct.Struct("<iqqq?i")
+_COUNT = struct.Struct("<Q")
+_FOURCC_LEN = 4
+
+
+def _parse_layout(buffer) -> Optional[Tuple[int, int, int, int, Optional[int]]]:
+    """Locate the vectors and ids of a flat index file.
+
+    Returns:
+        ``(dimension, ntotal, metric_type, vectors_offset, ids_offset)``,
+        with ``ids_offset`` None for a bare flat index, or None if the
+        buffer is not a flat float32 index file.
+    """
+    try:
+        pos = 0
+        wrapped = bytes(buffer[:_FOURCC_LEN]) == _ID_MAP_FOURCC
+        if wrapped:
+            pos = _FOURCC_LEN + _HEADER.size
+
+        metric_type = _FLAT_FOURCCS.get(bytes(buffer[pos : pos + _FOURCC_LEN]))
+        if metric_type is None:
+            return None
+        d, ntotal, _, _, _, stored_metric = _HEADER.unpack_from(
+            buffer, pos + _FOURCC_LEN
+        )
+        pos += _FOURCC_LEN + _HEADER.size
+
+        (count,) = _COUNT.unpack_from(buffer, pos)
+        if stored_metric != metric_type or count != d * ntotal:
+            return None
+        vectors_offset = pos + _COUNT.size
+        pos = vectors_offset + count * 4
+
+        ids_offset = None
+        if wrapped:
+            (count,) = _COUNT.unpack_from(buffer, pos)
+            if count != ntotal:
+                return None
+            ids_offset = pos + _COUNT.size
+            pos = ids_offset + count * 8
+    except struct.error:
+        return None
+
+    if pos != len(buffer):
+        return None
+    return d, ntotal, metric_type, vectors_offset, ids_offset
+
+
+class MappedFlatIndex:
+    """Exact, read-only index over a memory-mapped flat index file.
+
+    Exposes the parts of the ``faiss.Index`` interface the vector store
+    uses. Searches return row numbers; ``id_map`` holds the stable id of
+    each row, or is None for a file without an ``IndexIDMap``.
+    """
+
+    is_trained = True
+
+    def __init__(self, buffer, handle=None) -> None:
+        """Wrap a buffer holding a flat index file.
+
+        Use :meth:`open` instead of calling this.
+
+        Raises:
+            ValueError: If the buffer is not a flat float32 index file.
+        """
+        layout = _parse_layout(buffer)
+        if layout is None:
+            raise ValueError("Not a flat FAISS index file")
+        self.d, self.ntotal, self.metric_type, vectors_offset, ids_offset = layout
+        self._handle = handle
+
+        self.vectors = np.frombuffer(
+            buffer, dtype="<f4", count=self.d * self.ntotal, offset=vectors_offset
+        ).reshape(self.ntotal, self.d)
+        self.id_map: Optional[np.ndarray] = None
+        if ids_offset is not None:
+            self.id_map = np.frombuffer(
+                buffer, dtype="<i8", count=self.ntotal, offset=ids_offset
+            )
+
+    @classmethod
+    def open(cls, path: str) -> Optional["MappedFlatIndex"]:
+        """Memory-map an index file.
+
+        Returns:
+            The mapped index, or None if the file holds another index type
+            (or is empty) and must be read with ``faiss.read_index``.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if _parse_layout(mapped) is None:
+            mapped.close()
+            return None
+        try:
+            return cls(mapped, handle=mapped)
+        except Exception:
+            mapped.close()
+            raise
+
+    # Search
+
+    def search(
+        self, x: np.ndarray, k: int, params: Optional[faiss.SearchParameters] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the distances and row numbers of the ``k`` nearest rows.
+
+        Missing neighbours get row ``-1``, as with FAISS. ``params`` is
+        accepted for interface compatibility; exact search takes none.
+        """
+        x = np.ascontiguousarray(x, dtype="float32")
+        if self.ntotal == 0:
+            fill = np.inf if self.metric_type == faiss.METRIC_L2 else -np.inf
+            return (
+                np.full((len(x), k), fill, dtype="float32"),
+                np.full((len(x), k), -1, dtype="int64"),
+            )
+        return faiss.knn(x, self.vectors, k, metric=self.metric_type)
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        """Return a private copy of rows ``i0`` to ``i0 + n``."""
+        return np.array(self.vectors[i0 : i0 + n])
+
+    # Access
+
+    @property
+    def nbytes(self) -> int:
+        """Return the size of the mapped vectors and ids in bytes."""
+        ids = self.id_map.nbytes if self.id_map is not None else 0
+        return self.vectors.nbytes + ids
+
+    def close(self) -> None:
+        """Release the memory map."""
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except BufferError:
+                # Array views still reference the map; the GC releases it later.
+                pass
@@ -1,7 +1,78 @@
 """FAISS vector store utilities.
 
 Provides creation, persistence, caching, and querying of FAISS indexes
-with local disk storage, S3 backup, and an in-memory LRU cache.
+with local disk storage, S3 backup, and a two-tier cache: an in-memory LRU
+bounded by a per-worker byte budget, backed by an LRU of index files on
+local disk with its own byte budget. Dropping an index from memory keeps
+its files, so reloading it reads local disk instead of S3.
+
+Each client index is a list of immutable segments tracked by a JSON
+manifest. Ingestion writes one new segment per document, so write cost
+scales with the document rather than the tenant. Searches fan out across
+segments and merge the top-k, and a background compaction folds segments
+back together once a client accumulates too many of them.
+
+Every file is written to a temporary path, fsynced and renamed into place,
+and the manifest records each segment file's size and CRC32 plus its
+vector count. Loads validate local files against the manifest and
+re-download only the ones that fail, so a crash mid-write can never pair
+an index with metadata of a different length.
+
+Vectors carry stable int64 ids (through ``faiss.IndexIDMap``) that survive
+compaction. Deleting a document only records its ids as tombstone ranges
+in the manifest; searches mask tombstoned hits using a per-segment bitmap,
+over-fetching to keep top-k full, and compaction drops them for good once
+a client's tombstone ratio passes ``FAISS_TOMBSTONE_COMPACT_RATIO``.
+
+The structure of new segments follows the tenant's size and plan (see
+``index_factory``): exact flat search for small tenants, HNSW in the middle
+range and scalar-quantized HNSW for the largest SCALE tenants. Plans can
+also opt in to fp16 or 8-bit vector storage. The manifest records the
+chosen kind; when a tenant crosses a threshold, a background compaction
+rebuilds its segments as the new kind, and ``compact_index`` with a plan
+migrates existing tenants after the storage settings change. Indexes are
+built for the ``FAISS_METRIC`` metric, L2 or cosine; a tenant built for
+the other metric migrates the same way.
+
+With ``FAISS_PACKED_SHARDS`` set, small tenants share packed shard
+indexes instead of each owning one. A tenant hashes to one shard, which is
+stored, leased, uploaded and cached like a client's index under its own
+name (``packed_0007``). Shard rows carry their tenant's id, and a packed
+tenant's searches scan only its own rows, exactly. The shard manifest
+counts each tenant's live vectors; a tenant outgrowing
+``FAISS_PACKED_MAX_VECTORS`` is moved into an index of its own and listed
+as dedicated, so its later writes go there.
+
+The raw float32 embeddings of every document are also kept in an
+embedding vault (see ``embedding_vault``), locally and compressed in S3,
+so indexes can be rebuilt in any structure without re-embedding.
+
+Chunk metadata lives in memory-mapped columnar files (see ``chunk_store``),
+so loading a segment does not unpickle every chunk, and a search only
+materializes the rows it returns. Flat float32 segments are memory-mapped
+read-only too (see ``mapped_index``), so the uvicorn workers of a node
+share one copy of their vectors through the page cache.
+
+Writes are persisted locally first and uploaded to S3 by a write-behind
+uploader thread. Pending uploads are recorded on disk, coalesced per
+client so only the latest manifest is uploaded, retried with backoff off
+the request path, and flushed on shutdown.
+
+Every manifest carries a generation number. Once a manifest is in S3 its
+generation is committed to Redis and announced over pub/sub, so workers
+drop cached copies that are older and re-fetch the manifest on their next
+load, without polling S3.
+
+Mutations of a client's index go through a per-client writer: concurrent
+additions queue behind the one in progress and are folded into a single
+segment, and every mutation runs under a Redis write lease so two workers
+never build manifests from the same base. A worker keeps the lease until
+its uploads for that client are in S3.
+
+Async callers use ``aload_index``, ``asearch_index`` and ``aadd_to_index``,
+which run the blocking work on bounded thread pools: one for disk/S3 I/O
+and one for searches, so a slow cold load cannot starve searches against
+indexes that are already in memory.
 
 Design goals:
 - Thread-safe
@@ -12,20 +83,81 @@ Design goals:
 
 from __future__ import annotations
 
+import asyncio
+import json
 import os
 import pickle
+import queue
+import shutil
 import tempfile
+import threading
 import time
-from collections import OrderedDict
+import uuid
+import weakref
+import zlib
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 from threading import Lock
-from typing import Dict, List, Tuple
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 
 import faiss
 import numpy as np
-
+from botocore.exceptions import ClientError
+
+from backend.app.core.chunk_store import ChunkStore
+from backend.app.core.config import settings
+from backend.app.core.embedding_vault import EmbeddingVaultFile, compress, decompress
+from backend.app.core.index_factory import (
+    INDEX_FLAT,
+    INDEX_HNSW,
+    METRIC_L2,
+    build_index,
+    choose_ef_search,
+    choose_index_kind,
+    choose_metric,
+    exact_search,
+    index_kind_of,
+    metric_of,
+    prepare_vectors,
+    search_params,
+    to_scores,
+)
+from backend.app.core.lexical_index import LexicalIndex, bm25_idf, tokenize
+from backend.app.core.mapped_index import MappedFlatIndex
 from backend.app.utils.logger import logger
-from backend.app.utils.s3 import download_file, upload_file
+from backend.app.utils.redis_client import redis_client
+from backend.app.utils.s3 import delete_file, download_file, upload_file
+
+MANIFEST_VERSION = 2
+PACKED_SHARD_PREFIX = "packed_"
+METADATA_FORMAT = "columnar"
+
+GENERATIONS_KEY = "faiss:generations"
+INVALIDATION_CHANNEL = "faiss:invalidate"
+WRITE_LEASE_PREFIX = "faiss:lease:"
+
+T = TypeVar("T")
+
+# Ceiling for the efSearch of filtered HNSW searches.
+_MAX_FILTERED_EF_SEARCH = 1024
+
+# Age after which a temp file not naming its writer's pid counts as orphaned.
+_PARTIAL_WRITE_MAX_AGE = 3600
 
 # Path helpers
 
@@ -37,21 +169,67 @@ def _get_base_tmp_dir() -> Path:
     return base
 
 
+def _get_client_dir(client_id: str) -> Path:
+    """Return the local directory holding a client's segments."""
+    client_dir = _get_base_tmp_dir() / client_id
+    client_dir.mkdir(parents=True, exist_ok=True)
+    return client_dir
+
+
+def _get_manifest_path(client_id: str) -> str:
+    """Return the local file path for a client's segment manifest."""
+    return str(_get_client_dir(client_id) / "manifest.json")
+
+
+def _get_segment_index_path(client_id: str, segment: str) -> str:
+    """Return the local file path for a segment's FAISS index."""
+    return str(_get_client_dir(client_id) / f"{segment}.index")
+
+
+def _get_segment_metadata_path(client_id: str, segment: str) -> str:
+    """Return the local file path for a segment's chunk store."""
+    return str(_get_client_dir(client_id) / f"{segment}.chunks")
+
+
+def _get_segment_terms_path(client_id: str, segment: str) -> str:
+    """Return the local file path for a segment's lexical index."""
+    return str(_get_client_dir(client_id) / f"{segment}.terms")
+
+
+def _get_vault_path(client_id: str, document_id: str) -> str:
+    """Return the local file path for a document's raw embeddings."""
+    vault_dir = _get_client_dir(client_id) / "vault"
+    vault_dir.mkdir(exist_ok=True)
+    return str(vault_dir / f"{document_id}.vec")
+
+
+def _get_pending_upload_path(client_id: str) -> str:
+    """Return the local file recording a client's pending S3 uploads."""
+    return str(_get_client_dir(client_id) / "pending_upload.json")
+
+
 def _get_index_path(client_id: str) -> str:
-    """Return the local file path for a FAISS index."""
+    """Return the legacy single-file path for a FAISS index."""
     return str(_get_base_tmp_dir() / f"faiss_{client_id}.index")
 
 
 def _get_metadata_path(client_id: str) -> str:
-    """Return the local file path for FAISS metadata."""
+    """Return the legacy single-file path for FAISS metadata."""
     return str(_get_base_tmp_dir() / f"faiss_{client_id}_meta.pkl")
 
 
 def _delete_local_files(client_id: str) -> None:
-    """Delete local FAISS index and metadata files for a client.
+    """Delete local FAISS segments and metadata files for a client.
 
-    Used during cache eviction to prevent disk leaks.
+    Used during disk cache eviction to prevent disk leaks.
     """
+    client_dir = _get_base_tmp_dir() / client_id
+    try:
+        if client_dir.exists():
+            shutil.rmtree(client_dir)
+    except Exception as exc:  # pragma: no cover - best effort cleanup
+        logger.warning("Failed to delete %s: %s", client_dir, exc)
+
     for path in (_get_index_path(client_id), _get_metadata_path(client_id)):
         try:
             if os.path.exists(path):
@@ -60,18 +238,173 @@ def _delete_local_files(client_id: str) -> None:
             logger.warning("Failed to delete %s: %s", path, exc)
 
 
+# Atomic writes
+
+
+class IndexIntegrityError(ValueError):
+    """Raised when index files do not match their manifest."""
+
+
+def _fsync_dir(path: Path) -> None:
+    """Flush a directory entry so a rename survives a crash."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:  # pragma: no cover - e.g. directories on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path: str, write: Callable[[str], None]) -> None:
+    """Write a file through a temp path, fsync it and rename it into place.
+
+    The temp file name carries the writer's pid, so a restarting worker
+    can tell its dead predecessor's partial writes from a sibling's.
+
+    Args:
+        path: Final location of the file.
+        write: Callback that writes the full contents to the path it is
+            given.
+    """
+    directory = Path(path).parent
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory,
+        prefix=f"{Path(path).name}.{os.getpid()}.",
+        suffix=".tmp",
+    )
+    os.close(fd)
+    try:
+        write(tmp_path)
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    _fsync_dir(directory)
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    """Atomically replace a file with ``data``."""
+
+    def write(tmp_path: str) -> None:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+    _atomic_write(path, write)
+
+
+def _file_checksum(path: str) -> str:
+    """Return the CRC32 of a file as 8 hex digits."""
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(block, crc)
+    return f"{crc:08x}"
+
+
+def _file_info(path: str) -> Dict[str, Any]:
+    """Return the size and checksum recorded for a file in the manifest."""
+    return {"size": os.path.getsize(path), "crc32": _file_checksum(path)}
+
+
+def _matches(path: str, expected: Optional[Dict], verify_checksum: bool) -> bool:
+    """Return True if a local file exists and agrees with its manifest entry.
+
+    Sizes are always compared; checksums only when ``verify_checksum``.
+    """
+    if not os.path.exists(path):
+        return False
+    if expected is None:
+        return True
+    if os.path.getsize(path) != expected["size"]:
+        return False
+    return not verify_checksum or _file_checksum(path) == expected["crc32"]
+
+
+def _pid_alive(pid: int) -> bool:
+    """Return True if a process with this pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_orphaned(path: Path) -> bool:
+    """Return True if a temp file's writer can no longer finish it.
+
+    Files naming their writer's pid are orphaned once it has exited;
+    others once older than ``_PARTIAL_WRITE_MAX_AGE``.
+    """
+    parts = path.name.split(".")
+    if len(parts) >= 4 and parts[-3].isdigit():
+        return not _pid_alive(int(parts[-3]))
+    try:
+        return time.time() - path.stat().st_mtime > _PARTIAL_WRITE_MAX_AGE
+    except FileNotFoundError:
+        return False
+
+
+def _remove_partial_writes() -> int:
+    """Delete temp files left by writes interrupted by a crash.
+
+    Workers share the base directory, so temp files of live siblings are
+    kept.
+    """
+    removed = 0
+    for pattern in ("*/*.tmp", "*/vault/*.tmp"):
+        for path in _get_base_tmp_dir().glob(pattern):
+            if not _is_orphaned(path):
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
 # S3 helpers
 
 
+def _s3_manifest_key(client_id: str) -> str:
+    """Return the S3 key of a client's segment manifest."""
+    return f"indexes/{client_id}/manifest.json"
+
+
+def _s3_segment_key(client_id: str, filename: str) -> str:
+    """Return the S3 key of a segment file."""
+    return f"indexes/{client_id}/{filename}"
+
+
+def _s3_vault_key(client_id: str, document_id: str) -> str:
+    """Return the S3 key of a document's compressed raw embeddings."""
+    return f"vault/{client_id}/{document_id}.vec.z"
+
+
+def _is_missing_key(exc: Exception) -> bool:
+    """Return True if an S3 error means the object does not exist."""
+    if not isinstance(exc, ClientError):
+        return False
+    code = exc.response.get("Error", {}).get("Code", "")
+    return code in ("NoSuchKey", "404", "NotFound")
+
+
 def _upload_with_retry(data: bytes, key: str, retries: int = 3) -> None:
     """Upload data to S3 with retries and exponential backoff.
 
+    Blocks while backing off, so only call it from background threads or
+    offline scripts.
+
     Raises:
         Exception: If all retry attempts fail.
     """
     for attempt in range(1, retries + 1):
         try:
-            upload_file(data, key)
+            if upload_file(data, key) is False:
+                raise RuntimeError(f"S3 rejected upload of {key}")
             return
         except Exception as exc:
             if attempt == retries:
@@ -86,26 +419,298 @@ def _upload_with_retry(data: bytes, key: str, retries: int = 3) -> None:
             time.sleep(2**attempt)
 
 
+def _download_to(key: str, path: str, expected: Optional[Dict] = None) -> None:
+    """Download an S3 object and write it atomically to a local path.
+
+    Args:
+        key: S3 key to download.
+        path: Local destination.
+        expected: Manifest ``size``/``crc32`` entry to verify the object
+            against before it is written.
+
+    Raises:
+        IndexIntegrityError: If the object does not match ``expected``.
+    """
+    data = download_file(key)
+    if expected is not None and (
+        len(data) != expected["size"] or f"{zlib.crc32(data):08x}" != expected["crc32"]
+    ):
+        raise IndexIntegrityError(f"S3 object {key} does not match its manifest")
+    _write_bytes(path, data)
+
+
+# Index model
+
+
+def _index_nbytes(index: faiss.Index) -> int:
+    """Estimate the resident memory of a FAISS index in bytes.
+
+    Counts stored codes (``ntotal x code size``), HNSW graph links and
+    levels, and ID-map entries. Unknown index types fall back to float32
+    vectors. Mapped flat indexes are charged their mapped bytes.
+    """
+    if isinstance(index, MappedFlatIndex):
+        return index.nbytes
+    index = faiss.downcast_index(index)
+    nbytes = 0
+
+    if hasattr(index, "id_map"):
+        nbytes += index.id_map.size() * 8
+        index = faiss.downcast_index(index.index)
+
+    if hasattr(index, "hnsw"):
+        hnsw = index.hnsw
+        nbytes += hnsw.neighbors.size() * 4
+        nbytes += hnsw.offsets.size() * 8
+        nbytes += hnsw.levels.size() * 4
+        index = faiss.downcast_index(index.storage)
+
+    if hasattr(index, "codes"):
+        return nbytes + index.codes.size()
+
+    try:
+        return nbytes + index.ntotal * index.sa_code_size()
+    except Exception:
+        return nbytes + index.ntotal * index.d * 4
+
+
+def _id_map(index: faiss.Index) -> Optional[np.ndarray]:
+    """Return the ids of an ``IndexIDMap``, or None for other index types."""
+    if isinstance(index, MappedFlatIndex):
+        return index.id_map
+    index = faiss.downcast_index(index)
+    if not hasattr(index, "id_map"):
+        return None
+    return faiss.vector_to_array(index.id_map).astype("int64", copy=False)
+
+
+@dataclass
+class IndexSegment:
+    """One immutable slice of a client's index and its chunk metadata.
+
+    ``ids`` holds the stable id of each row. Segments built on an
+    ``IndexIDMap`` keep those ids sorted; older segments have ids
+    ``id_start`` plus the row. ``searcher`` is the index without its id
+    map, so searches return row numbers and accept per-call parameters.
+    ``deleted`` is the tombstone bitmap over rows. ``metric`` is the
+    metric the index was built for. Flat float32 segments are usually a
+    :class:`MappedFlatIndex`, which is its own searcher. In a packed shard,
+    :meth:`tenant_rows` gives the rows of one tenant; :meth:`document_rows`
+    gives the rows of some documents, for filtered searches. ``lexical`` is
+    the BM25 index of the rows' texts, None for segments written without
+    one until :func:`build_lexical_indexes` adds it. Segments of up to
+    ``FAISS_EXACT_SEARCH_MAX_VECTORS`` rows keep their vectors as one
+    contiguous matrix in ``exact_vectors``, with squared norms in
+    ``exact_norms``, and are searched with :func:`exact_search`; for mapped
+    flat segments the matrix is the mapped file itself.
+    """
+
+    name: str
+    index: faiss.Index
+    metadata: ChunkStore
+    files: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    id_start: int = 0
+    ids: Optional[np.ndarray] = None
+    deleted: Optional[np.ndarray] = None
+    lexical: Optional[LexicalIndex] = None
+    labels_are_rows: bool = field(init=False)
+    searcher: faiss.Index = field(init=False)
+    n_deleted: int = field(init=False)
+    metric: str = field(init=False)
+    exact_vectors: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+    exact_norms: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+    _tenant_rows: Optional[Dict[str, np.ndarray]] = field(
+        default=None, init=False, repr=False
+    )
+    _document_rows: Optional[Dict[str, np.ndarray]] = field(
+        default=None, init=False, repr=False
+    )
+    _live_rows: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Derive row ids and an empty tombstone bitmap when not given."""
+        if isinstance(self.index, MappedFlatIndex):
+            self.labels_are_rows = self.index.id_map is None
+            self.searcher = self.index
+        else:
+            index = faiss.downcast_index(self.index)
+            self.labels_are_rows = not hasattr(index, "id_map")
+            self.searcher = (
+                index if self.labels_are_rows else faiss.downcast_index(index.index)
+            )
+        if self.ids is None:
+            self.ids = (
+                np.arange(
+                    self.id_start, self.id_start + self.index.ntotal, dtype="int64"
+                )
+                if self.labels_are_rows
+                else _id_map(self.index)
+            )
+        if self.deleted is None:
+            self.deleted = np.zeros(self.index.ntotal, dtype=bool)
+        self.n_deleted = int(self.deleted.sum())
+        self.metric = metric_of(self.index)
+        if 0 < self.index.ntotal <= settings.FAISS_EXACT_SEARCH_MAX_VECTORS:
+            self.exact_vectors = (
+                self.index.vectors
+                if isinstance(self.index, MappedFlatIndex)
+                else _reconstruct_vectors(self.index)
+            )
+            self.exact_norms = np.einsum(
+                "ij,ij->i", self.exact_vectors, self.exact_vectors
+            )
+
+    @property
+    def exact_nbytes(self) -> int:
+        """Return the bytes held for exact search beyond the index itself."""
+        if self.exact_norms is None:
+            return 0
+        if isinstance(self.index, MappedFlatIndex):
+            return self.exact_norms.nbytes
+        return self.exact_vectors.nbytes + self.exact_norms.nbytes
+
+    def live_rows(self) -> np.ndarray:
+        """Return the rows not tombstoned, in row order."""
+        if self._live_rows is None:
+            self._live_rows = np.flatnonzero(~self.deleted)
+        return self._live_rows
+
+    def tenant_rows(self, client_id: str) -> np.ndarray:
+        """Return the live rows tagged with a packed tenant's id."""
+        if self._tenant_rows is None:
+            self._tenant_rows = _live_rows_by_code(
+                self.metadata.client_ids, self.metadata.client_codes, self.deleted
+            )
+        return self._tenant_rows.get(client_id, np.empty(0, dtype="int64"))
+
+    def document_rows(self, document_ids: Collection[str]) -> np.ndarray:
+        """Return the live rows of some documents, in row order."""
+        if self._document_rows is None:
+            self._document_rows = _live_rows_by_code(
+                self.metadata.document_ids, self.metadata.document_codes, self.deleted
+            )
+        rows = [
+            self._document_rows[document_id]
+            for document_id in document_ids
+            if document_id in self._document_rows
+        ]
+        return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype="int64")
+
+
+def _live_rows_by_code(
+    names: Sequence[str], codes: np.ndarray, deleted: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Group the live rows of a segment by an interned metadata column."""
+    codes = np.where(deleted, -1, codes)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+    return {name: order[bounds[i] : bounds[i + 1]] for i, name in enumerate(names)}
+
+
+@dataclass
+class ClientIndex:
+    """All live segments of a client's index, in manifest order.
+
+    ``tenants`` maps each tenant of a packed shard to its live vector count.
+    """
+
+    segments: List[IndexSegment] = field(default_factory=list)
+    generation: int = 0
+    tombstones: List[List[int]] = field(default_factory=list)
+    plan: Optional[str] = None
+    search_tuning: Optional[Dict] = None
+    tenants: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def ntotal(self) -> int:
+        """Return the number of vectors across all segments."""
+        return sum(segment.index.ntotal for segment in self.segments)
+
+    @property
+    def n_deleted(self) -> int:
+        """Return the number of tombstoned vectors across all segments."""
+        return sum(segment.n_deleted for segment in self.segments)
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """Return the fraction of stored vectors that are tombstoned."""
+        return self.n_deleted / self.ntotal if self.ntotal else 0.0
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """Return the vector dimension, or None for an empty index."""
+        return self.segments[0].index.d if self.segments else None
+
+    @property
+    def nbytes(self) -> int:
+        """Return the estimated memory footprint of all segments."""
+        return sum(
+            _index_nbytes(segment.index)
+            + segment.metadata.nbytes
+            + (segment.lexical.nbytes if segment.lexical is not None else 0)
+            + segment.exact_nbytes
+            + segment.ids.nbytes
+            + segment.deleted.nbytes
+            for segment in self.segments
+        )
+
+
 # LRU cache
 
 
 class LRUIndexCache:
-    """Thread-safe LRU cache for FAISS indexes.
+    """Thread-safe, byte-budgeted LRU cache for FAISS indexes.
 
-    Evicts least-recently-used entries and cleans up disk files.
+    Each entry is charged its estimated footprint (vectors, graph links and
+    metadata). Least-recently-used entries are evicted until the cache fits
+    its budget. Eviction only drops the in-memory copy; the index files stay
+    in the disk tier.
     """
 
-    def __init__(self, capacity: int = 50) -> None:
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        capacity: Optional[int] = None,
+    ) -> None:
         """Initialize the FAISS LRU cache.
 
         Args:
-            capacity: Maximum number of indexes to keep in memory.
+            max_bytes: Memory budget for all cached indexes. Defaults to
+                ``settings.FAISS_CACHE_MAX_BYTES``.
+            capacity: Optional cap on the number of cached indexes.
         """
+        self.max_bytes = (
+            settings.FAISS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
         self.capacity = capacity
-        self.cache: OrderedDict[str, Tuple[faiss.Index, List[Dict]]] = OrderedDict()
+        self.cache: OrderedDict[str, ClientIndex] = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.current_bytes = 0
+        self.evictions = 0
         self.lock = Lock()
 
-    def get(self, client_id: str) -> Tuple[faiss.Index, List[Dict]] | None:
+    def __contains__(self, client_id: str) -> bool:
+        """Return True if the client's index is resident in memory."""
+        with self.lock:
+            return client_id in self.cache
+
+    def peek(self, client_id: str) -> ClientIndex | None:
+        """Return a cached index without changing its recency."""
+        with self.lock:
+            return self.cache.get(client_id)
+
+    def discard(self, client_id: str) -> None:
+        """Drop a client's index from memory, if cached."""
+        with self.lock:
+            if self.cache.pop(client_id, None) is not None:
+                self.current_bytes -= self.sizes.pop(client_id)
+
+    def client_ids(self) -> List[str]:
+        """Return the cached clients, most recently used first."""
+        with self.lock:
+            return list(reversed(self.cache))
+
+    def get(self, client_id: str) -> ClientIndex | None:
         """Retrieve a cached index and mark it as recently used."""
         with self.lock:
             if client_id not in self.cache:
@@ -113,174 +718,3230 @@ class LRUIndexCache:
             self.cache.move_to_end(client_id)
             return self.cache[client_id]
 
-    def put(
-        self,
-        client_id: str,
-        value: Tuple[faiss.Index, List[Dict]],
-    ) -> None:
-        """Insert or update a cached index and evict if over capacity."""
+    def put(self, client_id: str, value: ClientIndex) -> None:
+        """Insert or update a cached index and evict until within budget.
+
+        The entry being inserted is never evicted, even if it alone
+        exceeds the budget.
+        """
+        nbytes = value.nbytes
+
         with self.lock:
             if client_id in self.cache:
                 self.cache.move_to_end(client_id)
+                self.current_bytes -= self.sizes[client_id]
 
             self.cache[client_id] = value
+            self.sizes[client_id] = nbytes
+            self.current_bytes += nbytes
+
+            if nbytes > self.max_bytes:
+                logger.warning(
+                    "FAISS index for client %s (%d bytes) exceeds cache budget "
+                    "of %d bytes",
+                    client_id,
+                    nbytes,
+                    self.max_bytes,
+                )
 
-            if len(self.cache) > self.capacity:
+            while len(self.cache) > 1 and self._over_budget():
                 evicted_client, evicted_value = self.cache.popitem(last=False)
+                self.current_bytes -= self.sizes.pop(evicted_client)
+                self.evictions += 1
                 self._cleanup(evicted_client, evicted_value)
                 logger.info(
                     "Evicted FAISS index for client %s from cache",
                     evicted_client,
                 )
 
-    def _cleanup(
-        self,
-        client_id: str,
-        value: Tuple[faiss.Index, List[Dict]],
-    ) -> None:
+    def stats(self) -> Dict[str, int]:
+        """Return current bytes, entries, evictions and the byte budget."""
+        with self.lock:
+            return {
+                "bytes": self.current_bytes,
+                "entries": len(self.cache),
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _over_budget(self) -> bool:
+        """Return True if the cache exceeds its byte or entry limit."""
+        if self.current_bytes > self.max_bytes:
+            return True
+        return self.capacity is not None and len(self.cache) > self.capacity
+
+    def _cleanup(self, client_id: str, value: ClientIndex) -> None:
         """Cleanup resources for an evicted cache entry."""
-        index, _ = value
         try:
-            del index
+            del value
         except Exception:
             pass
 
-        _delete_local_files(client_id)
 
+def _dir_nbytes(path: Path) -> int:
+    """Return the total size of the regular files under ``path``, recursively."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                continue
+    return total
 
-_index_cache = LRUIndexCache(capacity=50)
 
+class DiskIndexCache:
+    """Thread-safe, byte-budgeted LRU of client index directories on disk.
 
-# FAISS operations
+    Tracks each client's local directory under the FAISS base directory and
+    deletes least-recently-used ones once the total exceeds the budget.
+    Clients whose index is resident in memory are evicted last; clients
+    being written (see :meth:`use`) or with uploads still pending are
+    never evicted.
+    """
 
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        """Initialize the disk tier.
 
-def create_index(dimension: int = 1536) -> faiss.Index:
-    """Create a new FAISS HNSW index."""
-    return faiss.IndexHNSWFlat(dimension, 32)
+        Args:
+            max_bytes: Disk budget for all local index files. Defaults to
+                ``settings.FAISS_DISK_CACHE_MAX_BYTES``.
+        """
+        self.max_bytes = (
+            settings.FAISS_DISK_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.in_use: Counter[str] = Counter()
+        self.current_bytes = 0
+        self.evictions = 0
+        self.lock = Lock()
+        self._scanned = False
 
+    @contextmanager
+    def use(self, client_id: str) -> Iterator[None]:
+        """Keep a client's directory from being evicted while files are written.
 
-def add_to_index(
-    client_id: str,
-    embeddings: List[List[float]],
-    metadata_list: List[Dict],
-) -> None:
-    """Add embeddings and metadata to a client's FAISS index."""
-    if not embeddings:
-        logger.warning("No embeddings provided for client %s", client_id)
-        return
+        Files written before their pending-upload record exists would
+        otherwise be deleted by another client's :meth:`touch`.
+        """
+        with self.lock:
+            self.in_use[client_id] += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.in_use[client_id] -= 1
+                if not self.in_use[client_id]:
+                    del self.in_use[client_id]
 
-    try:
-        index, existing_meta = load_index(client_id)
-    except Exception:
-        index = create_index(len(embeddings[0]))
-        existing_meta = []
+    def touch(self, client_id: str) -> None:
+        """Record use of a client's local files and enforce the budget."""
+        nbytes = _dir_nbytes(_get_base_tmp_dir() / client_id)
 
-    vectors = np.asarray(embeddings, dtype="float32")
+        with self.lock:
+            self._scan()
+            self.current_bytes -= self.entries.pop(client_id, 0)
+            self.entries[client_id] = nbytes
+            self.current_bytes += nbytes
+            victims = self._select_victims(client_id)
+
+        for victim in victims:
+            _delete_local_files(victim)
+            logger.info("Evicted FAISS files for client %s from disk", victim)
+
+    def stats(self) -> Dict[str, int]:
+        """Return current bytes, entries, evictions and the byte budget."""
+        with self.lock:
+            return {
+                "bytes": self.current_bytes,
+                "entries": len(self.entries),
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _scan(self) -> None:
+        """Adopt directories left on disk by a previous process, oldest first."""
+        if self._scanned:
+            return
+        self._scanned = True
+
+        dirs = [p for p in _get_base_tmp_dir().iterdir() if p.is_dir()]
+        for path in sorted(dirs, key=lambda p: p.stat().st_mtime):
+            nbytes = _dir_nbytes(path)
+            self.entries[path.name] = nbytes
+            self.current_bytes += nbytes
+
+    def _select_victims(self, protect: str) -> List[str]:
+        """Pop entries until within budget, sparing memory-resident clients."""
+        victims: List[str] = []
+        for spare_resident in (True, False):
+            for client_id in list(self.entries):
+                if self.current_bytes <= self.max_bytes:
+                    return victims
+                if (
+                    client_id == protect
+                    or client_id in self.in_use
+                    or _index_uploader.has_pending(client_id)
+                ):
+                    continue
+                if spare_resident and client_id in _index_cache:
+                    continue
+                self.current_bytes -= self.entries.pop(client_id)
+                self.evictions += 1
+                victims.append(client_id)
+        return victims
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block on the same future and share its result or
+    exception.
+    """
 
-    if vectors.ndim != 2:
-        raise ValueError("Embeddings must be a 2D array")
+    def __init__(self) -> None:
+        """Initialize the in-flight call table."""
+        self.calls: Dict[str, Future] = {}
+        self.lock = Lock()
 
-    if index.d != vectors.shape[1]:
-        raise ValueError(
-            f"Index dim mismatch: index={index.d}, \
-vector_dim={vectors.shape[1]}"
-        )
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Run ``fn`` for ``key`` unless a call is already in flight."""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
 
-    index.add(vectors)
-    save_index(client_id, index, existing_meta + metadata_list)
+        if not leader:
+            return future.result()
 
-    logger.info(
-        "Added %d vectors to FAISS index for client %s",
-        len(embeddings),
-        client_id,
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+
+
+_index_cache = LRUIndexCache()
+_disk_cache = DiskIndexCache()
+_index_loads = SingleFlight()
+
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Return size and eviction statistics for both cache tiers."""
+    return {"memory": _index_cache.stats(), "disk": _disk_cache.stats()}
+
+
+def get_cached_client_ids() -> List[str]:
+    """Return the clients whose indexes are in memory, most recent first."""
+    return _index_cache.client_ids()
+
+
+# Manifest handling
+
+# Serialize manifest read-modify-write cycles of a client within this
+# process; clients do not wait on each other's S3 fetches.
+_manifest_locks: weakref.WeakValueDictionary[str, Lock] = weakref.WeakValueDictionary()
+_manifest_locks_guard = Lock()
+
+
+def _manifest_lock(client_id: str) -> Lock:
+    """Return the lock guarding a client's manifest updates."""
+    with _manifest_locks_guard:
+        lock = _manifest_locks.get(client_id)
+        if lock is None:
+            lock = _manifest_locks[client_id] = Lock()
+        return lock
+
+
+def _empty_manifest(dimension: int) -> Dict:
+    """Return a manifest describing an index with no segments."""
+    return {
+        "version": MANIFEST_VERSION,
+        "generation": 0,
+        "dimension": dimension,
+        "next_id": 0,
+        "tombstones": [],
+        "segments": [],
+    }
+
+
+def _upgrade_manifest(manifest: Dict) -> Dict:
+    """Fill in id fields missing from manifests written before stable ids.
+
+    Segments without an id map get consecutive id ranges in manifest
+    order. The result is deterministic, so every worker derives the same
+    ids until the next write persists them.
+    """
+    if "next_id" not in manifest:
+        cursor = 0
+        for entry in manifest["segments"]:
+            entry.setdefault("id_start", cursor)
+            cursor = entry["id_start"] + entry["ntotal"]
+        manifest["next_id"] = cursor
+    manifest.setdefault("tombstones", [])
+    return manifest
+
+
+def _live_count(manifest: Dict) -> int:
+    """Return the number of vectors in a manifest that are not tombstoned."""
+    stored = sum(entry["ntotal"] for entry in manifest["segments"])
+    return stored - sum(end - start for start, end in manifest["tombstones"])
+
+
+def _needs_migration(manifest: Dict) -> bool:
+    """Return True if segments differ in kind or metric from the target."""
+    metric = manifest.get("metric", METRIC_L2)
+    if manifest["segments"] and metric != choose_metric():
+        return True
+    if any(entry.get("metric", METRIC_L2) != metric for entry in manifest["segments"]):
+        return True
+    kind = manifest.get("index_kind")
+    return kind is not None and any(
+        entry.get("kind", INDEX_HNSW) != kind for entry in manifest["segments"]
     )
 
 
-def save_index(
-    client_id: str,
-    index: faiss.Index,
-    metadata: List[Dict],
-) -> None:
-    """Persist a FAISS index locally and attempt S3 upload."""
+def _next_generation(client_id: str, manifest: Dict) -> int:
+    """Return the generation for a new version of ``manifest``."""
+    return max(manifest.get("generation", 0), _committed_generation(client_id)) + 1
+
+
+def _manifest_checksum(manifest: Dict) -> str:
+    """Return the CRC32 of a manifest's content, excluding the checksum."""
+    body = {key: value for key, value in manifest.items() if key != "checksum"}
+    encoded = json.dumps(body, sort_keys=True, separators=(",", ":"))
+    return f"{zlib.crc32(encoded.encode('utf-8')):08x}"
+
+
+def _write_manifest(client_id: str, manifest: Dict) -> None:
+    """Checksum a manifest and write it locally and atomically.
+
+    The uploader publishes it to S3 only after the segment files it
+    references, so S3 readers never see a manifest with missing segments.
+    """
+    manifest["version"] = MANIFEST_VERSION
+    manifest["checksum"] = _manifest_checksum(manifest)
+    _write_bytes(_get_manifest_path(client_id), json.dumps(manifest).encode("utf-8"))
+
+
+def _migrate_legacy_index(client_id: str) -> Optional[Dict]:
+    """Convert a pre-segment single-file index into a one-segment manifest.
+
+    Returns:
+        The new manifest, or None if the client has no legacy index.
+    """
     index_path = _get_index_path(client_id)
     meta_path = _get_metadata_path(client_id)
 
-    Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+    if not os.path.exists(index_path) or not os.path.exists(meta_path):
+        try:
+            _download_to(f"indexes/{client_id}.index", index_path)
+            _download_to(f"indexes/{client_id}_meta.pkl", meta_path)
+        except Exception as exc:
+            if _is_missing_key(exc):
+                return None
+            raise
+
+    index = faiss.read_index(index_path)
+    with open(meta_path, "rb") as f:
+        rows = pickle.load(f)
+
+    segment = _write_segment(client_id, "seg_legacy", index, rows)
+    os.remove(index_path)
+    os.remove(meta_path)
+
+    manifest = _empty_manifest(index.d)
+    manifest["segments"].append(_segment_entry(segment))
+    manifest["next_id"] = _end_id(segment)
+    _write_manifest(client_id, manifest)
+    _index_uploader.enqueue(client_id, _segment_filenames(segment.name))
 
-    faiss.write_index(index, index_path)
+    logger.info("Migrated legacy FAISS index for client %s to segments", client_id)
+    return manifest
 
-    with open(meta_path, "wb") as f:
-        pickle.dump(metadata, f)
 
+def _read_local_manifest(client_id: str) -> Optional[Dict]:
+    """Return the manifest on local disk, or None if there is none.
+
+    A manifest that does not parse or fails its checksum is deleted and
+    treated as missing.
+    """
+    path = _get_manifest_path(client_id)
     try:
-        with open(index_path, "rb") as f:
-            _upload_with_retry(f.read(), f"indexes/{client_id}.index")
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        manifest = None
+
+    if manifest is None or (
+        "checksum" in manifest and manifest["checksum"] != _manifest_checksum(manifest)
+    ):
+        logger.warning("Discarding corrupt FAISS manifest for client %s", client_id)
+        Path(path).unlink(missing_ok=True)
+        return None
+    return manifest
+
+
+def _fetch_manifest(client_id: str, min_generation: int = 0) -> Optional[Dict]:
+    """Return a client's manifest from disk or S3, or None if absent.
+
+    Args:
+        client_id: Client whose manifest to read.
+        min_generation: Oldest acceptable generation. A local manifest
+            older than this is replaced by the one in S3, which must not
+            be older either (see :func:`_download_manifest`).
 
-        with open(meta_path, "rb") as f:
-            _upload_with_retry(f.read(), f"indexes/{client_id}_meta.pkl")
+    Raises:
+        IndexIntegrityError: If the manifest in S3 is corrupt, or still
+            older than ``min_generation`` after retries.
+        Exception: If S3 fails for any reason other than a missing key,
+            so callers never mistake an outage for an empty index.
+    """
+    path = _get_manifest_path(client_id)
 
-    except Exception as exc:
-        logger.error(
-            "S3 upload FAILED for client %s. Index remains local only. Error: %s",
+    local = _read_local_manifest(client_id)
+    if local is not None and local.get("generation", 0) < min_generation:
+        logger.info(
+            "Local FAISS manifest for client %s is stale (generation %d < %d)",
             client_id,
-            exc,
+            local.get("generation", 0),
+            min_generation,
         )
+        os.remove(path)
 
-    _index_cache.put(client_id, (index, metadata))
+    if not os.path.exists(path):
+        try:
+            _download_manifest(client_id, min_generation)
+        except IndexIntegrityError:
+            raise
+        except Exception as exc:
+            if not _is_missing_key(exc):
+                logger.error("Failed to load manifest from S3: %s", exc)
+                raise
+            return _migrate_legacy_index(client_id)
 
+    manifest = _read_local_manifest(client_id)
+    if manifest is None:
+        raise IndexIntegrityError(f"Corrupt FAISS manifest in S3 for {client_id}")
+    return _upgrade_manifest(manifest)
 
-def load_index(client_id: str) -> Tuple[faiss.Index, List[Dict]]:
-    """Load a FAISS index from cache, disk, or S3."""
-    cached = _index_cache.get(client_id)
-    if cached:
-        return cached
 
-    index_path = _get_index_path(client_id)
-    meta_path = _get_metadata_path(client_id)
+def _download_manifest(client_id: str, min_generation: int) -> None:
+    """Download a client's manifest of at least ``min_generation``.
 
-    if not os.path.exists(index_path) or not os.path.exists(meta_path):
-        try:
-            index_bytes = download_file(f"indexes/{client_id}.index")
-            meta_bytes = download_file(f"indexes/{client_id}_meta.pkl")
+    Generations are committed only after their manifest is in S3, but a
+    late upload of an older manifest can still overwrite a newer one. An
+    older manifest is deleted, so it is never cached, and fetched again
+    with backoff.
 
-            with open(index_path, "wb") as f:
-                f.write(index_bytes)
+    Raises:
+        IndexIntegrityError: If S3 still holds an older manifest after
+            ``settings.FAISS_MANIFEST_FETCH_RETRIES`` retries.
+    """
+    path = _get_manifest_path(client_id)
+    retries = settings.FAISS_MANIFEST_FETCH_RETRIES
+    for attempt in range(retries + 1):
+        _download_to(_s3_manifest_key(client_id), path)
+        manifest = _read_local_manifest(client_id)
+        if manifest is None:
+            # Corrupt; reported by the caller.
+            return
+        generation = manifest.get("generation", 0)
+        if generation >= min_generation:
+            return
+        os.remove(path)
+        if attempt < retries:
+            logger.warning(
+                "FAISS manifest in S3 for client %s is stale "
+                "(generation %d < %d), retrying",
+                client_id,
+                generation,
+                min_generation,
+            )
+            time.sleep(settings.FAISS_MANIFEST_FETCH_RETRY_DELAY * 2**attempt)
 
-            with open(meta_path, "wb") as f:
-                f.write(meta_bytes)
-        except Exception as exc:
-            logger.error("Failed to load index from S3: %s", exc)
-            raise
+    raise IndexIntegrityError(
+        f"FAISS manifest in S3 for {client_id} is at generation {generation}, "
+        f"expected at least {min_generation}"
+    )
 
-    index = faiss.read_index(index_path)
 
-    with open(meta_path, "rb") as f:
-        metadata = pickle.load(f)
+# Tombstones
+
+
+def _ids_to_ranges(ids: np.ndarray) -> List[List[int]]:
+    """Collapse ids into sorted, disjoint ``[start, end)`` ranges."""
+    ids = np.unique(ids)
+    if ids.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts = ids[np.concatenate(([0], breaks))]
+    ends = ids[np.concatenate((breaks - 1, [ids.size - 1]))] + 1
+    return [[int(s), int(e)] for s, e in zip(starts, ends)]
+
+
+def _merge_ranges(ranges: Sequence[Sequence[int]]) -> List[List[int]]:
+    """Sort ranges and merge the ones that overlap or touch."""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _subtract_ranges(
+    ranges: Sequence[Sequence[int]],
+    removed: Sequence[Sequence[int]],
+) -> List[List[int]]:
+    """Return the parts of ``ranges`` not covered by ``removed``."""
+    result = []
+    removed = _merge_ranges(removed)
+    for start, end in _merge_ranges(ranges):
+        for cut_start, cut_end in removed:
+            if cut_end <= start or cut_start >= end:
+                continue
+            if cut_start > start:
+                result.append([start, cut_start])
+            start = max(start, cut_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append([start, end])
+    return result
+
+
+def _in_ranges(ids: np.ndarray, ranges: Sequence[Sequence[int]]) -> np.ndarray:
+    """Return a mask of the ids covered by sorted, disjoint ranges."""
+    if not ranges:
+        return np.zeros(ids.shape, dtype=bool)
+    bounds = np.asarray(ranges, dtype="int64")
+    position = np.searchsorted(bounds[:, 1], ids, side="right")
+    covered = position < len(bounds)
+    covered[covered] = bounds[position[covered], 0] <= ids[covered]
+    return covered
+
+
+def _end_id(segment: IndexSegment) -> int:
+    """Return one past the largest id in a segment (0 if empty)."""
+    return int(segment.ids.max()) + 1 if segment.ids.size else 0
+
+
+def _build_client_index(manifest: Dict, segments: List[IndexSegment]) -> ClientIndex:
+    """Assemble a client index, applying the manifest's tombstones.
+
+    Search tuning is only kept while the index is still of the kind it was
+    measured on.
+    """
+    tombstones = manifest.get("tombstones", [])
+    tuning = manifest.get("search_tuning")
+    if tuning and tuning.get("index_kind") != manifest.get("index_kind"):
+        tuning = None
+    return ClientIndex(
+        segments=[
+            replace(segment, deleted=_in_ranges(segment.ids, tombstones))
+            for segment in segments
+        ],
+        generation=manifest.get("generation", 0),
+        tombstones=tombstones,
+        plan=manifest.get("plan"),
+        search_tuning=tuning,
+        tenants=manifest.get("tenants", {}),
+    )
 
-    _index_cache.put(client_id, (index, metadata))
-    return index, metadata
 
+# Segment persistence
+
+
+def _new_segment_name() -> str:
+    """Return a unique, immutable segment name."""
+    return f"seg_{uuid.uuid4().hex[:12]}"
+
+
+def _segment_filenames(segment: str, lexical: bool = True) -> Sequence[str]:
+    """Return the file names that make up a segment.
+
+    Segments written before lexical indexes have no ``.terms`` file.
+    """
+    names = (f"{segment}.index", f"{segment}.chunks")
+    return names + (f"{segment}.terms",) if lexical else names
+
+
+def _referenced_files(manifest: Optional[Dict]) -> set[str]:
+    """Return the names of all segment files a manifest lists."""
+    if manifest is None:
+        return set()
+    return {name for entry in manifest["segments"] for name in entry.get("files", {})}
+
+
+def _has_lexical_file(entry: Dict) -> bool:
+    """Return True if a manifest entry's segment has a lexical index file."""
+    return f"{entry['name']}.terms" in entry.get("files", {})
 
-def search_index(
-    client_id: str,
-    query_embedding: List[float],
-    top_k: int = 5,
-) -> List[Dict]:
-    """Search a client's FAISS index for nearest neighbors."""
-    index, metadata = load_index(client_id)
 
-    query = np.asarray([query_embedding], dtype="float32")
+def _segment_entry(segment: IndexSegment) -> Dict:
+    """Return the manifest entry describing a segment."""
+    entry = {
+        "name": segment.name,
+        "ntotal": int(segment.index.ntotal),
+        "metadata_format": METADATA_FORMAT,
+        "kind": index_kind_of(segment.index),
+        "metric": segment.metric,
+        "files": segment.files,
+    }
+    if segment.labels_are_rows:
+        entry["id_start"] = segment.id_start
+    return entry
 
-    if query.shape[1] != index.d:
-        raise ValueError(f"Query dim mismatch: query={query.shape[1]}, index={index.d}")
 
-    distances, indices = index.search(query, top_k)
+def _read_index_file(path: str) -> faiss.Index:
+    """Load a segment's index file.
 
-    results: List[Dict] = []
-    for i, idx in enumerate(indices[0]):
-        if 0 <= idx < len(metadata):
-            item = metadata[idx].copy()
-            item["score"] = float(1 / (1 + distances[0][i]))
-            results.append(item)
+    Flat float32 files are memory-mapped read-only when
+    ``FAISS_MMAP_FLAT`` is set, so workers on a node share their pages;
+    other kinds are read into process memory.
+    """
+    if settings.FAISS_MMAP_FLAT:
+        mapped = MappedFlatIndex.open(path)
+        if mapped is not None:
+            return mapped
+    return faiss.read_index(path)
+
+
+def _write_segment(
+    client_id: str,
+    name: str,
+    index: faiss.Index,
+    rows: Sequence[Dict],
+    id_start: int = 0,
+) -> IndexSegment:
+    """Persist a new segment locally and return it.
+
+    All files are fully written and fsynced before the segment can be
+    published in a manifest. Upload is left to the caller, once the
+    segment is in the manifest. A flat index is served from its mapped
+    file rather than the in-memory copy, as it would be after a reload.
+
+    Args:
+        client_id: Owner of the segment.
+        name: Segment name.
+        index: Vectors of the segment. An ``IndexIDMap`` must hold its ids
+            in increasing order.
+        rows: Chunk metadata, one row per vector.
+        id_start: First id of an index without an id map.
+
+    Raises:
+        IndexIntegrityError: If ``rows`` does not have one row per vector,
+            or the id map is not sorted.
+    """
+    if len(rows) != index.ntotal:
+        raise IndexIntegrityError(
+            f"Segment {name} has {index.ntotal} vectors but {len(rows)} rows"
+        )
+    ids = _id_map(index)
+    if ids is not None and np.any(np.diff(ids) <= 0):
+        raise IndexIntegrityError(f"Segment {name} ids are not strictly increasing")
+
+    index_path = _get_segment_index_path(client_id, name)
+    chunks_path = _get_segment_metadata_path(client_id, name)
+    terms_path = _get_segment_terms_path(client_id, name)
+
+    _atomic_write(index_path, lambda path: faiss.write_index(index, path))
+    _atomic_write(chunks_path, lambda path: ChunkStore.write(path, rows))
+    _atomic_write(
+        terms_path,
+        lambda path: LexicalIndex.write(path, (row.get("text") for row in rows)),
+    )
+
+    if settings.FAISS_MMAP_FLAT and index_kind_of(index) == INDEX_FLAT:
+        index = _read_index_file(index_path)
+
+    return IndexSegment(
+        name=name,
+        index=index,
+        metadata=ChunkStore.open(chunks_path),
+        files={
+            Path(path).name: _file_info(path)
+            for path in (index_path, chunks_path, terms_path)
+        },
+        id_start=id_start,
+        lexical=LexicalIndex.open(terms_path),
+    )
+
+
+def _convert_pickled_metadata(client_id: str, segment: str) -> None:
+    """Convert a segment's pickled metadata into a local chunk store.
+
+    Segments written before the columnar format keep ``{segment}_meta.pkl``
+    in S3; they are converted on load until the next compaction rewrites
+    them.
+    """
+    chunks_path = _get_segment_metadata_path(client_id, segment)
+    if os.path.exists(chunks_path):
+        return
+
+    pickle_path = str(_get_client_dir(client_id) / f"{segment}_meta.pkl")
+    if not os.path.exists(pickle_path):
+        _download_to(_s3_segment_key(client_id, f"{segment}_meta.pkl"), pickle_path)
+
+    with open(pickle_path, "rb") as f:
+        rows = pickle.load(f)
+    _atomic_write(chunks_path, lambda path: ChunkStore.write(path, rows))
+    os.remove(pickle_path)
+
+
+def _read_segment(client_id: str, entry: Dict) -> IndexSegment:
+    """Load and validate a segment, fetching missing or bad files from S3.
+
+    Local files are checked against the sizes and checksums in the
+    manifest entry; only files that fail are downloaded again.
+
+    Raises:
+        IndexIntegrityError: If the segment still does not match its
+            manifest entry after re-downloading.
+    """
+    segment = entry["name"]
+    client_dir = _get_client_dir(client_id)
+    files = entry.get("files", {})
+
+    if entry.get("metadata_format") != METADATA_FORMAT:
+        _convert_pickled_metadata(client_id, segment)
+
+    has_lexical = _has_lexical_file(entry)
+    for filename in _segment_filenames(segment, has_lexical):
+        path = str(client_dir / filename)
+        expected = files.get(filename)
+        if _matches(path, expected, settings.FAISS_VERIFY_CHECKSUMS):
+            continue
+        if os.path.exists(path):
+            logger.warning(
+                "Local FAISS file %s of client %s is corrupt, re-downloading",
+                filename,
+                client_id,
+            )
+        _download_to(_s3_segment_key(client_id, filename), path, expected)
+
+    index = _read_index_file(_get_segment_index_path(client_id, segment))
+    metadata = ChunkStore.open(_get_segment_metadata_path(client_id, segment))
+    lexical = (
+        LexicalIndex.open(_get_segment_terms_path(client_id, segment))
+        if has_lexical
+        else None
+    )
+
+    if not index.ntotal == len(metadata) == entry["ntotal"] or (
+        lexical is not None and len(lexical) != entry["ntotal"]
+    ):
+        raise IndexIntegrityError(
+            f"Segment {segment} of client {client_id} has {index.ntotal} vectors "
+            f"and {len(metadata)} rows, manifest says {entry['ntotal']}"
+        )
+
+    return IndexSegment(
+        name=segment,
+        index=index,
+        metadata=metadata,
+        files=files,
+        id_start=entry.get("id_start", 0),
+        lexical=lexical,
+    )
+
+
+def _delete_segment_files(client_id: str, segments: Sequence[str]) -> None:
+    """Best-effort removal of retired segments from local disk.
+
+    Their S3 copies are deleted by the uploader after the manifest that
+    drops them has been uploaded.
+    """
+    client_dir = _get_client_dir(client_id)
+    for segment in segments:
+        for filename in _segment_filenames(segment):
+            try:
+                (client_dir / filename).unlink(missing_ok=True)
+            except Exception as exc:  # pragma: no cover - best effort cleanup
+                logger.warning("Failed to delete %s: %s", filename, exc)
+
+
+def _refresh_cache(
+    client_id: str,
+    manifest: Dict,
+    new_segments: Sequence[IndexSegment],
+) -> None:
+    """Bring a cached client index in line with a freshly written manifest.
+
+    Clients that are not cached are left alone; they load lazily.
+    """
+    cached = _index_cache.get(client_id)
+    if cached is None:
+        return
+
+    known = {segment.name: segment for segment in cached.segments}
+    known.update({segment.name: segment for segment in new_segments})
+
+    segments = [
+        known.get(entry["name"]) or _read_segment(client_id, entry)
+        for entry in manifest["segments"]
+    ]
+    _index_cache.put(client_id, _build_client_index(manifest, segments))
+
+
+def _append_segment(
+    client_id: str,
+    index: faiss.Index,
+    rows: Sequence[Dict],
+    plan: Optional[str] = None,
+    tenants: Optional[Dict[str, int]] = None,
+    tombstones: Optional[np.ndarray] = None,
+) -> Dict:
+    """Write a new segment and publish it in the client's manifest.
+
+    The segment's kind becomes the manifest's index kind, and ``plan``, if
+    given, is recorded for later compactions. ``tenants`` holds the change
+    in live vectors of each packed tenant, and ``tombstones`` the ids
+    superseded by the segment, applied in the same manifest update.
+    """
+    segment = _write_segment(client_id, _new_segment_name(), index, rows)
+
+    with _manifest_lock(client_id):
+        committed = _committed_generation(client_id)
+        manifest = _fetch_manifest(client_id, committed) or _empty_manifest(
+            segment.index.d
+        )
+        manifest["generation"] = _next_generation(client_id, manifest)
+        manifest["next_id"] = max(manifest["next_id"], _end_id(segment))
+        manifest["index_kind"] = index_kind_of(segment.index)
+        manifest["metric"] = segment.metric
+        if plan is not None:
+            manifest["plan"] = plan
+        if tenants:
+            _count_tenants(manifest, tenants)
+        if tombstones is not None and tombstones.size:
+            manifest["tombstones"] = _merge_ranges(
+                manifest["tombstones"] + _ids_to_ranges(tombstones)
+            )
+        manifest["segments"].append(_segment_entry(segment))
+        _write_manifest(client_id, manifest)
+        _refresh_cache(client_id, manifest, [segment])
+
+    _index_uploader.enqueue(client_id, _segment_filenames(segment.name))
+    _disk_cache.touch(client_id)
+    return manifest
+
+
+def _replace_segments(
+    client_id: str,
+    retired: Optional[Sequence[str]],
+    index: faiss.Index,
+    rows: Sequence[Dict],
+    applied_tombstones: Sequence[Sequence[int]] = (),
+    plan: Optional[str] = None,
+) -> bool:
+    """Swap a set of segments for one new segment in the manifest.
+
+    Args:
+        client_id: Client whose index is being rewritten.
+        retired: Segment names the new segment supersedes. ``None`` retires
+            every segment currently in the manifest and clears tombstones.
+        index: Vectors of the replacement segment. Without an id map it is
+            given fresh ids.
+        rows: Chunk metadata of the replacement segment, one per vector.
+        applied_tombstones: Tombstone ranges already dropped from the new
+            segment, removed from the manifest with the swap.
+        plan: Plan type to record in the manifest, if given.
+
+    Returns:
+        False, leaving the manifest untouched, if some of ``retired`` are
+        no longer in the manifest (another rewrite got there first).
+    """
+    current = _fetch_manifest(client_id, _committed_generation(client_id))
+    segment = _write_segment(
+        client_id,
+        _new_segment_name(),
+        index,
+        rows,
+        id_start=current["next_id"] if current else 0,
+    )
+
+    with _manifest_lock(client_id):
+        committed = _committed_generation(client_id)
+        manifest = _fetch_manifest(client_id, committed) or _empty_manifest(
+            segment.index.d
+        )
+        names = [entry["name"] for entry in manifest["segments"]]
+        retired_set = set(names if retired is None else retired)
+
+        if not retired_set.issubset(names):
+            _delete_segment_files(client_id, [segment.name])
+            logger.warning(
+                "Skipped FAISS rewrite for client %s: segments %s already retired",
+                client_id,
+                sorted(retired_set.difference(names)),
+            )
+            return False
+
+        manifest["generation"] = _next_generation(client_id, manifest)
+        manifest["next_id"] = max(manifest["next_id"], _end_id(segment))
+        manifest["tombstones"] = (
+            []
+            if retired is None
+            else _subtract_ranges(manifest["tombstones"], applied_tombstones)
+        )
+
+        manifest["dimension"] = segment.index.d
+        manifest["index_kind"] = index_kind_of(segment.index)
+        manifest["metric"] = segment.metric
+        if plan is not None:
+            manifest["plan"] = plan
+        manifest["segments"] = [_segment_entry(segment)] + [
+            entry for entry in manifest["segments"] if entry["name"] not in retired_set
+        ]
+        _write_manifest(client_id, manifest)
+        _refresh_cache(client_id, manifest, [segment])
+
+    retired_names = [n for n in names if n in retired_set]
+    _delete_segment_files(client_id, retired_names)
+    _index_uploader.enqueue(
+        client_id,
+        _segment_filenames(segment.name),
+        retired=retired_names,
+    )
+    _disk_cache.touch(client_id)
+    return True
+
+
+# Write-behind persistence
+
+
+class IndexUploader:
+    """Background, coalescing uploader of client index files to S3.
+
+    Each pending client has a small JSON record on disk listing the segment
+    files still to upload, the retired segments still to delete and the
+    documents whose vault files are still to upload. A single worker thread
+    drains the queue: it uploads the vault files, then the listed segment
+    files, then the client's current manifest, then deletes retired S3
+    objects.
+
+    Repeated saves of a client before its job runs merge into one job, and
+    the job always uploads the latest local manifest. Jobs that exhaust
+    their retries keep their record and are retried later; records left by
+    a crashed process are picked up by :meth:`recover`.
+    """
+
+    def __init__(
+        self,
+        retries: Optional[int] = None,
+        retry_delay: Optional[float] = None,
+    ) -> None:
+        """Initialize the uploader.
+
+        Args:
+            retries: Attempts per S3 object. Defaults to
+                ``settings.FAISS_UPLOAD_RETRIES``.
+            retry_delay: Seconds before a failed job is retried. Defaults to
+                ``settings.FAISS_UPLOAD_RETRY_DELAY``.
+        """
+        self.retries = settings.FAISS_UPLOAD_RETRIES if retries is None else retries
+        self.retry_delay = (
+            settings.FAISS_UPLOAD_RETRY_DELAY if retry_delay is None else retry_delay
+        )
+        self.queue: queue.Queue[str] = queue.Queue()
+        self.queued: set[str] = set()
+        self.retrying: set[str] = set()
+        self.outstanding = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.lock = Lock()
+        self.idle = threading.Condition(self.lock)
+        self._worker: Optional[threading.Thread] = None
+
+    def enqueue(
+        self,
+        client_id: str,
+        files: Sequence[str] = (),
+        retired: Sequence[str] = (),
+        vault: Sequence[str] = (),
+    ) -> None:
+        """Record files to upload for a client and schedule its job.
+
+        Args:
+            client_id: Client owning the files.
+            files: Segment file names to upload.
+            retired: Segment names whose S3 objects to delete.
+            vault: Document ids whose vault files to upload.
+        """
+        with self.lock:
+            pending = self._read_pending(client_id)
+            pending["files"] = sorted(set(pending["files"]) | set(files))
+            pending["retired"] = sorted(set(pending["retired"]) | set(retired))
+            pending["vault"] = sorted(set(pending["vault"]) | set(vault))
+            self._write_pending(client_id, pending)
+            self._schedule(client_id)
+
+    def has_pending(self, client_id: str) -> bool:
+        """Return True if a client has local changes not yet in S3."""
+        return os.path.exists(_get_pending_upload_path(client_id))
+
+    def recover(self) -> int:
+        """Re-schedule clients whose uploads were pending at last shutdown.
+
+        Workers share the base directory, so a pending record may belong to
+        a sibling's upload in flight. A client is only adopted if its write
+        lease can be taken at once; records whose lease is held elsewhere
+        are left to the worker holding it.
+
+        Returns:
+            Number of clients scheduled.
+        """
+        clients = [
+            path.parent.name
+            for path in _get_base_tmp_dir().glob("*/pending_upload.json")
+        ]
+        adopted = []
+        for client_id in clients:
+            try:
+                _write_leases.adopt(client_id)
+            except IndexLeaseError:
+                logger.info(
+                    "Leaving pending FAISS upload of client %s to its lease holder",
+                    client_id,
+                )
+                continue
+            adopted.append(client_id)
+        with self.lock:
+            for client_id in adopted:
+                self._schedule(client_id)
+        return len(adopted)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait for queued and in-progress jobs to finish.
+
+        Failed jobs waiting for their retry do not hold up the wait, but
+        still count as not uploaded.
+
+        Returns:
+            True if the queue drained before the timeout and no client's
+            last upload failed.
+        """
+        with self.lock:
+            drained = self.idle.wait_for(lambda: self.outstanding == 0, timeout)
+            return drained and not self.retrying
+
+    def stats(self) -> Dict[str, int]:
+        """Return pending, retrying and failed jobs and uploaded objects."""
+        with self.lock:
+            return {
+                "pending": self.outstanding,
+                "retrying": len(self.retrying),
+                "uploaded": self.uploaded,
+                "failed": self.failed,
+            }
+
+    def _schedule(self, client_id: str) -> None:
+        """Queue a client's job unless one is already queued (lock held)."""
+        if client_id in self.queued:
+            return
+        self.queued.add(client_id)
+        self.outstanding += 1
+        self.queue.put(client_id)
+
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run,
+                name="faiss-uploader",
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _run(self) -> None:
+        """Worker loop."""
+        while True:
+            client_id = self.queue.get()
+            with self.lock:
+                # Saves arriving from here on schedule a fresh job.
+                self.queued.discard(client_id)
+            try:
+                self._sync(client_id)
+                with self.lock:
+                    self.retrying.discard(client_id)
+            except Exception as exc:
+                with self.lock:
+                    self.failed += 1
+                    self.retrying.add(client_id)
+                logger.error(
+                    "S3 upload FAILED for client %s, retrying in %ss: %s",
+                    client_id,
+                    self.retry_delay,
+                    exc,
+                )
+                timer = threading.Timer(self.retry_delay, self._retry, (client_id,))
+                timer.daemon = True
+                timer.start()
+            finally:
+                with self.lock:
+                    self.outstanding -= 1
+                    self.idle.notify_all()
+
+    def _retry(self, client_id: str) -> None:
+        """Re-schedule a failed job if it is still pending."""
+        with self.lock:
+            if self.has_pending(client_id):
+                self._schedule(client_id)
+            else:
+                self.retrying.discard(client_id)
+
+    def _sync(self, client_id: str) -> None:
+        """Upload a client's pending files and manifest, then prune S3."""
+        with self.lock:
+            pending = self._read_pending(client_id)
+        if not self.has_pending(client_id):
+            return
+
+        # Vault files do not depend on the manifest generation.
+        for document_id in pending["vault"]:
+            path = Path(_get_vault_path(client_id, document_id))
+            if not path.exists():
+                # Deleted with its document since.
+                continue
+            _upload_with_retry(
+                compress(path.read_bytes()),
+                _s3_vault_key(client_id, document_id),
+                self.retries,
+            )
+            with self.lock:
+                self.uploaded += 1
+        if pending["vault"]:
+            with self.lock:
+                current = self._read_pending(client_id)
+                current["vault"] = sorted(set(current["vault"]) - set(pending["vault"]))
+                self._write_pending(client_id, current)
+            pending["vault"] = []
+
+        manifest_path = Path(_get_manifest_path(client_id))
+        local = _read_local_manifest(client_id)
+        generation = local.get("generation", 0) if local else 0
+        if local is not None and generation < _committed_generation(client_id):
+            # Left behind by a crash after our write lease expired; another
+            # worker has since published a newer manifest.
+            logger.error(
+                "Discarding stale FAISS upload for client %s (generation %d)",
+                client_id,
+                generation,
+            )
+            with self.lock:
+                # Vault files saved meanwhile are still to upload.
+                vault = self._read_pending(client_id)["vault"]
+                if vault:
+                    self._write_pending(
+                        client_id, {"files": [], "retired": [], "vault": vault}
+                    )
+                    self._schedule(client_id)
+                else:
+                    Path(_get_pending_upload_path(client_id)).unlink(missing_ok=True)
+            manifest_path.unlink(missing_ok=True)
+            return
+
+        _write_leases.extend(client_id)
+
+        client_dir = _get_client_dir(client_id)
+        referenced: Optional[set[str]] = None
+        for filename in pending["files"]:
+            path = client_dir / filename
+            if not path.exists():
+                if referenced is None:
+                    referenced = _referenced_files(_read_local_manifest(client_id))
+                if filename in referenced:
+                    # Publishing the manifest would break every load of it.
+                    raise IndexIntegrityError(
+                        f"Segment file {filename} of client {client_id} "
+                        "is missing locally"
+                    )
+                # Already retired by a later compaction.
+                continue
+            _upload_with_retry(
+                path.read_bytes(),
+                _s3_segment_key(client_id, filename),
+                self.retries,
+            )
+            with self.lock:
+                self.uploaded += 1
+
+        if manifest_path.exists():
+            # Later writes may have extended the manifest since the check.
+            manifest_bytes = manifest_path.read_bytes()
+            _upload_with_retry(
+                manifest_bytes,
+                _s3_manifest_key(client_id),
+                self.retries,
+            )
+            _commit_generation(
+                client_id,
+                json.loads(manifest_bytes).get("generation", 0),
+            )
+
+        for segment in pending["retired"]:
+            for filename in _segment_filenames(segment):
+                delete_file(_s3_segment_key(client_id, filename))
+
+        with self.lock:
+            current = self._read_pending(client_id)
+            current["files"] = sorted(set(current["files"]) - set(pending["files"]))
+            current["retired"] = sorted(
+                set(current["retired"]) - set(pending["retired"])
+            )
+            if (
+                current["files"]
+                or current["retired"]
+                or current["vault"]
+                or client_id in self.queued
+            ):
+                self._write_pending(client_id, current)
+            else:
+                Path(_get_pending_upload_path(client_id)).unlink(missing_ok=True)
+
+        _write_leases.release_if_idle(client_id)
+
+    @staticmethod
+    def _read_pending(client_id: str) -> Dict[str, List[str]]:
+        """Return a client's pending-upload record (lock held)."""
+        try:
+            with open(_get_pending_upload_path(client_id), encoding="utf-8") as f:
+                pending = json.load(f)
+        except FileNotFoundError:
+            pending = {}
+        for key in ("files", "retired", "vault"):
+            pending.setdefault(key, [])
+        return pending
+
+    @staticmethod
+    def _write_pending(client_id: str, pending: Dict[str, List[str]]) -> None:
+        """Atomically write a client's pending-upload record (lock held)."""
+        _write_bytes(
+            _get_pending_upload_path(client_id),
+            json.dumps(pending).encode("utf-8"),
+        )
+
+
+_index_uploader = IndexUploader()
+
+
+def recover_index_uploads() -> int:
+    """Schedule uploads left pending by a previous process.
+
+    Temp files from writes the previous process did not finish are removed
+    first.
+    """
+    removed = _remove_partial_writes()
+    if removed:
+        logger.info("Removed %d partial FAISS writes", removed)
+    return _index_uploader.recover()
+
+
+def flush_index_uploads(timeout: Optional[float] = None) -> bool:
+    """Block until pending index uploads finish or the timeout expires."""
+    return _index_uploader.flush(timeout)
+
+
+def get_upload_stats() -> Dict[str, int]:
+    """Return write-behind upload queue statistics."""
+    return _index_uploader.stats()
+
+
+# Cross-worker invalidation
+
+
+def _committed_generation(client_id: str) -> int:
+    """Return the newest generation of a client's manifest known to be in S3.
+
+    Returns 0 when Redis is unavailable, which disables freshness checks
+    rather than failing the caller.
+    """
+    if redis_client is None:
+        return 0
+    try:
+        score = redis_client.zscore(GENERATIONS_KEY, client_id)
+    except Exception as exc:
+        logger.warning("Failed to read FAISS generation for %s: %s", client_id, exc)
+        return 0
+    return int(score or 0)
+
+
+def _commit_generation(client_id: str, generation: int) -> None:
+    """Record that a manifest generation is in S3 and notify other workers.
+
+    The sorted-set update only ever raises the stored generation, so a
+    slow upload of an older manifest cannot roll it back.
+    """
+    if redis_client is None:
+        return
+    try:
+        redis_client.zadd(GENERATIONS_KEY, {client_id: generation}, gt=True)
+        redis_client.publish(
+            INVALIDATION_CHANNEL,
+            json.dumps({"client_id": client_id, "generation": generation}),
+        )
+    except Exception as exc:
+        logger.warning(
+            "Failed to publish FAISS generation %d for %s: %s",
+            generation,
+            client_id,
+            exc,
+        )
+
+
+def invalidate_index(client_id: str, generation: int) -> bool:
+    """Drop local copies of a client's index older than ``generation``.
+
+    The in-memory copy is discarded and a stale local manifest removed, so
+    the next load fetches the current manifest from S3. Segment files are
+    immutable and stay on disk.
+
+    Returns:
+        True if anything was invalidated.
+    """
+    invalidated = False
+
+    cached = _index_cache.peek(client_id)
+    if cached is not None and cached.generation < generation:
+        _index_cache.discard(client_id)
+        invalidated = True
+
+    local = _read_local_manifest(client_id)
+    if local is not None and local.get("generation", 0) < generation:
+        Path(_get_manifest_path(client_id)).unlink(missing_ok=True)
+        invalidated = True
+
+    if invalidated:
+        logger.info(
+            "Invalidated FAISS index for client %s (generation %d)",
+            client_id,
+            generation,
+        )
+    return invalidated
+
+
+class IndexInvalidationListener:
+    """Background subscriber applying other workers' index invalidations.
+
+    On every (re)subscription it also re-checks cached indexes against the
+    generations in Redis, covering messages missed while disconnected.
+    """
+
+    def __init__(self, reconnect_delay: float = 5.0) -> None:
+        """Initialize the listener.
+
+        Args:
+            reconnect_delay: Seconds to wait before resubscribing after a
+                Redis error.
+        """
+        self.reconnect_delay = reconnect_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the subscriber thread if Redis is configured."""
+        if redis_client is None or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="faiss-invalidation",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Signal the subscriber thread to exit."""
+        self._stop.set()
+
+    def _run(self) -> None:
+        """Subscribe and apply invalidations until stopped."""
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                self._revalidate_cached()
+
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._handle(message["data"])
+            except Exception as exc:
+                logger.warning("FAISS invalidation listener error: %s", exc)
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    @staticmethod
+    def _handle(data: str) -> None:
+        """Apply one invalidation message."""
+        try:
+            payload = json.loads(data)
+            invalidate_index(payload["client_id"], int(payload["generation"]))
+        except Exception as exc:
+            logger.warning("Bad FAISS invalidation message %r: %s", data, exc)
+
+    @staticmethod
+    def _revalidate_cached() -> None:
+        """Invalidate cached indexes older than their committed generation."""
+        with _index_cache.lock:
+            client_ids = list(_index_cache.cache)
+        for client_id in client_ids:
+            invalidate_index(client_id, _committed_generation(client_id))
+
+
+_invalidation_listener = IndexInvalidationListener()
+
+
+def start_invalidation_listener() -> None:
+    """Start applying index invalidations published by other workers."""
+    _invalidation_listener.start()
+
+
+def stop_invalidation_listener() -> None:
+    """Stop the invalidation subscriber."""
+    _invalidation_listener.stop()
+
+
+# Write serialization
+
+
+class IndexLeaseError(RuntimeError):
+    """Raised when another worker holds a client's write lease too long."""
+
+
+@dataclass
+class _WriteLease:
+    """A held write lease and the number of mutations running under it."""
+
+    lock: Any
+    active: int = 0
+
+
+class WriteLeaseManager:
+    """Redis leases giving one worker at a time the right to mutate an index.
+
+    A lease is taken before a mutation reads the manifest and is kept until
+    the worker's uploads for that client are in S3, so the next holder
+    always starts from the latest committed manifest. The uploader extends
+    held leases while it retries. Without Redis, leases are not enforced.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        wait: Optional[float] = None,
+    ) -> None:
+        """Initialize the lease manager.
+
+        Args:
+            ttl: Seconds a lease lives without being extended. Defaults to
+                ``settings.FAISS_WRITE_LEASE_TTL``.
+            wait: Seconds to wait for a lease held by another worker.
+                Defaults to ``settings.FAISS_WRITE_LEASE_WAIT``.
+        """
+        self.ttl = settings.FAISS_WRITE_LEASE_TTL if ttl is None else ttl
+        self.wait = settings.FAISS_WRITE_LEASE_WAIT if wait is None else wait
+        self.leases: Dict[str, _WriteLease] = {}
+        self.lock = Lock()
+
+    @contextmanager
+    def hold(self, client_id: str) -> Iterator[None]:
+        """Hold a client's write lease for the duration of a mutation.
+
+        Raises:
+            IndexLeaseError: If another worker keeps the lease past ``wait``.
+        """
+        self._acquire(client_id)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.leases[client_id].active -= 1
+            self.release_if_idle(client_id)
+
+    def adopt(self, client_id: str) -> None:
+        """Take a client's lease for uploads only, without waiting.
+
+        The lease is released once the client's pending uploads are done.
+
+        Raises:
+            IndexLeaseError: If another worker holds the lease.
+        """
+        self._acquire(client_id, wait=0, active=0)
+
+    def extend(self, client_id: str) -> None:
+        """Reset the TTL of a lease this worker holds."""
+        with self.lock:
+            lease = self.leases.get(client_id)
+        if lease is None or lease.lock is None:
+            return
+        try:
+            lease.lock.extend(self.ttl, replace_ttl=True)
+        except Exception as exc:
+            logger.error(
+                "Lost FAISS write lease for client %s with writes pending: %s",
+                client_id,
+                exc,
+            )
+
+    def release_if_idle(self, client_id: str) -> None:
+        """Release a lease once no mutation or upload needs it."""
+        with self.lock:
+            lease = self.leases.get(client_id)
+            if lease is None or lease.active or _index_uploader.has_pending(client_id):
+                return
+            del self.leases[client_id]
+
+        if lease.lock is None:
+            return
+        try:
+            lease.lock.release()
+        except Exception as exc:
+            logger.warning(
+                "Failed to release FAISS write lease for %s: %s", client_id, exc
+            )
+
+    def _acquire(
+        self, client_id: str, wait: Optional[float] = None, active: int = 1
+    ) -> None:
+        """Take or re-enter a client's lease.
+
+        Args:
+            client_id: Client whose lease to take.
+            wait: Seconds to wait for the lease. Defaults to ``self.wait``.
+            active: Mutations to count as running under the lease.
+        """
+        wait = self.wait if wait is None else wait
+        with self.lock:
+            lease = self.leases.get(client_id)
+            if lease is not None:
+                lease.active += active
+        if lease is not None:
+            self.extend(client_id)
+            return
+
+        lock = None
+        if redis_client is not None:
+            lock = redis_client.lock(
+                f"{WRITE_LEASE_PREFIX}{client_id}",
+                timeout=self.ttl,
+                blocking_timeout=wait,
+                thread_local=False,
+            )
+            try:
+                acquired = lock.acquire()
+            except Exception as exc:
+                logger.warning(
+                    "FAISS write lease unavailable for %s, writing without it: %s",
+                    client_id,
+                    exc,
+                )
+                acquired, lock = True, None
+            if not acquired:
+                raise IndexLeaseError(
+                    f"Timed out waiting {wait}s for the write lease of "
+                    f"client {client_id}"
+                )
+
+        with self.lock:
+            self.leases[client_id] = _WriteLease(lock, active=active)
+
+
+@dataclass
+class _WriteRequest:
+    """One queued mutation: either vectors to add or a job to run."""
+
+    future: Future
+    vectors: Optional[np.ndarray] = None
+    metadata: Optional[List[Dict]] = None
+    plan: Optional[str] = None
+    job: Optional[Callable[[], Any]] = None
+
+
+class IndexWriter:
+    """Serializes mutations of each client's index and batches additions.
+
+    The first caller for an idle client becomes its writer and runs queued
+    requests in order until the queue is empty; later callers wait for
+    their result. Additions that queue up behind a running mutation are
+    written together as one segment, with one manifest update and one
+    upload.
+    """
+
+    def __init__(self, max_batch_vectors: Optional[int] = None) -> None:
+        """Initialize the writer.
+
+        Args:
+            max_batch_vectors: Most vectors folded into one segment.
+                Defaults to ``settings.FAISS_WRITE_BATCH_MAX_VECTORS``.
+        """
+        self.max_batch_vectors = (
+            settings.FAISS_WRITE_BATCH_MAX_VECTORS
+            if max_batch_vectors is None
+            else max_batch_vectors
+        )
+        self.queues: Dict[str, Deque[_WriteRequest]] = {}
+        self.batches = 0
+        self.requests = 0
+        self.lock = Lock()
+
+    def add(
+        self,
+        client_id: str,
+        vectors: np.ndarray,
+        metadata: List[Dict],
+        plan: Optional[str] = None,
+    ) -> Dict:
+        """Append vectors as (part of) a new segment.
+
+        Returns:
+            The manifest the vectors were published in.
+        """
+        return self._submit(
+            client_id,
+            _WriteRequest(Future(), vectors=vectors, metadata=metadata, plan=plan),
+        )
+
+    def run(self, client_id: str, job: Callable[[], T]) -> T:
+        """Run ``job`` as the only mutation of a client's index."""
+        return self._submit(client_id, _WriteRequest(Future(), job=job))
+
+    def stats(self) -> Dict[str, int]:
+        """Return queued, written-batch and request counters."""
+        with self.lock:
+            return {
+                "queued": sum(len(q) for q in self.queues.values()),
+                "batches": self.batches,
+                "requests": self.requests,
+            }
+
+    def _submit(self, client_id: str, request: _WriteRequest) -> Any:
+        """Queue a request, draining the queue if no writer is active."""
+        with self.lock:
+            self.requests += 1
+            pending = self.queues.get(client_id)
+            leader = pending is None
+            if leader:
+                pending = self.queues[client_id] = deque()
+            pending.append(request)
+
+        if leader:
+            self._drain(client_id)
+        return request.future.result()
+
+    def _drain(self, client_id: str) -> None:
+        """Run a client's queued requests until none are left."""
+        while True:
+            with self.lock:
+                pending = self.queues[client_id]
+                if not pending:
+                    del self.queues[client_id]
+                    return
+                batch = self._take_batch(pending)
+                self.batches += 1
+
+            try:
+                with _write_leases.hold(client_id), _disk_cache.use(client_id):
+                    if batch[0].job is not None:
+                        batch[0].future.set_result(batch[0].job())
+                    else:
+                        _write_batch(client_id, batch)
+            except BaseException as exc:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(exc)
+                if not isinstance(exc, Exception):
+                    raise
+
+    def _take_batch(self, pending: Deque[_WriteRequest]) -> List[_WriteRequest]:
+        """Pop the next job, or a run of additions within the batch limit."""
+        first = pending.popleft()
+        batch = [first]
+        if first.job is not None:
+            return batch
+
+        total = len(first.vectors)
+        while (
+            pending
+            and pending[0].job is None
+            and total + len(pending[0].vectors) <= self.max_batch_vectors
+        ):
+            total += len(pending[0].vectors)
+            batch.append(pending.popleft())
+        return batch
+
+
+def _write_batch(client_id: str, batch: Sequence[_WriteRequest]) -> None:
+    """Write queued additions as one segment and resolve their futures.
+
+    The segment is built as the index kind the client's size after the
+    batch calls for, with the metric of the existing index. Requests whose
+    dimension does not match the index, or whose packed tenant has moved to
+    its own index, fail on their own without affecting the rest of the
+    batch.
+    """
+    manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+    dimension = (
+        manifest["dimension"] if manifest is not None else batch[0].vectors.shape[1]
+    )
+
+    moved = set((manifest or {}).get("dedicated", []))
+    accepted = []
+    for request in batch:
+        if request.vectors.shape[1] != dimension:
+            request.future.set_exception(
+                ValueError(
+                    f"Index dim mismatch: index={dimension}, \
+vector_dim={request.vectors.shape[1]}"
+                )
+            )
+        elif moved and request.metadata[0].get("client_id") in moved:
+            request.future.set_exception(_TenantMoved(request.metadata[0]["client_id"]))
+        else:
+            accepted.append(request)
+    if not accepted:
+        return
+
+    metric = (
+        manifest.get("metric", METRIC_L2)
+        if manifest is not None and manifest["segments"]
+        else choose_metric()
+    )
+    vectors = prepare_vectors(
+        np.vstack([request.vectors for request in accepted]), metric
+    )
+    plans = [request.plan for request in accepted if request.plan is not None]
+    plan = plans[-1] if plans else (manifest or {}).get("plan")
+    existing = _live_count(manifest) if manifest is not None else 0
+    kind = _index_kind_for(client_id, existing + len(vectors), plan)
+
+    id_start = manifest["next_id"] if manifest is not None else 0
+    index = faiss.IndexIDMap(create_index(dimension, kind, vectors, metric))
+    index.add_with_ids(
+        vectors,
+        np.arange(id_start, id_start + len(vectors), dtype="int64"),
+    )
+
+    rows: List[Dict] = []
+    for request in accepted:
+        rows.extend(request.metadata)
+
+    tenants = (
+        Counter(row["client_id"] for row in rows) if _is_shard(client_id) else None
+    )
+    manifest = _append_segment(client_id, index, rows, plan, tenants)
+    for request in accepted:
+        request.future.set_result(manifest)
+
+
+_write_leases = WriteLeaseManager()
+_index_writer = IndexWriter()
+
+
+def save_search_tuning(client_id: str, tuning: Dict) -> bool:
+    """Record a tenant's efSearch tuning in its manifest.
+
+    The tuning is stamped with the manifest's current index kind and
+    ignored once the index migrates to another kind.
+
+    Args:
+        client_id: Client whose index was tuned.
+        tuning: Tuning result with ``profile`` and ``recommended`` keys
+            (see ``scripts/tune_ef_search.py``).
+
+    Returns:
+        False if the client has no index.
+    """
+
+    def update() -> bool:
+        with _manifest_lock(client_id):
+            manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+            if manifest is None:
+                return False
+            manifest["generation"] = _next_generation(client_id, manifest)
+            manifest["search_tuning"] = dict(
+                tuning, index_kind=manifest.get("index_kind")
+            )
+            _write_manifest(client_id, manifest)
+            _refresh_cache(client_id, manifest, [])
+
+        _index_uploader.enqueue(client_id)
+        return True
+
+    return _index_writer.run(client_id, update)
+
+
+def build_lexical_indexes(client_id: str) -> int:
+    """Write the missing ``.terms`` files of a client's segments.
+
+    Segments written before lexical indexes are not searched lexically
+    until they have one. This builds them offline, from the segments'
+    chunk texts, and publishes them in the manifest.
+
+    Returns:
+        The number of segments indexed.
+    """
+
+    def build() -> int:
+        manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+        missing = [
+            entry
+            for entry in (manifest or {}).get("segments", [])
+            if not _has_lexical_file(entry)
+        ]
+        built = {}
+        for entry in missing:
+            segment = _read_segment(client_id, entry)
+            path = _get_segment_terms_path(client_id, segment.name)
+            texts = segment.metadata.texts()
+            _atomic_write(path, lambda p, texts=texts: LexicalIndex.write(p, texts))
+            built[segment.name] = (segment, _file_info(path))
+        if not built:
+            return 0
+
+        with _manifest_lock(client_id):
+            manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+            updated = []
+            for entry in manifest["segments"]:
+                if entry["name"] not in built or _has_lexical_file(entry):
+                    continue
+                segment, info = built[entry["name"]]
+                entry.setdefault("files", {})[f"{segment.name}.terms"] = info
+                updated.append(
+                    replace(
+                        segment,
+                        files=entry["files"],
+                        lexical=LexicalIndex.open(
+                            _get_segment_terms_path(client_id, segment.name)
+                        ),
+                    )
+                )
+            manifest["generation"] = _next_generation(client_id, manifest)
+            _write_manifest(client_id, manifest)
+            _refresh_cache(client_id, manifest, updated)
+
+        _index_uploader.enqueue(
+            client_id, [f"{segment.name}.terms" for segment in updated]
+        )
+        return len(updated)
+
+    return _index_writer.run(client_id, build)
+
+
+def get_writer_stats() -> Dict[str, int]:
+    """Return per-client write queue statistics."""
+    return _index_writer.stats()
+
+
+# Background compaction
+
+_compaction_lock = Lock()
+_compactions_pending: set[str] = set()
+
+
+def _reconstruct_vectors(index: faiss.Index) -> np.ndarray:
+    """Return every stored vector of a flat-storage FAISS index, by row."""
+    if not isinstance(index, MappedFlatIndex):
+        index = faiss.downcast_index(index)
+        if hasattr(index, "id_map"):
+            index = faiss.downcast_index(index.index)
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype="float32")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _restore_vault_vectors(
+    client_id: str, vectors: np.ndarray, rows: List[Dict]
+) -> int:
+    """Replace reconstructed vectors with their raw embeddings from the vault.
+
+    Reconstructing sq8 or fp16 storage is lossy, and re-encoding it would
+    compound the error at every compaction. A document's live rows, in id
+    order, take its vault vectors when the counts match.
+
+    Args:
+        client_id: Client or packed shard the rows belong to.
+        vectors: Reconstructed vectors, one per row; updated in place.
+        rows: Metadata rows in id order.
+
+    Returns:
+        Number of rows restored from the vault.
+    """
+    positions: Dict[Tuple[str, str], List[int]] = {}
+    shard = _is_shard(client_id)
+    for i, row in enumerate(rows):
+        document_id = row.get("document_id")
+        if document_id is None:
+            continue
+        owner = row.get("client_id", client_id) if shard else client_id
+        positions.setdefault((owner, document_id), []).append(i)
+
+    restored = 0
+    for (owner, document_id), found in positions.items():
+        try:
+            vault = load_embeddings(owner, document_id)
+        except (ClientError, ValueError):
+            continue
+        if vault.vectors.shape != (len(found), vectors.shape[1]):
+            continue
+        vectors[found] = vault.vectors
+        restored += len(found)
+    return restored
+
+
+def compact_index(client_id: str, plan: Optional[str] = None) -> bool:
+    """Merge a client's segments into one, dropping tombstoned vectors.
+
+    The merged segment is built as the index kind the client's live vector
+    count and plan call for, which is also how tenants migrate between
+    kinds and storage formats. The merge is built outside the client's
+    writer; only the manifest swap is serialized with other mutations. Ids
+    are preserved, so segments appended and documents deleted while the
+    merge runs stay correct. Vectors are taken from the embedding vault,
+    falling back to reconstructing them from the segments for documents
+    not stored there.
+
+    Args:
+        client_id: Client whose index to compact.
+        plan: The client's current plan type. Defaults to the plan
+            recorded in the manifest, and is recorded there if given.
+
+    Returns:
+        True if segments were merged, False if there was nothing to do or
+        the segments were rewritten concurrently.
+    """
+    client_index = load_index(client_id)
+    segments = list(client_index.segments)
+    if not segments:
+        return False
+
+    if plan is None:
+        plan = (_fetch_manifest(client_id) or {}).get("plan")
+    kind = _index_kind_for(
+        client_id, client_index.ntotal - client_index.n_deleted, plan
+    )
+    metric = choose_metric()
+
+    if (
+        len(segments) < 2
+        and not client_index.n_deleted
+        and index_kind_of(segments[0].index) == kind
+        and segments[0].metric == metric
+    ):
+        return False
+
+    vectors, ids, rows = [], [], []
+    for segment in segments:
+        live = np.flatnonzero(~segment.deleted)
+        vectors.append(_reconstruct_vectors(segment.index)[live])
+        ids.append(segment.ids[live])
+        rows.extend(segment.metadata.rows(live))
+
+    ids = np.concatenate(ids)
+    order = np.argsort(ids, kind="stable")
+    vectors = np.vstack(vectors)[order]
+    rows = [rows[i] for i in order]
+    restored = _restore_vault_vectors(client_id, vectors, rows)
+    if restored < len(rows):
+        logger.warning(
+            "Compacting %d of %d vectors of client %s from their stored "
+            "encoding: not in the embedding vault",
+            len(rows) - restored,
+            len(rows),
+            client_id,
+        )
+    vectors = prepare_vectors(vectors, metric)
+    merged = faiss.IndexIDMap(create_index(segments[0].index.d, kind, vectors, metric))
+    merged.add_with_ids(vectors, ids[order])
+
+    retired = [segment.name for segment in segments]
+    if not _index_writer.run(
+        client_id,
+        lambda: _replace_segments(
+            client_id,
+            retired,
+            merged,
+            rows,
+            applied_tombstones=client_index.tombstones,
+            plan=plan,
+        ),
+    ):
+        return False
+
+    logger.info(
+        "Compacted %d FAISS segments into %s (%d vectors, %d dropped) for client %s",
+        len(segments),
+        kind,
+        merged.ntotal,
+        client_index.n_deleted,
+        client_id,
+    )
+    return True
+
+
+def _run_compaction(client_id: str) -> None:
+    """Compaction thread body."""
+    try:
+        compact_index(client_id)
+    except Exception as exc:
+        logger.error("FAISS compaction failed for client %s: %s", client_id, exc)
+    finally:
+        with _compaction_lock:
+            _compactions_pending.discard(client_id)
+
+
+def _schedule_compaction(client_id: str) -> None:
+    """Start a background compaction unless one is already pending."""
+    with _compaction_lock:
+        if client_id in _compactions_pending:
+            return
+        _compactions_pending.add(client_id)
+
+    threading.Thread(
+        target=_run_compaction,
+        args=(client_id,),
+        name=f"faiss-compact-{client_id}",
+        daemon=True,
+    ).start()
+
+
+# Embedding vault
+
+
+def save_embeddings(
+    client_id: str,
+    document_id: str,
+    embeddings: List[List[float]],
+    metadata_list: List[Dict],
+    model: Optional[str] = None,
+) -> None:
+    """Persist a document's raw embeddings and chunk metadata.
+
+    Writes the vault file locally and queues a compressed copy for upload
+    to S3 by the index uploader, like index segments.
+
+    Args:
+        client_id: Client owning the document.
+        document_id: Document the embeddings belong to.
+        embeddings: One vector per chunk.
+        metadata_list: One metadata row per vector, as indexed.
+        model: Embedding model that produced the vectors.
+
+    Raises:
+        ValueError: If the row count does not match the vector count.
+    """
+    data = EmbeddingVaultFile.encode(
+        np.asarray(embeddings, dtype="float32"),
+        metadata_list,
+        document_id=document_id,
+        model=model,
+    )
+    with _disk_cache.use(client_id):
+        _write_bytes(_get_vault_path(client_id, document_id), data)
+        _index_uploader.enqueue(client_id, vault=[document_id])
+    _disk_cache.touch(client_id)
+    logger.info(
+        "Stored %d raw embeddings of document %s for client %s",
+        len(metadata_list),
+        document_id,
+        client_id,
+    )
+
+
+def load_embeddings(client_id: str, document_id: str) -> EmbeddingVaultFile:
+    """Return a document's raw embeddings, fetching them from S3 if needed.
+
+    Raises:
+        ClientError: If the document has no embeddings in S3.
+        ValueError: If the S3 copy is corrupt.
+    """
+    path = _get_vault_path(client_id, document_id)
+    if os.path.exists(path):
+        try:
+            return EmbeddingVaultFile.open(path)
+        except ValueError as exc:
+            logger.warning("Re-downloading corrupt vault file %s: %s", path, exc)
+
+    data = decompress(download_file(_s3_vault_key(client_id, document_id)))
+    _write_bytes(path, data)
+    return EmbeddingVaultFile.open(path)
+
+
+def delete_embeddings(client_id: str, document_id: str) -> None:
+    """Remove a document's raw embeddings locally and from S3."""
+    Path(_get_vault_path(client_id, document_id)).unlink(missing_ok=True)
+    if not delete_file(_s3_vault_key(client_id, document_id)):
+        logger.error(
+            "Failed to delete raw embeddings of document %s for client %s",
+            document_id,
+            client_id,
+        )
+
+
+# Rebuilds
+
+
+def get_document_chunks(client_id: str, document_id: str) -> List[Dict]:
+    """Return the live chunk metadata rows of one document, in id order."""
+    rows: List[Dict] = []
+    for segment in load_tenant_index(client_id).segments:
+        document_ids = segment.metadata.document_ids
+        if document_id not in document_ids:
+            continue
+        code = document_ids.index(document_id)
+        matches = (segment.metadata.document_codes == code) & ~segment.deleted
+        rows.extend(segment.metadata.rows(np.flatnonzero(matches)))
+    for row in rows:
+        row.pop("client_id", None)
+    return rows
+
+
+def _live_document_ids(
+    client_index: ClientIndex, tenant: Optional[str] = None
+) -> List[str]:
+    """Return the ids of documents with live vectors, in first-seen order.
+
+    In a packed shard, ``tenant`` limits them to that tenant's documents.
+    """
+    seen: Dict[str, None] = {}
+    for segment in client_index.segments:
+        live = ~segment.deleted if tenant is None else segment.tenant_rows(tenant)
+        codes = segment.metadata.document_codes[live]
+        names = segment.metadata.document_ids
+        for code in np.unique(codes[codes >= 0]):
+            seen.setdefault(names[code], None)
+    return list(seen)
+
+
+def _document_vectors(
+    client_id: str,
+    document_id: str,
+    embed: Optional[Callable[[List[str]], List[List[float]]]],
+) -> Tuple[np.ndarray, List[Dict], bool]:
+    """Return a document's vectors and rows from the vault or its chunks.
+
+    Returns:
+        Vectors, rows, and whether the vectors had to be re-embedded.
+
+    Raises:
+        IndexIntegrityError: If the document is not in the vault and cannot
+            be re-embedded.
+    """
+    try:
+        vault = load_embeddings(client_id, document_id)
+        return np.array(vault.vectors), list(vault.chunks), False
+    except (ClientError, ValueError) as exc:
+        if embed is None:
+            raise IndexIntegrityError(
+                f"Document {document_id} has no stored vectors: {exc}"
+            ) from exc
+
+    rows = get_document_chunks(client_id, document_id)
+    texts = [row.get("text") for row in rows]
+    if not rows or not all(isinstance(text, str) for text in texts):
+        raise IndexIntegrityError(
+            f"Document {document_id} has no stored vectors or chunk text"
+        )
+
+    embeddings = embed(texts)
+    save_embeddings(client_id, document_id, embeddings, rows)
+    return np.asarray(embeddings, dtype="float32"), rows, True
+
+
+def rebuild_index(
+    client_id: str,
+    plan: Optional[str] = None,
+    expected: Optional[Dict[str, int]] = None,
+    embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Rebuild a client's index from stored vectors and swap it in.
+
+    Every document with live vectors, plus every document in ``expected``,
+    is rebuilt from the embedding vault. Documents missing from the vault
+    are re-embedded from their stored chunk text if ``embed`` is given.
+    The new index is built as the kind the client's size and plan call
+    for, verified, and only then swapped in place of the segments it was
+    built from, in one manifest update. Segments appended while the
+    rebuild runs are kept. A packed tenant's rows are rebuilt inside its
+    shard instead.
+
+    Args:
+        client_id: Client whose index to rebuild.
+        plan: The client's plan type.
+        expected: Chunk count of each document the index must contain.
+        embed: Blocking function embedding a list of texts, used for
+            documents missing from the vault.
+
+    Returns:
+        Counts of the rebuild, or None if there was nothing to rebuild or
+        the index was rewritten or had documents deleted concurrently.
+
+    Raises:
+        IndexIntegrityError: If a document cannot be rebuilt or its vector
+            count does not match ``expected``. The index is left untouched.
+    """
+    expected = expected or {}
+    packed = _packed_index(client_id)
+    snapshot = packed if packed is not None else load_index(client_id)
+    tenant = client_id if packed is not None else None
+    document_ids = list(
+        dict.fromkeys(_live_document_ids(snapshot, tenant) + list(expected))
+    )
+    if not document_ids:
+        return None
+
+    vectors, rows, reembedded = [], [], 0
+    for document_id in document_ids:
+        doc_vectors, doc_rows, fresh = _document_vectors(client_id, document_id, embed)
+        if document_id in expected and len(doc_rows) != expected[document_id]:
+            raise IndexIntegrityError(
+                f"Document {document_id} has {len(doc_rows)} vectors, "
+                f"expected {expected[document_id]}"
+            )
+        vectors.append(doc_vectors)
+        rows.extend(doc_rows)
+        reembedded += fresh
+
+    if packed is not None:
+        return _rebuild_packed(
+            client_id, snapshot, np.vstack(vectors), rows, len(document_ids), reembedded
+        )
+
+    metric = choose_metric()
+    vectors = prepare_vectors(np.vstack(vectors), metric)
+    kind = choose_index_kind(len(vectors), plan)
+    index = create_index(vectors.shape[1], kind, vectors, metric)
+    index.add(vectors)
+    if index.ntotal != len(rows):
+        raise IndexIntegrityError(
+            f"Rebuilt index has {index.ntotal} vectors but {len(rows)} rows"
+        )
+
+    def swap() -> bool:
+        manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+        if manifest is not None and manifest["tombstones"] != snapshot.tombstones:
+            logger.warning(
+                "Skipped FAISS rebuild for client %s: documents deleted meanwhile",
+                client_id,
+            )
+            return False
+        return _replace_segments(
+            client_id,
+            [segment.name for segment in snapshot.segments],
+            index,
+            rows,
+            applied_tombstones=snapshot.tombstones,
+            plan=plan,
+        )
+
+    if not _index_writer.run(client_id, swap):
+        return None
+
+    logger.info(
+        "Rebuilt FAISS index for client %s as %s (%d vectors, %d documents)",
+        client_id,
+        kind,
+        index.ntotal,
+        len(document_ids),
+    )
+    return {
+        "kind": kind,
+        "vectors": int(index.ntotal),
+        "documents": len(document_ids),
+        "reembedded": reembedded,
+        "replaced_vectors": snapshot.ntotal - snapshot.n_deleted,
+    }
+
+
+# Packed tenants
+
+
+class _TenantMoved(Exception):
+    """A packed write lost the race with its tenant's move to its own index."""
+
+
+def _shard_of(client_id: str) -> Optional[str]:
+    """Return the packed shard a client hashes to, or None if packing is off."""
+    if settings.FAISS_PACKED_SHARDS <= 0:
+        return None
+    shard = zlib.crc32(client_id.encode("utf-8")) % settings.FAISS_PACKED_SHARDS
+    return f"{PACKED_SHARD_PREFIX}{shard:04d}"
+
+
+def _is_shard(client_id: str) -> bool:
+    """Return True if an index name belongs to a packed shard."""
+    return client_id.startswith(PACKED_SHARD_PREFIX)
+
+
+def _index_kind_for(client_id: str, ntotal: int, plan: Optional[str]) -> str:
+    """Return the index kind for a client; packed shards are always flat."""
+    return choose_index_kind(0 if _is_shard(client_id) else ntotal, plan)
+
+
+def _count_tenants(manifest: Dict, changes: Dict[str, int]) -> None:
+    """Apply changes in live vectors per tenant to a shard manifest."""
+    tenants = manifest.setdefault("tenants", {})
+    for tenant, change in changes.items():
+        count = tenants.get(tenant, 0) + change
+        if count > 0:
+            tenants[tenant] = count
+        else:
+            tenants.pop(tenant, None)
+
+
+def _load_shard(shard: str) -> ClientIndex:
+    """Load a packed shard, caching an empty one if it was never written.
+
+    The empty entry is replaced as soon as the shard's first manifest is
+    written or announced, so cold shards cost no S3 lookups per search.
+    """
+    try:
+        return load_index(shard)
+    except FileNotFoundError:
+        empty = ClientIndex()
+        _index_cache.put(shard, empty)
+        return empty
+
+
+def _packed_index(client_id: str) -> Optional[ClientIndex]:
+    """Return the shard holding a packed client, or None if not packed."""
+    shard = _shard_of(client_id)
+    if shard is None:
+        return None
+    shard_index = _load_shard(shard)
+    return shard_index if client_id in shard_index.tenants else None
+
+
+def load_tenant_index(client_id: str) -> ClientIndex:
+    """Return the index serving a client: its packed shard or its own index.
+
+    Raises:
+        FileNotFoundError: If the client has no vectors in either.
+    """
+    packed = _packed_index(client_id)
+    return packed if packed is not None else load_index(client_id)
+
+
+def _gather_vectors(segment: IndexSegment, rows: np.ndarray) -> np.ndarray:
+    """Return the stored vectors of some rows of a segment."""
+    if isinstance(segment.searcher, MappedFlatIndex):
+        return segment.searcher.vectors[rows]
+    return segment.searcher.reconstruct_batch(rows)
+
+
+def _tenant_ids(client_index: ClientIndex, client_id: str) -> np.ndarray:
+    """Return the ids of a packed tenant's live vectors."""
+    ids = [
+        segment.ids[segment.tenant_rows(client_id)] for segment in client_index.segments
+    ]
+    return np.concatenate(ids) if ids else np.empty(0, dtype="int64")
+
+
+def _packed_shard_for_write(
+    client_id: str, n: int, plan: Optional[str]
+) -> Optional[str]:
+    """Return the shard to write ``n`` new vectors of a client to, if any.
+
+    New clients are packed unless the write alone is too large or they
+    already have an index of their own. A packed client that would outgrow
+    ``FAISS_PACKED_MAX_VECTORS`` is moved to its own index first.
+    """
+    shard = _shard_of(client_id)
+    if shard is None:
+        return None
+
+    count = _load_shard(shard).tenants.get(client_id)
+    if count is None:
+        if n > settings.FAISS_PACKED_MAX_VECTORS or _fetch_manifest(client_id):
+            return None
+        return shard
+    if count + n <= settings.FAISS_PACKED_MAX_VECTORS:
+        return shard
+
+    _index_writer.run(shard, lambda: _move_to_own_index(shard, client_id, plan))
+    if load_index(shard).tombstone_ratio >= settings.FAISS_TOMBSTONE_COMPACT_RATIO:
+        _schedule_compaction(shard)
+    return None
+
+
+def _move_to_own_index(shard: str, client_id: str, plan: Optional[str]) -> None:
+    """Move a packed client's vectors into an index of its own (writer held).
+
+    The client's index is written before its shard rows are tombstoned,
+    and the shard lists it as dedicated so queued packed writes fail over
+    to the new index. Repeating a move interrupted by a crash rewrites the
+    client's index from scratch.
+    """
+    manifest = _fetch_manifest(shard, _committed_generation(shard))
+    if manifest is None or client_id not in manifest.get("tenants", {}):
+        return
+
+    shard_index = _current_index(shard, manifest)
+    vectors, rows = [], []
+    for segment in shard_index.segments:
+        live = segment.tenant_rows(client_id)
+        vectors.append(_gather_vectors(segment, live))
+        rows.extend(segment.metadata.rows(live))
+    for row in rows:
+        row.pop("client_id", None)
+    ids = _tenant_ids(shard_index, client_id)
+
+    metric = choose_metric()
+    vectors = prepare_vectors(np.vstack(vectors), metric)
+    index = create_index(
+        vectors.shape[1], choose_index_kind(len(vectors), plan), vectors, metric
+    )
+    index.add(vectors)
+    _index_writer.run(
+        client_id,
+        lambda: _replace_segments(client_id, None, index, rows, plan=plan),
+    )
+
+    def dedicate(manifest: Dict) -> None:
+        manifest.setdefault("tenants", {}).pop(client_id, None)
+        manifest.setdefault("dedicated", []).append(client_id)
+
+    _record_tombstones(shard, ids, dedicate)
+    logger.info(
+        "Moved client %s (%d vectors) from %s to its own FAISS index",
+        client_id,
+        len(rows),
+        shard,
+    )
+
+
+def _rebuild_packed(
+    client_id: str,
+    snapshot: ClientIndex,
+    vectors: np.ndarray,
+    rows: List[Dict],
+    documents: int,
+    reembedded: int,
+) -> Optional[Dict[str, Any]]:
+    """Replace a packed client's shard rows with rebuilt vectors.
+
+    The new rows are appended and the old ones tombstoned in one manifest
+    update, unless the client's rows changed since ``snapshot``.
+    """
+    shard = _shard_of(client_id)
+    retired = np.sort(_tenant_ids(snapshot, client_id))
+    rows = [dict(row, client_id=client_id) for row in rows]
+
+    def swap() -> bool:
+        manifest = _fetch_manifest(shard, _committed_generation(shard))
+        current = _current_index(shard, manifest)
+        if not np.array_equal(np.sort(_tenant_ids(current, client_id)), retired):
+            logger.warning(
+                "Skipped FAISS rebuild for client %s: rows changed meanwhile",
+                client_id,
+            )
+            return False
+
+        metric = manifest.get("metric", choose_metric())
+        prepared = prepare_vectors(vectors, metric)
+        kind = _index_kind_for(shard, len(prepared), None)
+        index = faiss.IndexIDMap(
+            create_index(prepared.shape[1], kind, prepared, metric)
+        )
+        index.add_with_ids(
+            prepared,
+            np.arange(manifest["next_id"], manifest["next_id"] + len(prepared)),
+        )
+        _append_segment(
+            shard,
+            index,
+            rows,
+            tenants={client_id: len(rows) - retired.size},
+            tombstones=retired,
+        )
+        return True
+
+    if not _index_writer.run(shard, swap):
+        return None
+
+    logger.info(
+        "Rebuilt %d packed vectors of client %s in %s", len(rows), client_id, shard
+    )
+    return {
+        "kind": _index_kind_for(shard, len(rows), None),
+        "vectors": len(rows),
+        "documents": documents,
+        "reembedded": reembedded,
+        "replaced_vectors": int(retired.size),
+    }
+
+
+# FAISS operations
+
+
+def create_index(
+    dimension: int = 1536,
+    kind: str = INDEX_HNSW,
+    training: Optional[np.ndarray] = None,
+    metric: str = METRIC_L2,
+) -> faiss.Index:
+    """Create a new, empty FAISS index of the given kind.
+
+    Args:
+        dimension: Vector dimension.
+        kind: Index kind (see ``index_factory``). Defaults to HNSW.
+        training: Sample vectors for kinds that need training.
+        metric: ``l2`` or ``cosine``. Cosine indexes expect vectors
+            normalized with ``prepare_vectors``.
+    """
+    return build_index(kind, dimension, training, metric)
+
+
+def add_to_index(
+    client_id: str,
+    embeddings: List[List[float]],
+    metadata_list: List[Dict],
+    plan: Optional[str] = None,
+) -> None:
+    """Add embeddings and metadata to a client's FAISS index.
+
+    The vectors are written as a new segment; existing segments are not
+    loaded, rewritten, or re-uploaded. Concurrent additions for the same
+    client are serialized and may share a segment.
+
+    Args:
+        client_id: Client owning the index.
+        embeddings: One vector per chunk.
+        metadata_list: One metadata row per vector.
+        plan: The client's plan type, used to choose the index kind.
+
+    Small tenants are written to their packed shard, if packing is on.
+    """
+    if not embeddings:
+        logger.warning("No embeddings provided for client %s", client_id)
+        return
+
+    vectors = np.asarray(embeddings, dtype="float32")
+
+    if vectors.ndim != 2:
+        raise ValueError("Embeddings must be a 2D array")
+
+    if len(metadata_list) != vectors.shape[0]:
+        raise ValueError(
+            f"Metadata count mismatch: vectors={vectors.shape[0]}, \
+metadata={len(metadata_list)}"
+        )
+
+    target = _packed_shard_for_write(client_id, len(vectors), plan)
+    if target is not None:
+        rows = [dict(row, client_id=client_id) for row in metadata_list]
+        try:
+            manifest = _index_writer.add(target, vectors, rows)
+        except _TenantMoved:
+            target = None
+    if target is None:
+        target = client_id
+        manifest = _index_writer.add(client_id, vectors, metadata_list, plan)
+
+    logger.info(
+        "Added %d vectors to FAISS index %s for client %s",
+        len(embeddings),
+        target,
+        client_id,
+    )
+
+    if len(manifest["segments"]) > settings.FAISS_MAX_SEGMENTS or _needs_migration(
+        manifest
+    ):
+        _schedule_compaction(target)
+
+
+def delete_document(client_id: str, document_id: str) -> int:
+    """Tombstone every vector of a document in a client's index.
+
+    Only the manifest changes; the vectors stay in their segments, masked
+    out of searches, until compaction drops them. Compaction is scheduled
+    once the client's tombstone ratio reaches
+    ``settings.FAISS_TOMBSTONE_COMPACT_RATIO``.
+
+    Returns:
+        Number of vectors deleted.
+    """
+    deleted, target = 0, _shard_of(client_id)
+    if _packed_index(client_id) is not None:
+        deleted = _index_writer.run(
+            target, lambda: _tombstone_document(target, document_id, client_id)
+        )
+    if not deleted:
+        # Not packed, or moved to its own index since the check.
+        target = client_id
+        deleted = _index_writer.run(
+            client_id, lambda: _tombstone_document(client_id, document_id)
+        )
+    if not deleted:
+        return 0
+
+    logger.info(
+        "Deleted %d vectors of document %s for client %s",
+        deleted,
+        document_id,
+        client_id,
+    )
+    delete_embeddings(client_id, document_id)
+    if load_index(target).tombstone_ratio >= settings.FAISS_TOMBSTONE_COMPACT_RATIO:
+        _schedule_compaction(target)
+    return deleted
+
+
+def _current_index(client_id: str, manifest: Dict) -> ClientIndex:
+    """Return the loaded index, reloaded if older than ``manifest``."""
+    client_index = load_index(client_id)
+    if client_index.generation != manifest["generation"]:
+        _index_cache.discard(client_id)
+        client_index = load_index(client_id)
+    return client_index
+
+
+def _record_tombstones(
+    client_id: str,
+    ids: np.ndarray,
+    update: Optional[Callable[[Dict], None]] = None,
+) -> None:
+    """Tombstone ids in a client's manifest (writer held).
+
+    ``update`` may change the manifest further in the same write.
+    """
+    with _manifest_lock(client_id):
+        manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+        manifest["generation"] = _next_generation(client_id, manifest)
+        manifest["tombstones"] = _merge_ranges(
+            manifest["tombstones"] + _ids_to_ranges(ids)
+        )
+        if update is not None:
+            update(manifest)
+        _write_manifest(client_id, manifest)
+        _refresh_cache(client_id, manifest, [])
+
+    _index_uploader.enqueue(client_id)
+
+
+def _tombstone_document(
+    client_id: str, document_id: str, tenant: Optional[str] = None
+) -> int:
+    """Record tombstones for a document's live vectors (writer held).
+
+    In a packed shard, only ``tenant``'s rows are tombstoned and its live
+    vector count is lowered to match.
+    """
+    manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+    if manifest is None:
+        return 0
+
+    doomed = []
+    for segment in _current_index(client_id, manifest).segments:
+        document_ids = segment.metadata.document_ids
+        if document_id not in document_ids:
+            continue
+        code = document_ids.index(document_id)
+        if tenant is None:
+            matches = np.flatnonzero(
+                (segment.metadata.document_codes == code) & ~segment.deleted
+            )
+        else:
+            rows = segment.tenant_rows(tenant)
+            matches = rows[segment.metadata.document_codes[rows] == code]
+        doomed.append(segment.ids[matches])
+
+    ids = np.concatenate(doomed) if doomed else np.empty(0, dtype="int64")
+    if ids.size == 0:
+        return 0
+
+    _record_tombstones(
+        client_id,
+        ids,
+        (lambda m: _count_tenants(m, {tenant: -int(ids.size)})) if tenant else None,
+    )
+    return int(ids.size)
+
+
+def save_index(
+    client_id: str,
+    index: faiss.Index,
+    metadata: List[Dict],
+) -> None:
+    """Persist a FAISS index as the client's only segment.
+
+    Replaces every existing segment. Used for rebuilds and restores.
+    """
+    _index_writer.run(
+        client_id,
+        lambda: _replace_segments(client_id, None, index, metadata),
+    )
+
+
+def load_index(client_id: str) -> ClientIndex:
+    """Load a client's segmented FAISS index from cache, disk, or S3.
+
+    Concurrent cold loads of the same client share one in-flight load.
+
+    Raises:
+        FileNotFoundError: If the client has no index.
+    """
+    cached = _index_cache.get(client_id)
+    if cached:
+        return cached
+
+    return _index_loads.do(client_id, lambda: _load_uncached(client_id))
+
+
+def _load_uncached(client_id: str) -> ClientIndex:
+    """Read a client's index from disk or S3 and cache it."""
+    cached = _index_cache.get(client_id)
+    if cached:
+        # Another load finished between the cache miss and taking the lead.
+        return cached
+
+    manifest = _fetch_manifest(client_id, _committed_generation(client_id))
+    if manifest is None:
+        raise FileNotFoundError(f"No FAISS index for client {client_id}")
+
+    segments = [_read_segment(client_id, entry) for entry in manifest["segments"]]
+    client_index = _build_client_index(manifest, segments)
+
+    _index_cache.put(client_id, client_index)
+    _disk_cache.touch(client_id)
+    return client_index
+
+
+def backup_index(client_id: str) -> None:
+    """Schedule a re-upload of a client's segments and manifest to S3.
+
+    Call :func:`flush_index_uploads` to wait for the uploads to finish.
+    """
+    manifest = _fetch_manifest(client_id)
+    if manifest is None:
+        raise FileNotFoundError(f"No FAISS index for client {client_id}")
+
+    files: List[str] = []
+    for entry in manifest["segments"]:
+        _read_segment(client_id, entry)
+        files.extend(_segment_filenames(entry["name"], _has_lexical_file(entry)))
+
+    _index_uploader.enqueue(client_id, files)
+
+
+# Async API
+
+
+class VectorstoreOverloadedError(RuntimeError):
+    """Raised when a vectorstore executor's queue is full."""
+
+
+class BoundedExecutor:
+    """Thread pool for blocking vectorstore work with a bounded queue.
+
+    Tracks queued, running, completed and rejected jobs so queue depth can
+    be monitored, and rejects new work once ``max_queue`` jobs are waiting
+    instead of letting latency grow without bound.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        """Initialize the executor.
+
+        Args:
+            name: Pool name used for thread names and metrics.
+            max_workers: Maximum number of jobs running concurrently.
+            max_queue: Maximum number of jobs waiting for a worker.
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.lock = Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"vectorstore-{name}",
+        )
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run ``fn`` on the pool and await its result.
+
+        Raises:
+            VectorstoreOverloadedError: If the queue is full.
+        """
+        with self.lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise VectorstoreOverloadedError(
+                    f"Vectorstore {self.name} queue full ({self.max_queue} waiting)"
+                )
+            self.queued += 1
+
+        future = self._pool.submit(self._call, fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, int]:
+        """Return worker, queue-depth and throughput counters."""
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "running": self.running,
+                "queued": self.queued,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "max_queue": self.max_queue,
+            }
+
+    def _call(self, fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        """Worker-side wrapper that maintains the counters."""
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+
+    def _on_done(self, future: Future) -> None:
+        """Release the queue slot of a job cancelled before it started."""
+        if future.cancelled():
+            with self.lock:
+                self.queued -= 1
+
+
+_io_executor = BoundedExecutor(
+    "io",
+    settings.FAISS_IO_WORKERS,
+    settings.FAISS_EXECUTOR_MAX_QUEUE,
+)
+_search_executor = BoundedExecutor(
+    "search",
+    settings.FAISS_SEARCH_WORKERS,
+    settings.FAISS_EXECUTOR_MAX_QUEUE,
+)
+
+
+def get_executor_stats() -> Dict[str, Dict[str, int]]:
+    """Return queue-depth metrics for the vectorstore executors."""
+    return {"io": _io_executor.stats(), "search": _search_executor.stats()}
+
+
+async def aload_index(client_id: str) -> ClientIndex:
+    """Load a client's index without blocking the event loop."""
+    cached = _index_cache.get(client_id)
+    if cached:
+        return cached
+    return await _io_executor.run(load_index, client_id)
+
+
+async def aload_tenant_index(client_id: str) -> ClientIndex:
+    """Load the index serving a client without blocking the event loop."""
+    shard = _shard_of(client_id)
+    cached = _index_cache.get(shard) if shard is not None else None
+    if cached and client_id in cached.tenants:
+        return cached
+    cached = _index_cache.get(client_id)
+    if cached:
+        return cached
+    return await _io_executor.run(load_tenant_index, client_id)
+
+
+async def aadd_to_index(
+    client_id: str,
+    embeddings: List[List[float]],
+    metadata_list: List[Dict],
+    plan: Optional[str] = None,
+) -> None:
+    """Add embeddings to a client's index without blocking the event loop."""
+    await _io_executor.run(add_to_index, client_id, embeddings, metadata_list, plan)
+
+
+async def asave_embeddings(
+    client_id: str,
+    document_id: str,
+    embeddings: List[List[float]],
+    metadata_list: List[Dict],
+    model: Optional[str] = None,
+) -> None:
+    """Async wrapper for save_embeddings."""
+    await _io_executor.run(
+        save_embeddings, client_id, document_id, embeddings, metadata_list, model
+    )
+
+
+async def adelete_document(client_id: str, document_id: str) -> int:
+    """Delete a document's vectors without blocking the event loop."""
+    return await _io_executor.run(delete_document, client_id, document_id)
+
+
+async def asearch_index(
+    client_id: str,
+    query_embedding: List[float],
+    top_k: int = 5,
+    min_score: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    recall_target: Optional[float] = None,
+    document_ids: Optional[Collection[str]] = None,
+) -> List[Dict]:
+    """Search a client's index without blocking the event loop.
+
+    Cold loads run on the I/O pool first, so searches against indexes that
+    are already cached never wait behind them.
+    """
+    await aload_tenant_index(client_id)
+    return await _search_executor.run(
+        search_index,
+        client_id,
+        query_embedding,
+        top_k,
+        min_score,
+        ef_search,
+        recall_target,
+        document_ids,
+    )
+
+
+async def asearch_index_batch(
+    client_id: str,
+    queries: Sequence[Sequence[float]],
+    top_k: int = 5,
+    min_score: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    recall_target: Optional[float] = None,
+    document_ids: Optional[Collection[str]] = None,
+) -> List[List[Dict]]:
+    """Async wrapper for search_index_batch, loading cold indexes first."""
+    await aload_tenant_index(client_id)
+    return await _search_executor.run(
+        search_index_batch,
+        client_id,
+        queries,
+        top_k,
+        min_score,
+        ef_search,
+        recall_target,
+        document_ids,
+    )
+
+
+async def asearch_lexical(
+    client_id: str,
+    query: str,
+    top_k: int = 5,
+    document_ids: Optional[Collection[str]] = None,
+) -> List[Dict]:
+    """Async wrapper for search_lexical, loading cold indexes first."""
+    await aload_tenant_index(client_id)
+    return await _search_executor.run(
+        search_lexical, client_id, query, top_k, document_ids
+    )
+
+
+def search_index(
+    client_id: str,
+    query_embedding: List[float],
+    top_k: int = 5,
+    min_score: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    recall_target: Optional[float] = None,
+    document_ids: Optional[Collection[str]] = None,
+) -> List[Dict]:
+    """Search a client's FAISS index for nearest neighbors.
+
+    Single-query form of :func:`search_index_batch`.
+    """
+    return search_index_batch(
+        client_id,
+        [query_embedding],
+        top_k,
+        min_score,
+        ef_search,
+        recall_target,
+        document_ids,
+    )[0]
+
+
+def search_index_batch(
+    client_id: str,
+    queries: Sequence[Sequence[float]],
+    top_k: int = 5,
+    min_score: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    recall_target: Optional[float] = None,
+    document_ids: Optional[Collection[str]] = None,
+) -> List[List[Dict]]:
+    """Search a client's FAISS index for many query vectors at once.
+
+    Each segment is searched once for the whole batch and returns its own
+    top-k per query. Distances are converted to scores as arrays (cosine
+    similarity for cosine indexes, ``1 / (1 + d)`` for L2), hits below
+    ``min_score`` are dropped, and the rest are merged by score in one
+    vectorized pass. Only the surviving rows are read from the chunk
+    stores. Segments small enough to keep an exact matrix are scored with
+    one matrix product instead of their index.
+
+    Deleted hits must never shrink a result below ``top_k``. FAISS indexes
+    with tombstones search only their live rows, like a filter, so ``k``
+    and efSearch do not grow with the number of deletions. Exact and
+    mapped flat segments, which score every row whatever ``k`` is, are
+    over-fetched by their tombstone count instead.
+
+    With ``document_ids``, and for packed tenants, only the selected live
+    rows of each segment are searched (see :func:`_search_rows`), so a
+    filter never costs result slots.
+
+    Args:
+        client_id: Client whose index to search.
+        queries: Query vectors, one per row.
+        top_k: Number of results per query.
+        min_score: Lowest score a hit may have to be returned.
+        ef_search: HNSW efSearch for this search. Defaults to the value
+            resolved by ``choose_ef_search`` from the tenant's tuning and
+            plan.
+        recall_target: Recall@k to pick efSearch for from the tenant's
+            tuning profile, when no ``ef_search`` is given.
+        document_ids: Only return chunks of these documents. None
+            searches every document.
+
+    Returns:
+        One ranked result list per query, in query order.
+
+    Raises:
+        ValueError: If the query dimension does not match the index.
+    """
+    packed = _packed_index(client_id)
+    client_index = packed if packed is not None else load_index(client_id)
+
+    queries = np.asarray(queries, dtype="float32")
+    if queries.size == 0:
+        return [[] for _ in range(len(queries))]
+    if queries.ndim != 2:
+        raise ValueError(f"Expected a 2-d batch of queries, got {queries.shape}")
+
+    dimension = client_index.dimension
+    if dimension is not None and queries.shape[1] != dimension:
+        raise ValueError(
+            f"Query dim mismatch: query={queries.shape[1]}, index={dimension}"
+        )
+
+    prepared = {
+        metric: prepare_vectors(queries, metric)
+        for metric in {segment.metric for segment in client_index.segments}
+    }
+    ef_search = choose_ef_search(
+        client_index.plan, client_index.search_tuning, ef_search, recall_target
+    )
+    hit_scores: List[np.ndarray] = []
+    hit_segments: List[np.ndarray] = []
+    hit_rows: List[np.ndarray] = []
+
+    for position, segment in enumerate(client_index.segments):
+        selected = _selected_rows(
+            segment, client_id if packed is not None else None, document_ids
+        )
+        if (
+            selected is None
+            and segment.n_deleted
+            and segment.exact_vectors is None
+            and not isinstance(segment.searcher, MappedFlatIndex)
+        ):
+            selected = segment.live_rows()
+        if selected is not None:
+            if selected.size == 0:
+                continue
+            distances, rows = _search_rows(
+                segment, prepared[segment.metric], selected, top_k, ef_search
+            )
+        elif segment.index.ntotal == 0:
+            continue
+        elif segment.exact_vectors is not None:
+            distances, rows = exact_search(
+                prepared[segment.metric],
+                segment.exact_vectors,
+                top_k + segment.n_deleted,
+                segment.searcher.metric_type,
+                segment.exact_norms,
+            )
+        else:
+            distances, rows = segment.searcher.search(
+                prepared[segment.metric],
+                min(top_k + segment.n_deleted, segment.index.ntotal),
+                params=search_params(segment.searcher, ef_search),
+            )
+        found = rows >= 0
+        rows = np.where(found, rows, 0)
+        keep = found & ~segment.deleted[rows]
+
+        scores = to_scores(distances, segment.metric)
+        if min_score is not None:
+            keep &= scores >= min_score
+
+        hit_scores.append(np.where(keep, scores, -np.inf))
+        hit_rows.append(rows)
+        hit_segments.append(np.full(rows.shape, position))
+
+    if not hit_scores:
+        return [[] for _ in range(len(queries))]
+
+    scores = np.hstack(hit_scores)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+    scores = np.take_along_axis(scores, order, axis=1)
+    segments = np.take_along_axis(np.hstack(hit_segments), order, axis=1)
+    rows = np.take_along_axis(np.hstack(hit_rows), order, axis=1)
+    valid = np.isfinite(scores)
+
+    results: List[List[Dict]] = []
+    for q in range(len(queries)):
+        hits: List[Dict] = []
+        for i in np.flatnonzero(valid[q]):
+            item = client_index.segments[segments[q, i]].metadata[rows[q, i]]
+            item.pop("client_id", None)
+            item["score"] = float(scores[q, i])
+            hits.append(item)
+        results.append(hits)
+
+    return results
+
+
+def _selected_rows(
+    segment: IndexSegment,
+    tenant: Optional[str],
+    document_ids: Optional[Collection[str]],
+) -> Optional[np.ndarray]:
+    """Return the live rows a search may return, or None for all of them."""
+    if document_ids is None:
+        return segment.tenant_rows(tenant) if tenant is not None else None
+    rows = segment.document_rows(document_ids)
+    if tenant is not None:
+        rows = np.intersect1d(rows, segment.tenant_rows(tenant), assume_unique=True)
+    return rows
+
+
+def _search_rows(
+    segment: IndexSegment,
+    queries: np.ndarray,
+    rows: np.ndarray,
+    top_k: int,
+    ef_search: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Search only some live rows of a segment.
+
+    Up to ``FAISS_FILTER_EXACT_MAX_ROWS`` rows, and in mapped flat
+    segments, the selected vectors are gathered and searched exactly.
+    Larger selections are passed to the segment's own search as a bitmap
+    selector; HNSW segments then raise efSearch in proportion to the rows
+    filtered out, as rejected nodes still take up the candidate list.
+
+    Returns:
+        Distances and row numbers, ``-1`` for missing neighbours.
+    """
+    k = min(top_k, rows.size)
+    if rows.size <= settings.FAISS_FILTER_EXACT_MAX_ROWS or isinstance(
+        segment.searcher, MappedFlatIndex
+    ):
+        distances, local = faiss.knn(
+            queries,
+            _gather_vectors(segment, rows),
+            k,
+            metric=segment.searcher.metric_type,
+        )
+        return distances, np.where(local >= 0, rows[local], -1)
+
+    ntotal = segment.index.ntotal
+    bitmap = np.zeros(ntotal, dtype=bool)
+    bitmap[rows] = True
+    bits = np.packbits(bitmap, bitorder="little")
+    selector = faiss.IDSelectorBitmap(ntotal, faiss.swig_ptr(bits))
+    ef_search = min(-(-ef_search * ntotal // rows.size), _MAX_FILTERED_EF_SEARCH)
+    return segment.searcher.search(
+        queries, k, params=search_params(segment.searcher, ef_search, selector)
+    )
+
+
+def search_lexical(
+    client_id: str,
+    query: str,
+    top_k: int = 5,
+    document_ids: Optional[Collection[str]] = None,
+) -> List[Dict]:
+    """Rank a client's chunks against a text query with BM25.
+
+    Term statistics are taken over all segments together, so scores are
+    comparable across segments. Tombstoned rows, other tenants of a packed
+    shard and, with ``document_ids``, other documents are never returned.
+    Each hit's ``score`` is the share of the query's terms, weighted by
+    their inverse document frequency, that the chunk contains: 1.0 means
+    every term of the query matched.
+
+    Segments written before lexical indexes are skipped until
+    :func:`build_lexical_indexes`, compaction or a rebuild gives them a
+    ``.terms`` file.
+
+    Returns:
+        Up to ``top_k`` chunks, best BM25 score first.
+    """
+    packed = _packed_index(client_id)
+    client_index = packed if packed is not None else load_index(client_id)
+    terms = list(dict.fromkeys(tokenize(query)))
+    segments = [s for s in client_index.segments if s.lexical is not None]
+    if len(segments) < len(client_index.segments):
+        logger.debug(
+            "Lexical search of client %s skips %d segments without terms files",
+            client_id,
+            len(client_index.segments) - len(segments),
+        )
+    lexicals = [segment.lexical for segment in segments]
+    n_rows = sum(len(lexical) for lexical in lexicals)
+    if not terms or n_rows == 0:
+        return []
+
+    frequencies = np.array(
+        [
+            sum(lexical.document_frequency(term) for lexical in lexicals)
+            for term in terms
+        ]
+    )
+    idf = bm25_idf(n_rows, frequencies)
+    average_length = max(sum(lexical.tokens for lexical in lexicals) / n_rows, 1.0)
+
+    hits: List[Tuple[float, float, int, int]] = []
+    for position, segment in enumerate(segments):
+        lexical = segment.lexical
+        rows, scores, matched = lexical.score(terms, idf, average_length)
+        keep = ~segment.deleted[rows]
+        selected = _selected_rows(
+            segment, client_id if packed is not None else None, document_ids
+        )
+        if selected is not None:
+            keep &= np.isin(rows, selected)
+        best = np.flatnonzero(keep)
+        best = best[np.argsort(-scores[best], kind="stable")[:top_k]]
+        hits.extend(
+            (scores[i], matched[i] / idf.sum(), position, rows[i]) for i in best
+        )
 
+    results = []
+    for _, coverage, position, row in sorted(hits, key=lambda hit: -hit[0])[:top_k]:
+        item = segments[position].metadata[int(row)]
+        item.pop("client_id", None)
+        item["score"] = float(coverage)
+        results.append(item)
     return results
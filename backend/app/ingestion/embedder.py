@@ -1,13 +1,129 @@
-"""Embedding service for generating vector embeddings for text chunks."""
-
-from typing import Dict, List, Tuple
-
-from openai import OpenAI
+"""Embedding service for generating vector embeddings for text chunks.
+
+Inputs are split into batches that stay within the embeddings API's
+per-request item and token limits. Token counts come from the model's
+tiktoken encoding, and chunks longer than the model's input limit are
+truncated. Up to ``EMBEDDING_CONCURRENCY`` batches are in flight at once
+on the async client. Each batch is retried on its own, and the
+embeddings are returned in input order.
+"""
+
+import asyncio
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import tiktoken
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
 
 from backend.app.core.config import settings
 from backend.app.utils.logger import logger
 
-openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+RETRYABLE_ERRORS = (APIConnectionError, InternalServerError, RateLimitError)
+
+# Pooled connections belong to one event loop, and scripts embed under
+# successive asyncio.run calls, so each loop gets its own client.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _client() -> AsyncOpenAI:
+    """Return the embeddings client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # Retries are per batch, see _embed_batch.
+        client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+        _clients[loop] = client
+    return client
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> tiktoken.Encoding:
+    """Return the tokenizer of an embedding model."""
+    return tiktoken.encoding_for_model(model)
+
+
+def _prepare_inputs(texts: Sequence[str], model: str) -> Tuple[List[str], List[int]]:
+    """Truncate texts to the model's input limit and count their tokens.
+
+    Returns:
+        The texts to send and the token count of each.
+    """
+    encoding = _encoding(model)
+    max_tokens = settings.EMBEDDING_MAX_INPUT_TOKENS
+    inputs, counts = [], []
+
+    for i, tokens in enumerate(encoding.encode_ordinary_batch(list(texts))):
+        text = texts[i]
+        if len(tokens) > max_tokens:
+            logger.warning(
+                f"Truncating embedding input {i} from {len(tokens)} to "
+                f"{max_tokens} tokens"
+            )
+            tokens = tokens[:max_tokens]
+            text = encoding.decode(tokens)
+        inputs.append(text)
+        counts.append(len(tokens))
+
+    return inputs, counts
+
+
+def _plan_batches(
+    token_counts: Sequence[int],
+    max_items: int,
+    max_tokens: int,
+) -> List[Tuple[int, int]]:
+    """Split inputs into consecutive batches within the request limits.
+
+    Returns:
+        ``(start, end)`` input positions of each batch.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (i - start >= max_items or tokens + count > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+async def _embed_batch(
+    inputs: List[str],
+    model: str,
+    semaphore: asyncio.Semaphore,
+) -> Tuple[List[List[float]], int]:
+    """Embed one batch, retrying transient API errors with backoff.
+
+    Returns:
+        The batch's embeddings, in input order, and the tokens billed.
+    """
+    retries = settings.EMBEDDING_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                response = await _client().embeddings.create(model=model, input=inputs)
+            data = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in data], response.usage.total_tokens
+        except RETRYABLE_ERRORS as e:
+            if attempt == retries:
+                raise
+            delay = settings.EMBEDDING_RETRY_DELAY * 2**attempt
+            logger.warning(
+                f"Embedding batch of {len(inputs)} failed "
+                f"(attempt {attempt + 1}/{retries + 1}), retrying in {delay:.1f}s: "
+                f"{str(e)}"
+            )
+            await asyncio.sleep(delay)
 
 
 async def get_embeddings(
@@ -15,12 +131,17 @@ async def get_embeddings(
 ) -> Tuple[List[List[float]], Dict]:
     """Generate embeddings using OpenAI API.
 
+    Texts are embedded in concurrent batches bounded by
+    ``EMBEDDING_BATCH_MAX_ITEMS`` and ``EMBEDDING_BATCH_MAX_TOKENS``; texts
+    over ``EMBEDDING_MAX_INPUT_TOKENS`` are truncated.
+
     Args:
         texts: List of text strings to generate embeddings for.
 
     Returns:
         Tuple containing:
-            - List of embedding vectors (each is a list of floats)
+            - List of embedding vectors (each is a list of floats), in the
+              order of ``texts``
             - Dict with usage statistics (tokens, cost, model)
 
     Raises:
@@ -28,27 +149,46 @@ async def get_embeddings(
             prevent embedding dimension mismatch that would corrupt the
             FAISS index.
     """
+    model = settings.OPENAI_EBD_MODEL
+    if not texts:
+        return [], {"tokens": 0, "cost_usd": 0.0, "model": model}
+
+    tasks: List[asyncio.Task] = []
     try:
-        model = settings.OPENAI_EBD_MODEL
-        response = openai_client.embeddings.create(model=model, input=texts)
+        # Tokenizing a large document takes long enough to stall the loop.
+        inputs, token_counts = await asyncio.to_thread(_prepare_inputs, texts, model)
+        batches = _plan_batches(
+            token_counts,
+            settings.EMBEDDING_BATCH_MAX_ITEMS,
+            settings.EMBEDDING_BATCH_MAX_TOKENS,
+        )
 
-        embeddings = [item.embedding for item in response.data]
+        semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+        tasks = [
+            asyncio.create_task(_embed_batch(inputs[start:end], model, semaphore))
+            for start, end in batches
+        ]
+        results = await asyncio.gather(*tasks)
 
-        total_tokens = response.usage.total_tokens
+        embeddings = [vector for batch, _ in results for vector in batch]
+        total_tokens = sum(tokens for _, tokens in results)
         cost = (total_tokens / 1_000_000) * 0.02
 
         logger.info(
             f"OpenAI embeddings generated: {len(embeddings)} | "
+            f"Batches: {len(batches)} | "
             f"Tokens: {total_tokens} | Cost: ${cost:.6f}"
         )
 
         return embeddings, {
             "tokens": total_tokens,
             "cost_usd": cost,
-            "model": settings.OPENAI_EBD_MODEL,
+            "model": model,
         }
 
     except Exception as e:
+        for task in tasks:
+            task.cancel()
         logger.error(f"OpenAI Embedding API failed: {str(e)}")
         raise RuntimeError(
             "OpenAI embeddings unavailable. Cannot proceed with HuggingFace "
@@ -86,18 +226,28 @@ async def embed_chunks(chunks: List[Dict]) -> Tuple[List[Dict], Dict]:
     return chunks, usage_stats
 
 
-async def embed_and_index(client_id: str, chunks: List[Dict], document_id: str) -> Dict:
+async def embed_and_index(
+    client_id: str,
+    chunks: List[Dict],
+    document_id: str,
+    plan: Optional[str] = None,
+) -> Dict:
     """Full ingestion pipeline: chunks → embeddings → FAISS.
 
+    The raw embeddings are also stored in the embedding vault, so the
+    index can later be rebuilt without calling the embeddings API again.
+    A vault failure is logged but does not fail the ingestion.
+
     Args:
         client_id: Unique identifier for the client.
         chunks: List of chunk dictionaries to embed and index.
         document_id: Unique identifier for the source document.
+        plan: Client plan type, used to pick the FAISS index type.
 
     Returns:
         Dict with usage statistics (tokens, cost, model).
     """
-    from backend.app.core.vectorstore import add_to_index
+    from backend.app.core.vectorstore import aadd_to_index, asave_embeddings
 
     if not chunks:
         logger.warning("No chunks provided for embedding")
@@ -118,12 +268,26 @@ async def embed_and_index(client_id: str, chunks: List[Dict], document_id: str)
             }
         )
 
-    add_to_index(
+    await aadd_to_index(
         client_id=client_id,
         embeddings=embeddings,
         metadata_list=metadata_list,
+        plan=plan,
     )
 
+    try:
+        await asave_embeddings(
+            client_id=client_id,
+            document_id=document_id,
+            embeddings=embeddings,
+            metadata_list=metadata_list,
+            model=usage_stats.get("model"),
+        )
+    except Exception as e:
+        logger.error(
+            f"Failed to store raw embeddings for document {document_id}: {str(e)}"
+        )
+
     logger.info(
         "Indexed chunks",
         extra={
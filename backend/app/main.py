@@ -1,5 +1,7 @@
 """FastAPI entrypoint."""
 
+import asyncio
+
 import sentry_sdk
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,9 +11,24 @@ from fastapi.responses import JSONResponse
 
 from backend.app.core.config import settings, validate_settings
 from backend.app.core.database import SessionLocal
+from backend.app.core.vectorstore import (
+    flush_index_uploads,
+    get_cache_stats,
+    get_executor_stats,
+    get_upload_stats,
+    get_writer_stats,
+    recover_index_uploads,
+    start_invalidation_listener,
+    stop_invalidation_listener,
+)
 from backend.app.middleware.logging import log_requests
 from backend.app.routes import admin, auth, query, upload, whatsapp
 from backend.app.routes.webhook import router as webhook_router
+from backend.app.services.index_prewarm import (
+    get_prewarm_stats,
+    start_prewarmer,
+    stop_prewarmer,
+)
 from backend.app.utils.logger import logger
 from backend.app.utils.redis_client import test_redis_connection
 from backend.app.utils.s3 import list_bucket_safe
@@ -86,6 +103,12 @@ async def health_check():
     except Exception as exc:
         status["checks"]["s3"] = f"fail: {exc}"
 
+    status["faiss_cache"] = get_cache_stats()
+    status["faiss_executors"] = get_executor_stats()
+    status["faiss_uploads"] = get_upload_stats()
+    status["faiss_writes"] = get_writer_stats()
+    status["faiss_prewarm"] = get_prewarm_stats()
+
     if any(str(v).startswith("fail") for v in status["checks"].values()):
         return JSONResponse(status_code=503, content=status)
 
@@ -112,6 +135,14 @@ async def startup():
     except Exception as exc:
         raise RuntimeError(f"S3 unavailable at startup: {exc}") from exc
 
+    start_invalidation_listener()
+
+    recovered = recover_index_uploads()
+    if recovered:
+        logger.info("Resuming pending FAISS uploads for %d clients", recovered)
+
+    start_prewarmer()
+
     logger.info("Startup checks passed")
 
 
@@ -119,3 +150,13 @@ async def startup():
 async def shutdown():
     """Executed when application is shutting down."""
     logger.info("CortexLayer Support Agent shutting down...")
+
+    stop_invalidation_listener()
+    await asyncio.to_thread(stop_prewarmer)
+
+    flushed = await asyncio.to_thread(
+        flush_index_uploads,
+        settings.FAISS_UPLOAD_FLUSH_TIMEOUT,
+    )
+    if not flushed:
+        logger.warning("Shutdown with FAISS uploads still pending")
@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import time
-from typing import Dict, List
+from typing import Collection, Dict, List, Optional
 
 from backend.app.rag.generator import generate_answer
 from backend.app.rag.prompt import build_fallback_prompt, build_rag_prompt
@@ -29,11 +29,13 @@ async def run_rag_pipeline(
     query: str,
     plan_type: str = "starter",
     top_k: int = 5,
+    document_ids: Optional[Collection[str]] = None,
 ) -> Dict:
     """Run the complete RAG pipeline.
 
     This function is side-effect free. It does not write to DB,
-    send emails, or create handoff tickets.
+    send emails, or create handoff tickets. ``document_ids``, if given,
+    limits retrieval to those documents.
     """
     if not query or not query.strip():
         logger.warning("Empty query received for RAG pipeline")
@@ -59,6 +61,7 @@ async def run_rag_pipeline(
             client_id=client_id,
             query=query,
             top_k=top_k,
+            document_ids=document_ids,
         )
     except Exception as exc:
         logger.error("Retrieval failed: %s", exc)
@@ -66,8 +69,9 @@ async def run_rag_pipeline(
 
     if retrieved_chunks:
         prompt = build_rag_prompt(query, retrieved_chunks)
+        # Chunks rank by fused score; confidence is the best vector score.
         confidence = min(
-            float(retrieved_chunks[0].get("score", 0.0)),
+            max(float(chunk.get("score", 0.0)) for chunk in retrieved_chunks),
             1.0,
         )
     else:
@@ -1,63 +1,243 @@
 """Core retirever module for RAG Pipeline."""
 
-from typing import List, Dict
+import asyncio
+from typing import Collection, List, Dict, Optional, Tuple
+from backend.app.core.config import settings
 from backend.app.ingestion.embedder import get_embeddings
-from backend.app.core.vectorstore import search_index
+from backend.app.core.vectorstore import (
+    asearch_index,
+    asearch_index_batch,
+    asearch_lexical,
+)
 from backend.app.utils.logger import logger
 
 
 async def retrieve_relevant_chunks(
     client_id: str,
     query: str,
-    top_k: int = 5
+    top_k: int = 5,
+    min_score: Optional[float] = None,
+    document_ids: Optional[Collection[str]] = None
 ) -> List[Dict]:
-    """
-    Retrieve most relevant chunks for a query.
+    """Retrieve most relevant chunks for a query.
 
     Steps:
-    1. Convert query → embedding
-    2. Search FAISS index
-    3. Return ranked chunks
-    """
+    1. Start a BM25 search of the query text, if
+       ``settings.RAG_HYBRID_SEARCH`` is on
+    2. Convert query → embedding
+    3. Search FAISS, dropping hits scored below ``min_score``
+       (defaults to ``settings.RAG_MIN_SCORE``) and, if ``document_ids``
+       is given, chunks of other documents
+    4. Fuse both rankings with reciprocal-rank fusion
+    5. Return ranked chunks
 
+    ``score`` is always the vector similarity, as confidence is defined
+    on it; see ``_fuse`` for the lexical fields. ``min_score`` applies to
+    vector hits only, so if embedding or vector search fails, the lexical
+    results are still returned, with a score of 0.0.
+    """
     if not query.strip():
         logger.warning("Empty query received for retrieval")
         return []
 
-    # Step 1: Embed the query
+    if document_ids is not None and not document_ids:
+        logger.info(f"No documents match the filters for client={client_id}")
+        return []
+
+    min_score = _min_score(min_score)
+    depth = max(top_k, settings.RAG_HYBRID_CANDIDATES)
+
+    # Step 1: Start the lexical search
+    lexical = None
+    if settings.RAG_HYBRID_SEARCH:
+        lexical = asyncio.ensure_future(
+            _search_lexical(client_id, query, depth, document_ids)
+        )
+    else:
+        depth = top_k
+
+    # Step 2: Embed the query
     try:
         embeddings, _ = await get_embeddings(texts=[query])
+
+        # Step 3: Search FAISS index
+        try:
+            results = await asearch_index(
+                client_id=client_id,
+                query_embedding=embeddings[0],
+                top_k=depth,
+                min_score=min_score,
+                document_ids=document_ids
+            )
+        except Exception as e:
+            logger.error(f"FAISS search failed: {e}")
+            results = []
     except Exception as e:
         logger.error(f"Embedding failed in retriever: {e}")
-        return []
+        results = []
+
+    # Step 4: Fuse with the lexical ranking
+    if lexical is not None:
+        results = _fuse(results, await lexical, top_k, min_score)
+
+    # Step 5: Post-process results
+    cleaned_results = _clean_results(results[:top_k])
+
+    logger.info(
+        f"Retrieved {len(cleaned_results)} chunks for client={client_id}"
+    )
+
+    return cleaned_results
 
-    query_embedding = embeddings[0]
 
-    # Step 2: Search FAISS index
+def _min_score(min_score: Optional[float]) -> float:
+    """Return the score cutoff to search with."""
+    return settings.RAG_MIN_SCORE if min_score is None else min_score
+
+
+async def _search_lexical(
+    client_id: str,
+    query: str,
+    top_k: int,
+    document_ids: Optional[Collection[str]]
+) -> List[Dict]:
+    """Run a BM25 search, returning no hits instead of raising."""
     try:
-        results = search_index(
+        return await asearch_lexical(
             client_id=client_id,
-            query_embedding=query_embedding,
-            top_k=top_k
+            query=query,
+            top_k=top_k,
+            document_ids=document_ids
         )
+    except FileNotFoundError:
+        return []
     except Exception as e:
-        logger.error(f"FAISS search failed: {e}")
+        logger.warning(f"Lexical search failed: {e}")
         return []
 
-    # Step 3: Post-process results
+
+def _fuse(
+    vector_hits: List[Dict],
+    lexical_hits: List[Dict],
+    top_k: int,
+    min_score: float
+) -> List[Dict]:
+    """Merge the vector and lexical rankings with reciprocal-rank fusion.
+
+    Chunks rank by ``rrf_score``, the sum of
+    ``1 / (settings.RAG_RRF_K + rank)`` over the rankings they appear in.
+    ``score`` stays the vector similarity, 0.0 for chunks only the
+    lexical search found. Vector hits scored below ``min_score`` are
+    dropped before fusion; lexical hits are not held to it.
+    ``lexical_score`` is the share of query terms the chunk contains,
+    weighted by idf, 0.0 for chunks only the vector search found.
+    """
+    vector_hits = [hit for hit in vector_hits if hit.get("score", 0.0) >= min_score]
+    fused: Dict[Tuple, Dict] = {}
+    rankings = (("score", vector_hits), ("lexical_score", lexical_hits))
+    for field, ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            key = (hit.get("document_id"), hit.get("chunk_index"), hit.get("text"))
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {
+                    **hit, "score": 0.0, "lexical_score": 0.0, "rrf_score": 0.0
+                }
+            entry[field] = hit.get("score", 0.0)
+            entry["rrf_score"] += 1.0 / (settings.RAG_RRF_K + rank)
+
+    ranked = sorted(fused.values(), key=lambda hit: -hit["rrf_score"])
+    return ranked[:top_k]
+
+
+def _clean_results(results: List[Dict]) -> List[Dict]:
+    """Keep only chunks with text and metadata, in the retriever format."""
     cleaned_results = []
     for item in results:
         if "text" not in item or "metadata" not in item:
             continue
 
-        cleaned_results.append({
+        cleaned = {
             "text": item["text"],
             "metadata": item["metadata"],
             "score": float(item.get("score", 0.0))
-        })
+        }
+        for field in ("lexical_score", "rrf_score"):
+            if field in item:
+                cleaned[field] = float(item[field])
+        cleaned_results.append(cleaned)
+    return cleaned_results
+
+
+async def retrieve_relevant_chunks_batch(
+    client_id: str,
+    queries: List[str],
+    top_k: int = 5,
+    min_score: Optional[float] = None,
+    ef_search: Optional[int] = None,
+    recall_target: Optional[float] = None,
+    document_ids: Optional[Collection[str]] = None
+) -> Tuple[List[List[Dict]], Dict]:
+    """Retrieve relevant chunks for many queries at once.
+
+    All queries are embedded in one API call and searched in one FAISS
+    call, while their BM25 searches run alongside; the rankings are fused
+    as in ``retrieve_relevant_chunks``. Blank queries get an empty result.
+    ``ef_search`` and ``recall_target`` override the tenant's HNSW search
+    effort. ``document_ids`` restricts every query to chunks of those
+    documents.
+
+    Returns:
+        Tuple containing:
+            - One list of ranked chunks per query, in query order
+            - Dict with embedding usage statistics
+
+    Raises:
+        RuntimeError: If embedding or search fails.
+    """
+    texts = [query for query in queries if query.strip()]
+    if not texts or (document_ids is not None and not document_ids):
+        return [[] for _ in queries], {"tokens": 0, "cost_usd": 0.0}
+
+    min_score = _min_score(min_score)
+    depth = top_k
+    lexical = None
+    if settings.RAG_HYBRID_SEARCH:
+        depth = max(top_k, settings.RAG_HYBRID_CANDIDATES)
+        lexical = asyncio.gather(*(
+            _search_lexical(client_id, text, depth, document_ids)
+            for text in texts
+        ))
+
+    try:
+        embeddings, usage_stats = await get_embeddings(texts=texts)
+        results = await asearch_index_batch(
+            client_id=client_id,
+            queries=embeddings,
+            top_k=depth,
+            min_score=min_score,
+            ef_search=ef_search,
+            recall_target=recall_target,
+            document_ids=document_ids
+        )
+    except BaseException:
+        if lexical is not None:
+            lexical.cancel()
+        raise
+    if lexical is not None:
+        results = [
+            _fuse(vector_hits, lexical_hits, top_k, min_score)
+            for vector_hits, lexical_hits in zip(results, await lexical)
+        ]
+    results = iter(results)
+
+    batch = [
+        _clean_results(next(results)[:top_k]) if query.strip() else []
+        for query in queries
+    ]
 
     logger.info(
-        f"Retrieved {len(cleaned_results)} chunks for client={client_id}"
+        f"Retrieved chunks for {len(texts)} queries for client={client_id}"
     )
 
-    return cleaned_results
+    return batch, usage_stats
@@ -1,6 +1,6 @@
 """Routes for authentication (register + login)."""
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from backend.app.core.auth import (
@@ -15,6 +15,7 @@ from backend.app.schemas.auth import (
     RegisterRequest,
     TokenResponse,
 )
+from backend.app.services.index_prewarm import prefetch_index
 from backend.app.services.stripe_service import create_customer
 from backend.app.utils.logger import logger
 
@@ -82,9 +83,14 @@ customer creation "
 @router.post("/login", response_model=TokenResponse)
 async def login_user(
     request: LoginRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ) -> TokenResponse:
-    """Login existing client and return access token."""
+    """Login existing client and return access token.
+
+    The client's FAISS index is loaded in the background after the
+    response, so its first query does not wait for S3.
+    """
     client = db.query(Client).filter(Client.email == request.email).first()
 
     if not client or not verify_password(
@@ -103,4 +109,5 @@ async def login_user(
         )
 
     token = create_access_token({"sub": str(client.id)})
+    background_tasks.add_task(prefetch_index, str(client.id))
     return TokenResponse(access_token=token)
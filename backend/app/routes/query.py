@@ -1,5 +1,7 @@
 """Query endpoint for the support bot."""
 
+import time
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
@@ -8,8 +10,15 @@ from backend.app.core.database import get_db
 from backend.app.models.chat_logs import ChatLog
 from backend.app.models.client import Client
 from backend.app.rag.pipeline import run_rag_pipeline
-from backend.app.schemas.query import QueryRequest, QueryResponse
+from backend.app.rag.retriever import retrieve_relevant_chunks_batch
+from backend.app.schemas.query import (
+    BatchQueryRequest,
+    BatchQueryResponse,
+    QueryRequest,
+    QueryResponse,
+)
 from backend.app.services.billing import check_query_limit, log_usage
+from backend.app.services.document_filter import resolve_document_filter
 from backend.app.services.email_service import send_email_fallback
 from backend.app.services.handoff_service import create_handoff_ticket
 from backend.app.utils.logger import logger
@@ -52,6 +61,7 @@ async def query_support_bot(
             client_id=str(client.id),
             query=request.query,
             plan_type=client.plan_type.value,
+            document_ids=resolve_document_filter(db, client.id, request.filters),
         )
     except Exception as exc:
         logger.error(
@@ -118,3 +128,63 @@ async def query_support_bot(
         confidence=result["confidence"],
         latency_ms=result["latency_ms"],
     )
+
+
+@router.post("/batch", response_model=BatchQueryResponse)
+async def query_batch(
+    request: BatchQueryRequest,
+    client: Client = Depends(get_current_client),
+    db: Session = Depends(get_db),
+) -> BatchQueryResponse:
+    """Batch retrieval endpoint – ranked chunks for many queries, no generation.
+
+    Used by offline evaluation jobs. All queries are embedded in one call
+    and searched in one FAISS call; only embedding usage is billed.
+    """
+    if client.is_disabled:
+        raise HTTPException(
+            status_code=403,
+            detail="Account disabled due to billing or policy issues.",
+        )
+
+    await check_global_rate_limit()
+
+    rate_limit = get_rate_limit_for_plan(client.plan_type.value)
+    await check_rate_limit(str(client.id), rate_limit)
+
+    check_query_limit(client, db)
+
+    start_time = time.time()
+    try:
+        results, usage_stats = await retrieve_relevant_chunks_batch(
+            client_id=str(client.id),
+            queries=request.queries,
+            top_k=request.top_k,
+            ef_search=request.ef_search,
+            recall_target=request.recall_target,
+            document_ids=resolve_document_filter(db, client.id, request.filters),
+        )
+    except Exception as exc:
+        logger.error(
+            "Batch retrieval failed for client %s: %s",
+            client.id,
+            exc,
+        )
+        raise HTTPException(
+            status_code=500,
+            detail="Batch query processing failed.",
+        ) from None
+    latency_ms = int((time.time() - start_time) * 1000)
+
+    if usage_stats.get("tokens"):
+        log_usage(
+            db=db,
+            client_id=client.id,
+            operation_type="embedding",
+            embedding_tokens=usage_stats["tokens"],
+            model_used=usage_stats.get("model"),
+            latency_ms=latency_ms,
+        )
+        db.commit()
+
+    return BatchQueryResponse(results=results, latency_ms=latency_ms)
@@ -87,6 +87,7 @@ async def upload_document(
             client_id=str(client.id),
             chunks=chunks,
             document_id=document_id,
+            plan=client.plan_type.value,
         )
 
         log_usage(
@@ -169,6 +170,7 @@ async def upload_url(
             client_id=str(client.id),
             chunks=chunks,
             document_id=document_id,
+            plan=client.plan_type.value,
         )
 
         log_usage(
@@ -1,8 +1,27 @@
 """For Handling Reponse Validation."""
 
-from typing import List, Optional
+import uuid
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+MAX_BATCH_QUERIES = 100
+MAX_FILTER_DOCUMENTS = 100
+
+
+class QueryFilters(BaseModel):
+    """Document Filter Validation.
+
+    Retrieval only returns chunks of documents matching every field set.
+    """
+
+    document_ids: Optional[List[uuid.UUID]] = Field(
+        None, max_length=MAX_FILTER_DOCUMENTS
+    )
+    source_types: Optional[List[Literal["pdf", "text", "url"]]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
 
 
 class QueryRequest(BaseModel):
@@ -10,6 +29,7 @@ class QueryRequest(BaseModel):
 
     query: str
     conversation_id: Optional[str] = None
+    filters: Optional[QueryFilters] = None
 
 
 class Citation(BaseModel):
@@ -27,3 +47,30 @@ class QueryResponse(BaseModel):
     citations: List[Citation]
     confidence: float
     latency_ms: int
+
+
+class BatchQueryRequest(BaseModel):
+    """Batch Retrieval Request Validation."""
+
+    queries: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    top_k: int = Field(5, ge=1, le=50)
+    ef_search: Optional[int] = Field(None, ge=1, le=4096)
+    recall_target: Optional[float] = Field(None, gt=0.0, le=1.0)
+    filters: Optional[QueryFilters] = None
+
+
+class RetrievedChunk(BaseModel):
+    """Retrieved Chunk Format Validation."""
+
+    text: str
+    metadata: Dict
+    score: float
+    lexical_score: Optional[float] = None
+    rrf_score: Optional[float] = None
+
+
+class BatchQueryResponse(BaseModel):
+    """Batch Retrieval Response Validation."""
+
+    results: List[List[RetrievedChunk]]
+    latency_ms: int
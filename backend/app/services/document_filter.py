@@ -0,0 +1,46 @@
+"""Resolve query filters to the documents retrieval may search.
+
+Every chunk of a document shares its source type and upload time, so
+filters on those fields select whole documents. They are answered from the
+``documents`` table and passed to the vector store as a set of document
+ids, which it turns into a row selection per index segment.
+"""
+
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from backend.app.models.documents import Document
+from backend.app.schemas.query import QueryFilters
+
+
+def resolve_document_filter(
+    db: Session,
+    client_id,
+    filters: Optional[QueryFilters],
+) -> Optional[List[str]]:
+    """Return the ids of a client's documents matching query filters.
+
+    Args:
+        db: Database session.
+        client_id: Client whose documents to match.
+        filters: Filters from the request, if any.
+
+    Returns:
+        The matching document ids, possibly none, or None if ``filters``
+        sets no condition and every document may be searched.
+    """
+    if filters is None or not filters.model_dump(exclude_none=True):
+        return None
+
+    query = db.query(Document.id).filter(Document.client_id == client_id)
+    if filters.document_ids is not None:
+        query = query.filter(Document.id.in_(filters.document_ids))
+    if filters.source_types is not None:
+        query = query.filter(Document.source_type.in_(filters.source_types))
+    if filters.created_after is not None:
+        query = query.filter(Document.created_at >= filters.created_after)
+    if filters.created_before is not None:
+        query = query.filter(Document.created_at < filters.created_before)
+
+    return [str(document_id) for (document_id,) in query.all()]
@@ -0,0 +1,243 @@
+"""Background prewarming of FAISS indexes.
+
+After a deploy every worker starts with an empty index cache, and the
+first query of each tenant pays an S3 download and a load. The prewarmer
+loads the tenants most likely to be queried before their first query:
+
+- at startup, the tenants of the shared hot set, then those with the most
+  chat logs over the last ``FAISS_PREWARM_ACTIVITY_HOURS``, until the
+  cache holds ``FAISS_PREWARM_BUDGET_FRACTION`` of its byte budget or a
+  load starts evicting other tenants;
+- after a successful login, the tenant that logged in.
+
+Every worker records the tenants in its cache in a Redis sorted set,
+scored by when they were last seen, every
+``FAISS_HOT_SET_SNAPSHOT_INTERVAL`` seconds and once more on shutdown, so a
+restarted worker warms the tenants its predecessors were serving.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func
+
+from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.core.vectorstore import (
+    aload_tenant_index,
+    get_cache_stats,
+    get_cached_client_ids,
+    load_tenant_index,
+)
+from backend.app.models.chat_logs import ChatLog
+from backend.app.utils.logger import logger
+from backend.app.utils.redis_client import redis_client
+
+HOT_SET_KEY = "faiss:hotset"
+
+
+def snapshot_hot_set() -> int:
+    """Record this worker's cached tenants in the shared hot set.
+
+    Returns:
+        The number of tenants recorded.
+    """
+    client_ids = get_cached_client_ids()
+    if redis_client is None or not client_ids:
+        return 0
+
+    # Most recently used first, so it keeps the highest score.
+    now = time.time()
+    redis_client.zadd(
+        HOT_SET_KEY,
+        {client_id: now - rank * 1e-3 for rank, client_id in enumerate(client_ids)},
+        gt=True,
+    )
+    redis_client.expire(HOT_SET_KEY, settings.FAISS_HOT_SET_TTL)
+    return len(client_ids)
+
+
+def hot_set_clients(limit: int) -> List[str]:
+    """Return the tenants most recently seen in any worker's cache."""
+    if redis_client is None:
+        return []
+    try:
+        cutoff = time.time() - settings.FAISS_HOT_SET_TTL
+        redis_client.zremrangebyscore(HOT_SET_KEY, "-inf", cutoff)
+        return list(redis_client.zrevrange(HOT_SET_KEY, 0, limit - 1))
+    except Exception as exc:
+        logger.warning("Failed to read FAISS hot set: %s", exc)
+        return []
+
+
+def active_clients(limit: int, hours: Optional[int] = None) -> List[str]:
+    """Return the tenants with the most chat logs in the last ``hours``."""
+    hours = settings.FAISS_PREWARM_ACTIVITY_HOURS if hours is None else hours
+    since = datetime.utcnow() - timedelta(hours=hours)
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ChatLog.client_id, func.count(ChatLog.id))
+            .filter(ChatLog.timestamp >= since)
+            .group_by(ChatLog.client_id)
+            .order_by(func.count(ChatLog.id).desc())
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+
+    return [str(client_id) for client_id, _ in rows]
+
+
+def rank_clients(limit: Optional[int] = None) -> List[str]:
+    """Return the tenants to prewarm, most important first.
+
+    Tenants of the hot set come before recently active ones.
+    """
+    limit = settings.FAISS_PREWARM_MAX_CLIENTS if limit is None else limit
+    ranked = hot_set_clients(limit)
+    try:
+        ranked += active_clients(limit)
+    except Exception as exc:
+        logger.warning("Failed to rank tenants by chat activity: %s", exc)
+    return list(dict.fromkeys(ranked))[:limit]
+
+
+def prewarm_indexes(
+    client_ids: Sequence[str],
+    max_bytes: int,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """Load indexes in order until the cache holds ``max_bytes``.
+
+    Tenants without an index or failing to load are skipped. Loading stops
+    early once a load evicts another index, as the cache is then full.
+
+    Returns:
+        The number of indexes loaded.
+    """
+    cached = set(get_cached_client_ids())
+    loaded = 0
+
+    for client_id in client_ids:
+        if stop is not None and stop.is_set():
+            break
+        before = get_cache_stats()["memory"]
+        if before["bytes"] >= max_bytes:
+            break
+        if client_id in cached:
+            continue
+
+        try:
+            load_tenant_index(client_id)
+        except FileNotFoundError:
+            continue
+        except Exception as exc:
+            logger.warning("Prewarm of client %s failed: %s", client_id, exc)
+            continue
+        loaded += 1
+
+        if get_cache_stats()["memory"]["evictions"] > before["evictions"]:
+            logger.info("FAISS cache is full, stopping prewarm")
+            break
+
+    return loaded
+
+
+async def prefetch_index(client_id: str) -> None:
+    """Load a tenant's index ahead of its first query, ignoring failures."""
+    try:
+        await aload_tenant_index(client_id)
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        logger.warning("Index prefetch for client %s failed: %s", client_id, exc)
+
+
+class IndexPrewarmer:
+    """Background thread that prewarms at startup and snapshots the hot set."""
+
+    def __init__(self, interval: Optional[float] = None) -> None:
+        """Initialize the prewarmer.
+
+        Args:
+            interval: Seconds between hot set snapshots. Defaults to
+                ``settings.FAISS_HOT_SET_SNAPSHOT_INTERVAL``.
+        """
+        self.interval = (
+            settings.FAISS_HOT_SET_SNAPSHOT_INTERVAL if interval is None else interval
+        )
+        self.loaded = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the prewarm thread, unless it is already running."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="faiss-prewarm",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and take a final hot set snapshot."""
+        self._stop.set()
+        try:
+            snapshot_hot_set()
+        except Exception as exc:
+            logger.warning("Final FAISS hot set snapshot failed: %s", exc)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of indexes loaded by the startup prewarm."""
+        return {"loaded": self.loaded}
+
+    def _run(self) -> None:
+        """Prewarm once, then snapshot the hot set until stopped."""
+        try:
+            started = time.perf_counter()
+            max_bytes = int(
+                get_cache_stats()["memory"]["max_bytes"]
+                * settings.FAISS_PREWARM_BUDGET_FRACTION
+            )
+            self.loaded = prewarm_indexes(rank_clients(), max_bytes, self._stop)
+            logger.info(
+                "Prewarmed %d FAISS indexes in %.1fs",
+                self.loaded,
+                time.perf_counter() - started,
+            )
+        except Exception as exc:
+            logger.warning("FAISS prewarm failed: %s", exc)
+
+        while not self._stop.wait(self.interval):
+            try:
+                snapshot_hot_set()
+            except Exception as exc:
+                logger.warning("FAISS hot set snapshot failed: %s", exc)
+
+
+_prewarmer = IndexPrewarmer()
+
+
+def start_prewarmer() -> None:
+    """Start prewarming indexes and snapshotting the hot set."""
+    if settings.FAISS_PREWARM_ENABLED:
+        _prewarmer.start()
+
+
+def stop_prewarmer() -> None:
+    """Stop the prewarmer, recording the hot set for the next worker."""
+    if settings.FAISS_PREWARM_ENABLED:
+        _prewarmer.stop()
+
+
+def get_prewarm_stats() -> Dict[str, int]:
+    """Return prewarm statistics."""
+    return _prewarmer.stats()
@@ -10,7 +10,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from backend.app.models.client import Client
-from backend.app.core.vectorstore import save_index, load_index
+from backend.app.core.vectorstore import backup_index, flush_index_uploads
 from backend.app.core.config import settings
 import logging
 
@@ -32,12 +32,14 @@ def backup_all_indexes():
 
         for client in clients:
             try:
-                index, metadata = load_index(str(client.id))
-                save_index(str(client.id), index, metadata)
+                backup_index(str(client.id))
                 logger.info(f"Backed up index for {client.email}")
             except Exception as e:
                 logger.error(f"Backup failed for {client.email}: {e}")
 
+        if not flush_index_uploads():
+            logger.error("Some index uploads did not complete")
+
     finally:
         db.close()
 
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Find where exact matrix-product search stops beating HNSW.
+
+For each index size, times single-query searches (as chat queries run)
+with the vector store's exact search over a contiguous matrix, with
+``faiss.knn`` (how mapped flat segments are searched) and with an HNSW
+index at the configured efSearch, and reports the recall@k HNSW gives up.
+Prints a markdown table and the largest size at which exact search is
+still faster than HNSW, a value for ``FAISS_EXACT_SEARCH_MAX_VECTORS`` on
+this hardware.
+
+    python scripts/benchmark_exact_search.py --dim 1536 --sizes 128 256 512 1024
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from backend.app.core.config import settings  # noqa: E402
+from backend.app.core.index_factory import (  # noqa: E402
+    INDEX_HNSW,
+    build_index,
+    exact_search,
+    search_params,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [64, 128, 256, 512, 768, 1024, 2048, 4096, 8192]
+
+
+def time_queries(search, queries):
+    """Return the median latency in milliseconds of searching each query."""
+    search(queries[:1])
+    latencies = []
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        search(queries[i : i + 1])
+        latencies.append(time.perf_counter() - started)
+    return float(np.median(latencies)) * 1000
+
+
+def benchmark(size, args, rng):
+    """Time every search method over ``size`` random vectors."""
+    vectors = rng.normal(size=(size, args.dim)).astype("float32")
+    queries = rng.normal(size=(args.queries, args.dim)).astype("float32")
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    hnsw = build_index(INDEX_HNSW, args.dim)
+    hnsw.add(vectors)
+    params = search_params(hnsw, args.ef_search)
+
+    _, truth = faiss.knn(queries, vectors, args.k)
+    _, found = hnsw.search(queries, args.k, params=params)
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+
+    return {
+        "size": size,
+        "hnsw_recall": hits / truth.size,
+        "exact_ms": time_queries(
+            lambda q: exact_search(q, vectors, args.k, faiss.METRIC_L2, norms),
+            queries,
+        ),
+        "knn_ms": time_queries(lambda q: faiss.knn(q, vectors, args.k), queries),
+        "hnsw_ms": time_queries(
+            lambda q: hnsw.search(q, args.k, params=params), queries
+        ),
+    }
+
+
+def main():
+    """Run the benchmark and print a markdown table and the crossover."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ef-search", type=int, default=settings.FAISS_HNSW_EF_SEARCH)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    logger.info(
+        f"Benchmarking dim {args.dim}, k={args.k}, efSearch={args.ef_search}, "
+        f"{faiss.omp_get_max_threads()} FAISS threads"
+    )
+
+    print(f"| vectors | exact ms | faiss.knn ms | hnsw ms | hnsw recall@{args.k} |")
+    print("|---|---|---|---|---|")
+    crossover = 0
+    for size in sorted(args.sizes):
+        result = benchmark(size, args, rng)
+        print(
+            f"| {result['size']} | {result['exact_ms']:.3f} "
+            f"| {result['knn_ms']:.3f} | {result['hnsw_ms']:.3f} "
+            f"| {result['hnsw_recall']:.3f} |"
+        )
+        if result["exact_ms"] <= result["hnsw_ms"]:
+            crossover = size
+
+    print()
+    print(f"Exact search is faster than HNSW up to {crossover} vectors.")
+    print(
+        f"Current FAISS_EXACT_SEARCH_MAX_VECTORS: "
+        f"{settings.FAISS_EXACT_SEARCH_MAX_VECTORS}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Compare recall and memory of the FAISS index kinds.
+
+Builds every index kind over the same vectors and reports recall@k against
+exact search, bytes per vector, build time and query latency. Vectors are
+random unless --client-id is given, in which case that tenant's stored
+vectors are used and a sample of them serves as queries.
+
+    python scripts/benchmark_vector_storage.py --vectors 100000 --k 5
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from backend.app.core.index_factory import build_index  # noqa: E402
+from backend.app.core.vectorstore import (  # noqa: E402
+    _index_nbytes,
+    _reconstruct_vectors,
+    load_index,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KINDS = ("flat", "flat_fp16", "flat_sq8", "hnsw", "hnsw_fp16", "hnsw_sq8")
+TRAINING_SAMPLE = 65_536
+
+
+def load_vectors(args):
+    """Return (vectors, queries) for the benchmark."""
+    rng = np.random.default_rng(args.seed)
+
+    if args.client_id:
+        client_index = load_index(args.client_id)
+        vectors = np.vstack(
+            [_reconstruct_vectors(s.index) for s in client_index.segments]
+        )
+        picks = rng.choice(len(vectors), size=min(args.queries, len(vectors)))
+        noise = rng.normal(scale=0.01, size=(len(picks), vectors.shape[1]))
+        return vectors, (vectors[picks] + noise).astype("float32")
+
+    vectors = rng.normal(size=(args.vectors, args.dim)).astype("float32")
+    queries = rng.normal(size=(args.queries, args.dim)).astype("float32")
+    return vectors, queries
+
+
+def benchmark(kind, vectors, queries, truth, k):
+    """Build one index kind and measure it against the exact results."""
+    started = time.perf_counter()
+    sample = vectors[:TRAINING_SAMPLE]
+    index = build_index(kind, vectors.shape[1], training=sample)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _, labels = index.search(queries, k)
+    query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    hits = sum(
+        len(set(found[found >= 0]) & set(expected))
+        for found, expected in zip(labels, truth)
+    )
+    return {
+        "kind": kind,
+        "recall": hits / truth.size,
+        "bytes_per_vector": _index_nbytes(index) / len(vectors),
+        "build_s": build_seconds,
+        "query_ms": query_ms,
+    }
+
+
+def main():
+    """Run the benchmark and print a markdown table."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--client-id", help="benchmark a tenant's vectors")
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    args = parser.parse_args()
+
+    vectors, queries = load_vectors(args)
+    logger.info(f"Benchmarking {len(vectors)} vectors of dim {vectors.shape[1]}")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"| kind | recall@{args.k} | bytes/vector | build s | query ms |")
+    print("|---|---|---|---|---|")
+    for kind in args.kinds:
+        result = benchmark(kind, vectors, queries, truth, args.k)
+        print(
+            f"| {result['kind']} | {result['recall']:.3f} "
+            f"| {result['bytes_per_vector']:.0f} | {result['build_s']:.1f} "
+            f"| {result['query_ms']:.2f} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
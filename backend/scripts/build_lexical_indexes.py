@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Build the BM25 terms files of segments written before lexical search.
+
+Hybrid retrieval skips segments without a ``.terms`` file. Compaction and
+rebuilds write one for the segments they produce; this script backfills
+the rest for every active client and packed shard, so no index is
+tokenized on the query path.
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from backend.app.core.config import settings  # noqa: E402
+from backend.app.core.vectorstore import (  # noqa: E402
+    PACKED_SHARD_PREFIX,
+    build_lexical_indexes,
+    flush_index_uploads,
+)
+from backend.app.models.client import Client  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_all_lexical_indexes():
+    """Backfill terms files for every active client and packed shard."""
+    engine = create_engine(settings.DATABASE_URL)
+    SessionLocal = sessionmaker(bind=engine)
+    db = SessionLocal()
+
+    try:
+        clients = db.query(Client).filter(Client.is_active == True).all()  # noqa: E712
+        index_names = [str(client.id) for client in clients] + [
+            f"{PACKED_SHARD_PREFIX}{shard:04d}"
+            for shard in range(settings.FAISS_PACKED_SHARDS)
+        ]
+
+        built = 0
+        for name in index_names:
+            try:
+                count = build_lexical_indexes(name)
+            except Exception as e:
+                logger.error(f"Building terms files failed for {name}: {e}")
+                continue
+            if count:
+                built += count
+                logger.info(f"Built {count} terms files for {name}")
+
+        logger.info(f"Built {built} terms files over {len(index_names)} indexes")
+
+        if not flush_index_uploads():
+            logger.error("Some index uploads did not complete")
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    build_all_lexical_indexes()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Rebuild FAISS indexes in the vector storage format configured per plan.
+
+Run after changing FAISS_VECTOR_STORAGE or FAISS_VECTOR_STORAGE_BY_PLAN.
+Tenants whose index already has the right kind are left untouched.
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from backend.app.core.config import settings  # noqa: E402
+from backend.app.core.vectorstore import (  # noqa: E402
+    compact_index,
+    flush_index_uploads,
+)
+from backend.app.models.client import Client  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_all_indexes():
+    """Compact every active client's index into its plan's index kind."""
+    engine = create_engine(settings.DATABASE_URL)
+    SessionLocal = sessionmaker(bind=engine)
+    db = SessionLocal()
+
+    try:
+        clients = db.query(Client).filter(Client.is_active == True).all()  # noqa: E712
+
+        if not clients:
+            logger.info("No active clients found — nothing to migrate")
+            return
+
+        migrated = 0
+        for client in clients:
+            try:
+                if compact_index(str(client.id), plan=client.plan_type.value):
+                    migrated += 1
+                    logger.info(f"Migrated index for {client.email}")
+            except Exception as e:
+                logger.error(f"Migration failed for {client.email}: {e}")
+
+        logger.info(f"Migrated {migrated} of {len(clients)} indexes")
+
+        if not flush_index_uploads():
+            logger.error("Some index uploads did not complete")
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate_all_indexes()
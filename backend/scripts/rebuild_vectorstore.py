@@ -1 +1,223 @@
-"""Auto-generated placeholder module for CortexLayer        Backend."""
+#!/usr/bin/env python3
+"""Rebuild every tenant's FAISS index from stored vectors.
+
+Run after changing the index format or parameters. Tenants are rebuilt in
+a process pool from the embedding vault, falling back to re-embedding the
+stored chunk text with --reembed-missing. Each rebuilt index is checked
+against the chunk counts of the tenant's ready documents before it is
+swapped in, so a failed tenant keeps serving its old index.
+
+Progress is checkpointed after every tenant; running the command again
+resumes where it stopped unless --restart is given.
+
+    python scripts/rebuild_vectorstore.py --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from backend.app.core.config import settings  # noqa: E402
+from backend.app.core.vectorstore import (  # noqa: E402
+    flush_index_uploads,
+    rebuild_index,
+)
+from backend.app.models.client import Client  # noqa: E402
+from backend.app.models.documents import Document, DocumentStatus  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = "rebuild_vectorstore.checkpoint.json"
+
+
+def _embed_texts(texts):
+    """Embed texts with the ingestion embedder, blocking."""
+    from backend.app.ingestion.embedder import get_embeddings
+
+    embeddings, _ = asyncio.run(get_embeddings(texts))
+    return embeddings
+
+
+def rebuild_tenant(task):
+    """Rebuild one tenant's index. Runs in a worker process."""
+    started = time.perf_counter()
+    result = {"client_id": task["client_id"], "status": "failed"}
+
+    try:
+        for _ in range(task["attempts"]):
+            stats = rebuild_index(
+                task["client_id"],
+                plan=task["plan"],
+                expected=task["expected"],
+                embed=_embed_texts if task["reembed"] else None,
+            )
+            if stats is not None or not task["expected"]:
+                break
+        else:
+            raise RuntimeError("index kept changing during the rebuild")
+
+        if stats is None:
+            result["status"] = "empty"
+        elif not flush_index_uploads(task["upload_timeout"]):
+            raise RuntimeError("rebuilt index is not fully uploaded to S3")
+        else:
+            result.update(stats, status="done")
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def load_checkpoint(path, restart):
+    """Return the checkpoint to resume from, or a fresh one."""
+    if not restart and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"started_at": datetime.utcnow().isoformat(), "tenants": {}}
+
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace the checkpoint file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def collect_tasks(args):
+    """Return one rebuild task per active client, with expected counts."""
+    engine = create_engine(settings.DATABASE_URL)
+    SessionLocal = sessionmaker(bind=engine)
+    db = SessionLocal()
+
+    try:
+        query = db.query(Client).filter(Client.is_active == True)  # noqa: E712
+        if args.client_id:
+            query = query.filter(Client.id.in_(args.client_id))
+        clients = query.all()
+
+        expected = defaultdict(dict)
+        documents = db.query(
+            Document.client_id, Document.id, Document.chunk_count
+        ).filter(Document.status == DocumentStatus.READY.value)
+        for client_id, document_id, chunk_count in documents:
+            expected[str(client_id)][str(document_id)] = chunk_count or 0
+
+        return [
+            {
+                "client_id": str(client.id),
+                "plan": client.plan_type.value,
+                "expected": expected.get(str(client.id), {}),
+                "reembed": args.reembed_missing,
+                "attempts": args.attempts,
+                "upload_timeout": args.upload_timeout,
+            }
+            for client in clients
+        ]
+    finally:
+        db.close()
+
+
+def report(results, wall_seconds):
+    """Log a summary of the finished run."""
+    done = [r for r in results if r["status"] == "done"]
+    failed = [r for r in results if r["status"] == "failed"]
+    vectors = sum(r["vectors"] for r in done)
+
+    logger.info(
+        f"Rebuilt {len(done)} tenants ({vectors} vectors) in {wall_seconds:.1f}s "
+        f"wall, {vectors / wall_seconds if wall_seconds else 0:.0f} vectors/s; "
+        f"{len(failed)} failed, "
+        f"{len(results) - len(done) - len(failed)} empty"
+    )
+    for r in failed:
+        logger.error(f"Rebuild failed for client {r['client_id']}: {r['error']}")
+
+
+def rebuild_all_indexes(args):
+    """Rebuild every pending tenant in a process pool."""
+    checkpoint = load_checkpoint(args.checkpoint, args.restart)
+    finished = checkpoint["tenants"]
+
+    tasks = [
+        task
+        for task in collect_tasks(args)
+        if finished.get(task["client_id"], {}).get("status") not in ("done", "empty")
+    ]
+    if not tasks:
+        logger.info("No tenants left to rebuild")
+        return
+
+    logger.info(
+        f"Rebuilding {len(tasks)} tenants with {args.workers} workers "
+        f"({len(finished)} already in checkpoint)"
+    )
+
+    started = time.perf_counter()
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        futures = [pool.submit(rebuild_tenant, task) for task in tasks]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            finished[result["client_id"]] = result
+            save_checkpoint(args.checkpoint, checkpoint)
+
+            if result["status"] == "done":
+                rate = result["vectors"] / result["seconds"] if result["seconds"] else 0
+                logger.info(
+                    f"[{len(results)}/{len(tasks)}] {result['client_id']}: "
+                    f"{result['vectors']} vectors as {result['kind']} in "
+                    f"{result['seconds']:.1f}s ({rate:.0f} vectors/s, "
+                    f"{result['reembedded']} documents re-embedded)"
+                )
+            else:
+                logger.info(
+                    f"[{len(results)}/{len(tasks)}] {result['client_id']}: "
+                    f"{result['status']} after {result['seconds']:.1f}s"
+                )
+
+    report(results, time.perf_counter() - started)
+
+
+def main():
+    """Parse arguments and run the rebuild."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore an existing checkpoint"
+    )
+    parser.add_argument(
+        "--client-id", action="append", help="only rebuild these clients"
+    )
+    parser.add_argument(
+        "--reembed-missing",
+        action="store_true",
+        help="re-embed stored chunk text of documents missing from the vault",
+    )
+    parser.add_argument("--attempts", type=int, default=3)
+    parser.add_argument("--upload-timeout", type=float, default=600.0)
+    rebuild_all_indexes(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Tune a tenant's HNSW efSearch and record it in the index manifest.
+
+Embeds a sample of the tenant's logged queries (falling back to perturbed
+stored vectors when there are none), then measures recall@k against exact
+search and per-query latency at several efSearch values. The smallest
+value reaching --target-recall is stored as the tenant's recommended
+efSearch, together with the measured profile, so searches can also ask
+for a recall target instead of an efSearch.
+
+    python scripts/tune_ef_search.py --client-id <uuid> --target-recall 0.95
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from backend.app.core.config import settings  # noqa: E402
+from backend.app.core.index_factory import (  # noqa: E402
+    build_index,
+    prepare_vectors,
+    recommend_ef_search,
+    search_params,
+)
+from backend.app.core.vectorstore import (  # noqa: E402
+    _reconstruct_vectors,
+    flush_index_uploads,
+    load_index,
+    save_search_tuning,
+)
+from backend.app.models.chat_logs import ChatLog  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_EF_VALUES = [16, 32, 64, 128, 256, 512]
+
+
+def logged_queries(client_id, limit):
+    """Return the tenant's most recent distinct logged queries."""
+    engine = create_engine(settings.DATABASE_URL)
+    SessionLocal = sessionmaker(bind=engine)
+    db = SessionLocal()
+
+    try:
+        rows = (
+            db.query(ChatLog.query_text)
+            .filter(ChatLog.client_id == client_id)
+            .order_by(ChatLog.timestamp.desc())
+            .limit(limit * 4)
+            .all()
+        )
+    finally:
+        db.close()
+
+    texts = list(dict.fromkeys(text for (text,) in rows if text and text.strip()))
+    return texts[:limit]
+
+
+def query_vectors(client_id, client_index, limit, seed):
+    """Return query vectors: embedded logged queries, or stored vectors."""
+    texts = logged_queries(client_id, limit)
+    if texts:
+        from backend.app.ingestion.embedder import get_embeddings
+
+        embeddings, _ = asyncio.run(get_embeddings(texts))
+        logger.info(f"Using {len(texts)} logged queries")
+        return np.asarray(embeddings, dtype="float32")
+
+    logger.info("No logged queries; sampling stored vectors instead")
+    rng = np.random.default_rng(seed)
+    vectors = np.vstack([_reconstruct_vectors(s.index) for s in client_index.segments])
+    picks = rng.choice(len(vectors), size=min(limit, len(vectors)), replace=False)
+    noise = rng.normal(scale=0.01, size=(len(picks), vectors.shape[1]))
+    return (vectors[picks] + noise).astype("float32")
+
+
+def measure(client_index, queries, k, ef_values):
+    """Measure recall@k and latency of every HNSW segment at each efSearch.
+
+    Recall is weighted by segment size; latency is the per-query time
+    summed over segments, as a search visits all of them.
+    """
+    segments = [
+        s for s in client_index.segments if isinstance(s.searcher, faiss.IndexHNSW)
+    ]
+    if not segments:
+        return []
+
+    truths = []
+    for segment in segments:
+        exact = build_index("flat", segment.index.d, metric=segment.metric)
+        exact.add(_reconstruct_vectors(segment.index))
+        prepared = prepare_vectors(queries, segment.metric)
+        kk = min(k, segment.index.ntotal)
+        truths.append((segment, prepared, kk, exact.search(prepared, kk)[1]))
+
+    total = sum(segment.index.ntotal for segment in segments)
+    profile = []
+    for ef_search in ef_values:
+        recall, seconds = 0.0, 0.0
+        for segment, prepared, kk, truth in truths:
+            started = time.perf_counter()
+            _, found = segment.searcher.search(
+                prepared, kk, params=search_params(segment.searcher, ef_search)
+            )
+            seconds += time.perf_counter() - started
+
+            hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+            recall += hits / truth.size * segment.index.ntotal / total
+
+        profile.append(
+            {
+                "ef_search": ef_search,
+                "recall": round(recall, 4),
+                "latency_ms": round(seconds * 1000 / len(queries), 4),
+            }
+        )
+    return profile
+
+
+def main():
+    """Parse arguments, measure, and record the tuning."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--client-id", required=True)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ef", type=int, nargs="+", default=DEFAULT_EF_VALUES)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="print without saving")
+    args = parser.parse_args()
+
+    client_index = load_index(args.client_id)
+    if not client_index.segments:
+        logger.error(f"Client {args.client_id} has no index")
+        return
+
+    queries = query_vectors(args.client_id, client_index, args.queries, args.seed)
+    profile = measure(client_index, queries, args.k, sorted(set(args.ef)))
+    if not profile:
+        logger.info(f"Client {args.client_id} has no HNSW segments to tune")
+        return
+
+    recommended = recommend_ef_search(profile, args.target_recall)
+    print(f"| efSearch | recall@{args.k} | latency ms |")
+    print("|---|---|---|")
+    for point in profile:
+        marker = " *" if point["ef_search"] == recommended else ""
+        print(
+            f"| {point['ef_search']}{marker} | {point['recall']:.4f} "
+            f"| {point['latency_ms']:.3f} |"
+        )
+
+    if args.dry_run:
+        return
+
+    tuning = {
+        "k": args.k,
+        "queries": len(queries),
+        "target_recall": args.target_recall,
+        "recommended": recommended,
+        "profile": profile,
+        "tuned_at": datetime.utcnow().isoformat(),
+    }
+    if not save_search_tuning(args.client_id, tuning):
+        logger.error(f"Client {args.client_id} has no index manifest")
+        return
+    if not flush_index_uploads():
+        logger.error("Manifest upload did not complete")
+    logger.info(f"Recorded efSearch {recommended} for client {args.client_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Tests for the columnar chunk metadata store."""
+
+from backend.app.core.chunk_store import ChunkStore
+
+
+def test_round_trip_preserves_rows(tmp_path):
+    """Rows written to disk come back identical through mmap."""
+    rows = [
+        {
+            "text": "Reset your password using the email link.",
+            "metadata": {"filename": "faq.pdf", "chunk_index": 0, "token_count": 9},
+            "document_id": "doc-1",
+            "chunk_index": 0,
+        },
+        {"text": "Ünïcode chunk", "metadata": {}, "document_id": "doc-1"},
+        {"id": 7},
+    ]
+    path = str(tmp_path / "seg.chunks")
+
+    ChunkStore.write(path, rows)
+    store = ChunkStore.open(path)
+
+    assert len(store) == 3
+    assert list(store) == rows
+    assert store.rows([2, 0]) == [rows[2], rows[0]]
+
+
+def test_filenames_and_document_ids_are_interned():
+    """Repeated strings are stored once and referenced by code."""
+    rows = [
+        {"text": str(i), "metadata": {"filename": "manual.pdf"}, "document_id": "d1"}
+        for i in range(100)
+    ]
+
+    store = ChunkStore.from_rows(rows)
+
+    assert store.document_ids == ["d1"]
+    assert set(store.document_codes.tolist()) == {0}
+    assert store.nbytes < len(repr(rows))
+
+
+def test_client_ids_tag_rows_of_packed_tenants():
+    """Client ids round-trip as interned codes; untagged rows have none."""
+    rows = [{"text": "a", "client_id": "c1"}, {"text": "b"}, {"client_id": "c2"}]
+
+    store = ChunkStore.from_rows(rows)
+
+    assert list(store) == rows
+    assert store.client_ids == ["c1", "c2"]
+    assert store.client_codes.tolist() == [0, -1, 1]
@@ -1,6 +1,4 @@
-"""
-Tests for embed_and_index ingestion pipeline.
-"""
+"""Tests for embed_and_index ingestion pipeline."""
 
 from unittest.mock import patch
 import pytest
@@ -11,14 +9,13 @@ from backend.app.ingestion.embedder import embed_and_index
 @pytest.mark.asyncio
 @patch("backend.app.ingestion.embedder.get_embeddings")
 @patch("backend.app.core.vectorstore.add_to_index")
+@patch("backend.app.core.vectorstore.save_embeddings")
 async def test_embed_and_index_success(
+    mock_save_embeddings,
     mock_add_to_index,
     mock_get_embeddings,
 ):
-    """
-    Ensure embeddings are generated and passed correctly to FAISS.
-    """
-
+    """Ensure embeddings are generated and passed correctly to FAISS."""
     fake_embeddings = [[0.0] * 1536]
 
     mock_get_embeddings.return_value = (
@@ -40,6 +37,12 @@ async def test_embed_and_index_success(
     )
 
     mock_add_to_index.assert_called_once()
+    mock_save_embeddings.assert_called_once()
+    assert mock_save_embeddings.call_args.args[:3] == (
+        "test-client",
+        "doc-123",
+        fake_embeddings,
+    )
 
     assert usage["tokens"] == 5
     assert usage["cost_usd"] == 0.0001
@@ -48,10 +51,7 @@ async def test_embed_and_index_success(
 
 @pytest.mark.asyncio
 async def test_embed_and_index_empty_chunks():
-    """
-    Empty chunks should short-circuit without errors.
-    """
-
+    """Empty chunks should short-circuit without errors."""
     usage = await embed_and_index(
         client_id="test-client",
         chunks=[],
@@ -60,3 +60,26 @@ async def test_embed_and_index_empty_chunks():
 
     assert usage["tokens"] == 0
     assert usage["cost_usd"] == 0.0
+
+
+@pytest.mark.asyncio
+@patch("backend.app.ingestion.embedder.get_embeddings")
+@patch("backend.app.core.vectorstore.add_to_index")
+@patch("backend.app.core.vectorstore.save_embeddings")
+async def test_embed_and_index_survives_vault_failure(
+    mock_save_embeddings,
+    mock_add_to_index,
+    mock_get_embeddings,
+):
+    """A failed vault write must not fail an ingestion that was indexed."""
+    mock_get_embeddings.return_value = ([[0.0] * 1536], {"tokens": 1})
+    mock_save_embeddings.side_effect = RuntimeError("S3 down")
+
+    usage = await embed_and_index(
+        client_id="test-client",
+        chunks=[{"text": "hello"}],
+        document_id="doc-1",
+    )
+
+    mock_add_to_index.assert_called_once()
+    assert usage["tokens"] == 1
@@ -1,9 +1,14 @@
 """Tests for embedder (mocking OpenAI API)."""
 
+import asyncio
+from types import SimpleNamespace
 from unittest.mock import patch
 
+import httpx
 import pytest
+from openai import APIConnectionError
 
+from backend.app.ingestion import embedder
 from backend.app.ingestion.embedder import embed_chunks
 
 
@@ -23,3 +28,99 @@ async def test_embed_chunks(mock_get_embeddings):
     assert "embedding" in embedded_chunks[0]
     assert embedded_chunks[0]["embedding"] == fake_emb[0]
     assert stats["tokens"] == 10
+
+
+class FakeEncoding:
+    """Tokenizer with one token per word."""
+
+    def encode_ordinary_batch(self, texts):
+        """Split each text into words."""
+        return [text.split() for text in texts]
+
+    def decode(self, tokens):
+        """Join words back into text."""
+        return " ".join(tokens)
+
+
+class FakeEmbeddings:
+    """Embeddings endpoint returning each input's trailing id as its vector."""
+
+    def __init__(self, failures=0):
+        """Fail the first ``failures`` calls with a connection error."""
+        self.calls = []
+        self.failures = failures
+        self.active = self.peak = 0
+
+    async def create(self, model, input):
+        """Record the batch and return its embeddings in reverse order."""
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        self.calls.append(list(input))
+        if self.failures:
+            self.failures -= 1
+            raise APIConnectionError(request=httpx.Request("POST", "http://api"))
+        data = [
+            SimpleNamespace(index=i, embedding=[float(text.split()[-1])])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(
+            data=data[::-1],
+            usage=SimpleNamespace(total_tokens=sum(len(t.split()) for t in input)),
+        )
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    """Route embedder calls to a fake tokenizer and endpoint."""
+    endpoint = FakeEmbeddings()
+    monkeypatch.setattr(embedder, "_encoding", lambda model: FakeEncoding())
+    monkeypatch.setattr(
+        embedder, "_client", lambda: SimpleNamespace(embeddings=endpoint)
+    )
+    monkeypatch.setattr(embedder.settings, "EMBEDDING_RETRY_DELAY", 0.0)
+    return endpoint
+
+
+@pytest.mark.asyncio
+async def test_get_embeddings_batches_concurrently_in_order(fake_openai, monkeypatch):
+    """Batches respect item and token limits and results keep input order."""
+    monkeypatch.setattr(embedder.settings, "EMBEDDING_BATCH_MAX_ITEMS", 3)
+    monkeypatch.setattr(embedder.settings, "EMBEDDING_BATCH_MAX_TOKENS", 6)
+    monkeypatch.setattr(embedder.settings, "EMBEDDING_CONCURRENCY", 2)
+    texts = ["a " * (i % 4) + str(i) for i in range(10)]
+
+    embeddings, usage = await embedder.get_embeddings(texts)
+
+    assert embeddings == [[float(i)] for i in range(10)]
+    assert usage["tokens"] == sum(len(t.split()) for t in texts)
+    assert all(len(batch) <= 3 for batch in fake_openai.calls)
+    assert all(sum(len(t.split()) for t in batch) <= 6 for batch in fake_openai.calls)
+    assert len(fake_openai.calls) > 2
+    assert fake_openai.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_get_embeddings_truncates_long_inputs(fake_openai, monkeypatch):
+    """Inputs over the model limit are cut to their first tokens."""
+    monkeypatch.setattr(embedder.settings, "EMBEDDING_MAX_INPUT_TOKENS", 3)
+
+    await embedder.get_embeddings(["1 2 3 4 5", "7"])
+
+    assert fake_openai.calls == [["1 2 3", "7"]]
+
+
+@pytest.mark.asyncio
+async def test_get_embeddings_retries_failed_batches(fake_openai, monkeypatch):
+    """Transient errors are retried; exhausted retries raise RuntimeError."""
+    monkeypatch.setattr(embedder.settings, "EMBEDDING_RETRIES", 1)
+    fake_openai.failures = 1
+
+    embeddings, _ = await embedder.get_embeddings(["a 1", "b 2"])
+    assert embeddings == [[1.0], [2.0]]
+    assert len(fake_openai.calls) == 2
+
+    fake_openai.failures = 2
+    with pytest.raises(RuntimeError):
+        await embedder.get_embeddings(["a 1"])
@@ -0,0 +1,67 @@
+"""Tests for the raw embedding vault file format."""
+
+import numpy as np
+import pytest
+
+from backend.app.core.embedding_vault import (
+    EmbeddingVaultFile,
+    compress,
+    decompress,
+)
+
+
+def _document(n=50, dim=64):
+    """Return unit-norm vectors and matching rows, like OpenAI embeddings."""
+    vectors = np.random.default_rng(0).normal(size=(n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = [
+        {"text": f"chunk {i}", "document_id": "doc-1", "chunk_index": i}
+        for i in range(n)
+    ]
+    return vectors, rows
+
+
+def test_round_trip_through_mmap(tmp_path):
+    """Vectors and rows written to disk come back exactly."""
+    vectors, rows = _document()
+    path = tmp_path / "doc-1.vec"
+    path.write_bytes(
+        EmbeddingVaultFile.encode(vectors, rows, document_id="doc-1", model="m")
+    )
+
+    vault = EmbeddingVaultFile.open(str(path))
+
+    assert len(vault) == 50
+    assert vault.document_id == "doc-1"
+    assert vault.model == "m"
+    np.testing.assert_array_equal(vault.vectors, vectors)
+    assert list(vault.chunks) == rows
+
+
+def test_compression_is_lossless_and_smaller():
+    """The S3 form shrinks embeddings and restores them bit for bit."""
+    vectors, rows = _document(n=500, dim=256)
+    data = EmbeddingVaultFile.encode(vectors, rows)
+
+    blob = compress(data)
+
+    assert len(blob) < len(data)
+    assert decompress(blob) == data
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    """A partially written file fails to open instead of returning garbage."""
+    vectors, rows = _document()
+    path = tmp_path / "doc-1.vec"
+    path.write_bytes(EmbeddingVaultFile.encode(vectors, rows)[:-10])
+
+    with pytest.raises(ValueError):
+        EmbeddingVaultFile.open(str(path))
+
+
+def test_row_count_must_match_vectors():
+    """Every vector needs exactly one metadata row."""
+    vectors, rows = _document()
+
+    with pytest.raises(ValueError):
+        EmbeddingVaultFile.encode(vectors, rows[:-1])
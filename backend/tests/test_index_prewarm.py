@@ -0,0 +1,103 @@
+"""Tests for FAISS index prewarming and the shared hot set."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import backend.app.core.vectorstore as vs
+import backend.app.services.index_prewarm as prewarm
+
+
+class FakeRedis:
+    """The sorted-set subset of Redis used by the hot set."""
+
+    def __init__(self):
+        """Start with no sorted sets."""
+        self.zsets = {}
+
+    def zadd(self, key, mapping, gt=False):
+        """Set scores, only raising existing ones when ``gt`` is set."""
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not gt or score > zset.get(member, float("-inf")):
+                zset[member] = score
+
+    def expire(self, key, seconds):
+        """Ignore expiry."""
+
+    def zremrangebyscore(self, key, low, high):
+        """Drop members scored at or below ``high``."""
+        zset = self.zsets.get(key, {})
+        for member in [m for m, score in zset.items() if score <= high]:
+            del zset[member]
+
+    def zrevrange(self, key, start, end):
+        """Return members from highest to lowest score."""
+        members = sorted(self.zsets.get(key, {}).items(), key=lambda kv: -kv[1])
+        return [member for member, _ in members[start : end + 1]]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Give the vectorstore a fresh 100-byte index cache."""
+    cache = vs.LRUIndexCache(max_bytes=100)
+    monkeypatch.setattr(vs, "_index_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def loads(monkeypatch, cache):
+    """Replace index loads with 30-byte entries; ``missing`` has no index."""
+    loaded = []
+
+    def fake_load(client_id):
+        if client_id == "missing":
+            raise FileNotFoundError(client_id)
+        loaded.append(client_id)
+        cache.put(client_id, SimpleNamespace(nbytes=30))
+
+    monkeypatch.setattr(prewarm, "load_tenant_index", fake_load)
+    return loaded
+
+
+def test_prewarm_loads_in_rank_order_within_budget(cache, loads):
+    """Cached and missing tenants are skipped; loading stops at the budget."""
+    cache.put("c0", SimpleNamespace(nbytes=10))
+
+    count = prewarm.prewarm_indexes(["c0", "missing", "c1", "c2", "c3", "c4"], 60)
+
+    assert count == 2
+    assert loads == ["c1", "c2"]
+    assert cache.evictions == 0
+
+
+def test_prewarm_stops_once_loads_evict(cache, loads):
+    """A load that evicts another tenant ends the prewarm."""
+    count = prewarm.prewarm_indexes([f"c{i}" for i in range(10)], 1000)
+
+    assert count == 4
+    assert cache.evictions == 1
+
+
+def test_hot_set_is_ranked_before_chat_activity(monkeypatch, cache):
+    """A snapshot of one worker's cache is warmed first by the next worker."""
+    redis = FakeRedis()
+    monkeypatch.setattr(prewarm, "redis_client", redis)
+    monkeypatch.setattr(prewarm, "active_clients", lambda limit: ["c9", "c1"])
+    cache.put("c1", SimpleNamespace(nbytes=1))
+    cache.put("c2", SimpleNamespace(nbytes=1))
+
+    assert prewarm.snapshot_hot_set() == 2
+    assert prewarm.rank_clients(limit=3) == ["c2", "c1", "c9"]
+
+
+def test_prefetch_ignores_tenants_without_index(monkeypatch):
+    """A login prefetch never raises, even without an index."""
+
+    async def missing(client_id):
+        raise FileNotFoundError(client_id)
+
+    monkeypatch.setattr(prewarm, "aload_tenant_index", missing)
+
+    asyncio.run(prewarm.prefetch_index("c1"))
@@ -0,0 +1,48 @@
+"""Tests for the BM25 lexical index of segment chunk texts."""
+
+import numpy as np
+
+from backend.app.core.lexical_index import LexicalIndex, bm25_idf, tokenize
+
+
+def test_identifiers_are_kept_whole_and_split():
+    """Joined identifiers match both as a whole and by their parts."""
+    assert tokenize("How do I fix ERR_TIMEOUT on SKU-4411-B?") == [
+        "fix",
+        "err_timeout",
+        "err",
+        "timeout",
+        "sku-4411-b",
+        "sku",
+        "4411",
+    ]
+
+
+def test_round_trip_and_lookup(tmp_path):
+    """Postings survive a write and mmap open; unknown terms have none."""
+    texts = ["Error E1023 on startup", None, "error error retry", "Ünïcode term"]
+    path = str(tmp_path / "seg.terms")
+
+    LexicalIndex.write(path, texts)
+    index = LexicalIndex.open(path)
+
+    rows, counts = index.postings("error")
+    assert len(index) == 4 and index.tokens == 8
+    assert rows.tolist() == [0, 2] and counts.tolist() == [1, 2]
+    assert index.postings("ünïcode")[0].tolist() == [3]
+    assert index.postings("missing")[0].size == 0
+    assert index.lengths.tolist() == [3, 0, 3, 2]
+
+
+def test_rare_terms_outrank_common_ones():
+    """BM25 favours rows holding the rarer query terms."""
+    texts = ["reset password"] * 8 + ["reset password for sku 4411", "sku 4411"]
+    index = LexicalIndex.from_texts(texts)
+    terms = ["reset", "sku"]
+    idf = bm25_idf(len(index), np.array([index.document_frequency(t) for t in terms]))
+
+    rows, scores, matched = index.score(terms, idf, index.tokens / len(index))
+
+    assert rows[np.argmax(scores)] in (8, 9)
+    assert matched[rows.tolist().index(8)] == idf.sum()
+    assert matched[rows.tolist().index(0)] == idf[0]
@@ -0,0 +1,69 @@
+"""Tests for memory-mapped serving of flat FAISS index files."""
+
+import faiss
+import numpy as np
+import pytest
+
+from backend.app.core.mapped_index import MappedFlatIndex
+
+
+def _vectors(n=300, dim=32):
+    """Return reproducible random vectors."""
+    return np.random.default_rng(0).normal(size=(n, dim)).astype("float32")
+
+
+@pytest.mark.parametrize("metric", [faiss.METRIC_L2, faiss.METRIC_INNER_PRODUCT])
+def test_search_matches_faiss_flat_index(tmp_path, metric):
+    """Mapped search returns the same neighbours and ids as IndexFlat."""
+    vectors = _vectors()
+    ids = np.arange(1000, 1300, dtype="int64")
+    index = faiss.IndexIDMap(faiss.IndexFlat(32, metric))
+    index.add_with_ids(vectors, ids)
+    path = str(tmp_path / "seg.index")
+    faiss.write_index(index, path)
+
+    mapped = MappedFlatIndex.open(path)
+    queries = vectors[:5] + 0.01
+
+    distances, rows = mapped.search(queries, 10)
+    expected_distances, expected_ids = index.search(queries, 10)
+
+    assert mapped.ntotal == 300 and mapped.d == 32
+    assert mapped.metric_type == metric
+    np.testing.assert_array_equal(mapped.id_map, ids)
+    np.testing.assert_array_equal(mapped.id_map[rows], expected_ids)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+    np.testing.assert_array_equal(mapped.reconstruct_n(0, 300), vectors)
+
+
+def test_bare_flat_index_has_no_id_map(tmp_path):
+    """An index without an id map is mapped with row labels."""
+    index = faiss.IndexFlatL2(32)
+    index.add(_vectors())
+    path = str(tmp_path / "seg.index")
+    faiss.write_index(index, path)
+
+    mapped = MappedFlatIndex.open(path)
+
+    assert mapped.id_map is None
+    assert mapped.search(_vectors()[:1], 1)[1][0, 0] == 0
+    assert mapped.search(_vectors()[:1], 400)[1][0, -1] == -1
+
+
+def test_other_index_kinds_are_not_mapped(tmp_path):
+    """HNSW, quantized and truncated files are left to faiss.read_index."""
+    vectors = _vectors()
+    hnsw = faiss.IndexHNSWFlat(32, 8)
+    hnsw.add(vectors)
+    sq = faiss.IndexScalarQuantizer(32, faiss.ScalarQuantizer.QT_fp16)
+    sq.add(vectors)
+    flat = faiss.IndexFlatL2(32)
+    flat.add(vectors)
+
+    for name, index in (("hnsw", hnsw), ("sq", sq)):
+        faiss.write_index(index, str(tmp_path / name))
+        assert MappedFlatIndex.open(str(tmp_path / name)) is None
+
+    data = faiss.serialize_index(flat).tobytes()
+    (tmp_path / "truncated").write_bytes(data[:-4])
+    assert MappedFlatIndex.open(str(tmp_path / "truncated")) is None
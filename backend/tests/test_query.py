@@ -39,3 +39,12 @@ def test_query_invalid_token():
     assert (
         response.status_code == 401
     ), f"Expected 401 for invalid token, got {response.status_code}"
+
+
+def test_query_batch_unauthorized():
+    """Test that unauthenticated batch requests are rejected."""
+    response = client.post("/query/batch", json={"queries": ["Test question"]})
+    assert response.status_code in (
+        401,
+        403,
+    ), f"Expected 401/403, got {response.status_code}"
@@ -1,5 +1,7 @@
 """Tests for the RAG pipeline orchestration logic."""
 
+from unittest.mock import AsyncMock
+
 import pytest
 
 from backend.app.rag.pipeline import run_rag_pipeline
@@ -130,3 +132,90 @@ async def test_pipeline_empty_query() -> None:
 
     assert result["confidence"] == 0.0
     assert "valid question" in result["answer"].lower()
+
+
+@pytest.mark.asyncio
+async def test_keyword_match_with_weak_vector_score_escalates(monkeypatch) -> None:
+    """A full lexical match does not raise confidence above the vector score."""
+    chunk = {
+        "text": "You can cancel from the billing page.",
+        "metadata": {"filename": "billing.pdf", "chunk_index": 0},
+        "document_id": "d",
+        "chunk_index": 0,
+    }
+    monkeypatch.setattr(
+        "backend.app.rag.retriever.get_embeddings",
+        AsyncMock(return_value=([[0.1] * 3], {})),
+    )
+    monkeypatch.setattr(
+        "backend.app.rag.retriever.asearch_index",
+        AsyncMock(return_value=[{**chunk, "score": 0.1}]),
+    )
+    monkeypatch.setattr(
+        "backend.app.rag.retriever.asearch_lexical",
+        AsyncMock(return_value=[{**chunk, "score": 1.0}]),
+    )
+    monkeypatch.setattr(
+        "backend.app.rag.pipeline.generate_answer",
+        AsyncMock(
+            return_value=(
+                "Cancel from billing.",
+                {
+                    "model_used": "fake",
+                    "input_tokens": 1,
+                    "output_tokens": 1,
+                    "cost_usd": 0.0,
+                },
+            )
+        ),
+    )
+
+    result = await run_rag_pipeline(client_id="test-client", query="How do I cancel?")
+
+    assert result["confidence"] == pytest.approx(0.1)
+    assert result["should_escalate"] is True
+
+
+@pytest.mark.asyncio
+async def test_lexical_only_top_hit_keeps_vector_confidence(monkeypatch) -> None:
+    """Confidence comes from the best vector score, not the fused winner."""
+    monkeypatch.setattr(
+        "backend.app.rag.pipeline.retrieve_relevant_chunks",
+        AsyncMock(
+            return_value=[
+                {
+                    "text": "Error E1234 means the card was declined.",
+                    "metadata": {"filename": "errors.pdf", "chunk_index": 3},
+                    "score": 0.0,
+                    "lexical_score": 1.0,
+                    "rrf_score": 0.02,
+                },
+                {
+                    "text": "Declined payments can be retried from billing.",
+                    "metadata": {"filename": "billing.pdf", "chunk_index": 1},
+                    "score": 0.8,
+                    "lexical_score": 0.0,
+                    "rrf_score": 0.01,
+                },
+            ]
+        ),
+    )
+    monkeypatch.setattr(
+        "backend.app.rag.pipeline.generate_answer",
+        AsyncMock(
+            return_value=(
+                "The card was declined.",
+                {
+                    "model_used": "fake",
+                    "input_tokens": 1,
+                    "output_tokens": 1,
+                    "cost_usd": 0.0,
+                },
+            )
+        ),
+    )
+
+    result = await run_rag_pipeline(client_id="test-client", query="What is E1234?")
+
+    assert result["confidence"] == pytest.approx(0.8)
+    assert result["should_escalate"] is False
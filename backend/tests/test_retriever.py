@@ -1,12 +1,29 @@
+import asyncio
+
 import pytest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 pytestmark = pytest.mark.integration
 
-from backend.app.rag.retriever import retrieve_relevant_chunks
+from backend.app.rag.retriever import (
+    retrieve_relevant_chunks,
+    retrieve_relevant_chunks_batch,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_lexical_hits():
+    """Keep tests hermetic by returning no BM25 hits."""
+    with patch(
+        "backend.app.rag.retriever.asearch_lexical",
+        new_callable=AsyncMock,
+        return_value=[],
+    ) as mock_search_lexical:
+        yield mock_search_lexical
 
 
 @pytest.mark.asyncio
 async def test_retriever_empty_query():
+    """A blank query returns no chunks."""
     results = await retrieve_relevant_chunks(
         client_id="test-client",
         query="",
@@ -18,6 +35,7 @@ async def test_retriever_empty_query():
 @pytest.mark.asyncio
 @patch("backend.app.rag.retriever.get_embeddings")
 async def test_retriever_embedding_failure(mock_get_embeddings):
+    """An embedding failure returns no chunks instead of raising."""
     mock_get_embeddings.side_effect = Exception("Embedding failed")
 
     results = await retrieve_relevant_chunks(
@@ -31,8 +49,9 @@ async def test_retriever_embedding_failure(mock_get_embeddings):
 
 @pytest.mark.asyncio
 @patch("backend.app.rag.retriever.get_embeddings")
-@patch("backend.app.rag.retriever.search_index")
+@patch("backend.app.rag.retriever.asearch_index", new_callable=AsyncMock)
 async def test_retriever_success(mock_search_index, mock_get_embeddings):
+    """Vector hits are returned in the retriever format."""
     mock_get_embeddings.return_value = ([[0.1] * 1536], {})
     mock_search_index.return_value = [
         {
@@ -50,4 +69,151 @@ async def test_retriever_success(mock_search_index, mock_get_embeddings):
 
     assert len(results) == 1
     assert results[0]["text"] == "Test chunk"
-    assert "score" in results[0]
\ No newline at end of file
+    assert "score" in results[0]
+
+
+@pytest.mark.asyncio
+@patch("backend.app.rag.retriever.get_embeddings")
+@patch("backend.app.rag.retriever.asearch_index_batch", new_callable=AsyncMock)
+async def test_retriever_batch_keeps_query_order(
+    mock_search_index_batch, mock_get_embeddings
+):
+    """Blank queries get empty results and the rest keep their order."""
+    mock_get_embeddings.return_value = ([[0.1] * 1536, [0.2] * 1536], {"tokens": 4})
+    mock_search_index_batch.return_value = [
+        [{"text": "first", "metadata": {}, "score": 0.9}],
+        [{"text": "second", "metadata": {}, "score": 0.8}],
+    ]
+
+    results, usage = await retrieve_relevant_chunks_batch(
+        client_id="test-client",
+        queries=["reset password", " ", "billing"],
+        top_k=1
+    )
+
+    mock_get_embeddings.assert_called_once_with(texts=["reset password", "billing"])
+    assert [[r["text"] for r in hits] for hits in results] == [
+        ["first"], [], ["second"]
+    ]
+    assert usage["tokens"] == 4
+
+
+@pytest.mark.asyncio
+@patch("backend.app.rag.retriever.get_embeddings")
+@patch("backend.app.rag.retriever.asearch_index", new_callable=AsyncMock)
+async def test_retriever_document_filter(mock_search_index, mock_get_embeddings):
+    """Document filters reach the search; an empty filter skips it."""
+    mock_get_embeddings.return_value = ([[0.1] * 1536], {})
+    mock_search_index.return_value = []
+
+    await retrieve_relevant_chunks(
+        client_id="test-client",
+        query="reset password",
+        document_ids=["doc-1"]
+    )
+    results = await retrieve_relevant_chunks(
+        client_id="test-client",
+        query="reset password",
+        document_ids=[]
+    )
+
+    assert results == []
+    assert mock_search_index.call_args.kwargs["document_ids"] == ["doc-1"]
+    mock_get_embeddings.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch("backend.app.rag.retriever.get_embeddings")
+@patch("backend.app.rag.retriever.asearch_lexical", new_callable=AsyncMock)
+@patch("backend.app.rag.retriever.asearch_index", new_callable=AsyncMock)
+async def test_retriever_fuses_vector_and_lexical_rankings(
+    mock_search_index, mock_search_lexical, mock_get_embeddings
+):
+    """Fusion ranks by RRF and keeps vector and lexical scores apart."""
+    mock_get_embeddings.return_value = ([[0.1] * 1536], {})
+    def hit(text, chunk_index, score):
+        return {
+            "text": text,
+            "metadata": {},
+            "document_id": "d",
+            "chunk_index": chunk_index,
+            "score": score,
+        }
+
+    mock_search_index.return_value = [hit("a", 0, 0.5), hit("b", 1, 0.4)]
+    mock_search_lexical.return_value = [hit("b", 1, 1.0), hit("c", 2, 0.3)]
+
+    results = await retrieve_relevant_chunks(
+        client_id="test-client",
+        query="how do I reset the router",
+        top_k=2
+    )
+
+    assert [(r["text"], r["score"], r["lexical_score"]) for r in results] == [
+        ("b", 0.4, 1.0), ("a", 0.5, 0.0)
+    ]
+    assert results[0]["rrf_score"] > results[1]["rrf_score"]
+
+
+@pytest.mark.asyncio
+@patch("backend.app.rag.retriever.get_embeddings")
+@patch("backend.app.rag.retriever.asearch_lexical", new_callable=AsyncMock)
+async def test_retriever_lexical_only_hits_have_no_vector_score(
+    mock_search_lexical, mock_get_embeddings
+):
+    """Lexical-only hits score 0.0 and are not held to min_score."""
+    mock_get_embeddings.side_effect = Exception("Embedding failed")
+    mock_search_lexical.return_value = [
+        {"text": "E1023 means expired", "metadata": {}, "score": 1.0}
+    ]
+
+    results = await retrieve_relevant_chunks(
+        client_id="test-client",
+        query="E1023",
+        top_k=1
+    )
+    filtered = await retrieve_relevant_chunks(
+        client_id="test-client",
+        query="E1023",
+        top_k=1,
+        min_score=0.5
+    )
+
+    assert [(r["text"], r["score"], r["lexical_score"]) for r in results] == [
+        ("E1023 means expired", 0.0, 1.0)
+    ]
+    assert filtered == results
+
+
+@pytest.mark.asyncio
+@patch("backend.app.rag.retriever.get_embeddings")
+@patch("backend.app.rag.retriever.asearch_lexical")
+async def test_retriever_batch_cancels_lexical_search_on_failure(
+    mock_search_lexical, mock_get_embeddings
+):
+    """A failed batch embedding cancels the BM25 searches it started."""
+    cancelled = []
+
+    async def slow_lexical(**kwargs):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(kwargs["query"])
+            raise
+
+    async def failing_embeddings(texts):
+        await asyncio.sleep(0)
+        raise RuntimeError("Embedding failed")
+
+    mock_search_lexical.side_effect = slow_lexical
+    mock_get_embeddings.side_effect = failing_embeddings
+
+    with pytest.raises(RuntimeError):
+        await retrieve_relevant_chunks_batch(
+            client_id="test-client",
+            queries=["reset password", "billing"],
+            top_k=1
+        )
+    await asyncio.sleep(0)
+
+    assert sorted(cancelled) == ["billing", "reset password"]
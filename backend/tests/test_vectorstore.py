@@ -1,12 +1,22 @@
 """Tests for FAISS vectorstore."""
 
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tempfile import gettempdir
 
 import numpy as np
 import pytest
+from botocore.exceptions import ClientError
 
 import backend.app.core.vectorstore as vs
+from backend.app.core.mapped_index import MappedFlatIndex
 
 BASE_TMP_DIR = Path(gettempdir()) / "faiss_test"
 BASE_TMP_DIR.mkdir(parents=True, exist_ok=True)
@@ -18,30 +28,109 @@ def cleanup_tmp_files():
     yield
     for file in BASE_TMP_DIR.glob("*"):
         try:
-            file.unlink()
+            if file.is_dir():
+                shutil.rmtree(file)
+            else:
+                file.unlink()
         except Exception:
             pass
 
 
-def test_create_index_and_add_search(monkeypatch):
-    """Create index, add vectors, and search successfully."""
-    monkeypatch.setattr(
-        vs,
-        "_get_index_path",
-        lambda cid: str(BASE_TMP_DIR / f"fa_{cid}.idx"),
-    )
-    monkeypatch.setattr(
-        vs,
-        "_get_metadata_path",
-        lambda cid: str(BASE_TMP_DIR / f"fa_{cid}.meta"),
-    )
+@pytest.fixture
+def fake_s3(monkeypatch):
+    """Route vectorstore S3 calls to an in-memory bucket."""
+    bucket = {}
 
-    monkeypatch.setattr(
-        vs,
-        "create_index",
-        lambda dimension=3: vs.faiss.IndexHNSWFlat(3, 8),
-    )
+    def _upload(data, key):
+        bucket[key] = data
+        return True
+
+    def _download(key):
+        if key not in bucket:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return bucket[key]
+
+    monkeypatch.setattr(vs, "upload_file", _upload)
+    monkeypatch.setattr(vs, "download_file", _download)
+    monkeypatch.setattr(vs, "delete_file", lambda key: bucket.pop(key, None))
+    return bucket
+
+
+class FakeLock:
+    """Non-blocking stand-in for a redis-py lock."""
+
+    def __init__(self, owner, name):
+        """Bind the lock to its fake client."""
+        self.owner = owner
+        self.name = name
+
+    def acquire(self):
+        """Take the lock if nobody holds it."""
+        if self.name in self.owner.locks:
+            return False
+        self.owner.locks[self.name] = self
+        return True
+
+    def extend(self, additional_time, replace_ttl=False):
+        """Leases never expire in tests."""
+
+    def release(self):
+        """Drop the lock."""
+        del self.owner.locks[self.name]
+
+
+class FakeRedis:
+    """The subset of Redis used for index generations and write leases."""
+
+    def __init__(self):
+        """Start with no generations, locks or published messages."""
+        self.zsets = {}
+        self.locks = {}
+        self.published = []
 
+    def lock(self, name, **kwargs):
+        """Return a lock on ``name``."""
+        return FakeLock(self, name)
+
+    def zscore(self, key, member):
+        """Return a sorted-set score, or None."""
+        return self.zsets.get(key, {}).get(member)
+
+    def zadd(self, key, mapping, gt=False):
+        """Set scores, only raising existing ones when ``gt`` is set."""
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not gt or score > zset.get(member, float("-inf")):
+                zset[member] = score
+
+    def publish(self, channel, message):
+        """Record a published message."""
+        self.published.append((channel, message))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Route vectorstore Redis calls to an in-memory fake."""
+    client = FakeRedis()
+    monkeypatch.setattr(vs, "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def local_store(monkeypatch, fake_s3, fake_redis):
+    """Point the vectorstore at a scratch directory with a fresh cache."""
+    monkeypatch.setattr(vs, "_get_base_tmp_dir", lambda: BASE_TMP_DIR)
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+    monkeypatch.setattr(vs, "_disk_cache", vs.DiskIndexCache())
+    monkeypatch.setattr(vs, "_index_uploader", vs.IndexUploader(retries=1))
+    monkeypatch.setattr(vs, "_write_leases", vs.WriteLeaseManager())
+    monkeypatch.setattr(vs, "_index_writer", vs.IndexWriter())
+    monkeypatch.setattr(vs.settings, "FAISS_HNSW_M", 8)
+    return fake_s3
+
+
+def test_create_index_and_add_search(local_store):
+    """Create index, add vectors, and search successfully."""
     emb1 = [0.1, 0.0, 0.0]
     emb2 = [0.2, 0.1, 0.0]
 
@@ -63,3 +152,1187 @@ def test_dimension_mismatch_raises():
     with pytest.raises(ValueError):
         if index.d != bad_vec.shape[1]:
             raise ValueError("Dimension mismatch detected.")
+
+
+def test_add_writes_new_segment_only(local_store):
+    """Each ingestion uploads one new segment plus the manifest."""
+    vs.add_to_index("c1", [[0.1, 0.0, 0.0]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    uploaded_before = set(local_store)
+
+    vs.add_to_index("c1", [[0.0, 0.1, 0.0]], [{"id": 2}])
+    assert vs.flush_index_uploads(timeout=5)
+    new_keys = set(local_store) - uploaded_before
+
+    assert {key.rsplit(".", 1)[1] for key in new_keys} == {"index", "chunks", "terms"}
+    assert len({key.rsplit(".", 1)[0] for key in new_keys}) == 1
+    assert all(key.startswith("indexes/c1/seg_") for key in new_keys)
+    assert len(vs.load_index("c1").segments) == 2
+
+
+def test_search_merges_segments_and_survives_compaction(local_store):
+    """Search merges hits across segments and compaction keeps all vectors."""
+    vs.add_to_index("c1", [[1.0, 0.0, 0.0]], [{"id": 1}])
+    vs.add_to_index("c1", [[0.0, 1.0, 0.0]], [{"id": 2}])
+    vs.add_to_index("c1", [[0.0, 0.0, 1.0]], [{"id": 3}])
+
+    results = vs.search_index("c1", [0.0, 0.9, 0.0], top_k=3)
+    assert [r["id"] for r in results][0] == 2
+    assert len(results) == 3
+
+    assert vs.compact_index("c1") is True
+
+    client_index = vs.load_index("c1")
+    assert len(client_index.segments) == 1
+    assert client_index.ntotal == 3
+    assert vs.search_index("c1", [0.0, 0.0, 0.9], top_k=1)[0]["id"] == 3
+
+
+def test_load_from_s3_when_local_files_missing(local_store, monkeypatch):
+    """A cold worker rebuilds the index from S3 segments."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+
+    assert vs.flush_index_uploads(timeout=5)
+    vs._delete_local_files("c1")
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+
+    assert vs.search_index("c1", [0.1, 0.2, 0.3], top_k=1)[0]["id"] == 1
+
+
+def test_legacy_pickled_index_is_migrated(local_store):
+    """A pre-segment index in S3 loads as a single columnar segment."""
+    index = vs.faiss.IndexHNSWFlat(3, 8)
+    index.add(np.asarray([[0.1, 0.2, 0.3]], dtype="float32"))
+    local_store["indexes/c1.index"] = bytes(vs.faiss.serialize_index(index))
+    local_store["indexes/c1_meta.pkl"] = vs.pickle.dumps(
+        [{"text": "legacy", "metadata": {"filename": "a.txt"}}]
+    )
+
+    results = vs.search_index("c1", [0.1, 0.2, 0.3], top_k=1)
+
+    assert results[0]["text"] == "legacy"
+    assert vs.flush_index_uploads(timeout=5)
+    assert "indexes/c1/manifest.json" in local_store
+    assert isinstance(vs.load_index("c1").segments[0].metadata, vs.ChunkStore)
+
+
+def _client_index(n, dim=4):
+    """Build a one-segment client index with ``n`` random vectors."""
+    index = vs.faiss.IndexFlatL2(dim)
+    index.add(np.random.rand(n, dim).astype("float32"))
+    metadata = vs.ChunkStore.from_rows([{"id": i} for i in range(n)])
+    return vs.ClientIndex([vs.IndexSegment("seg", index, metadata)])
+
+
+def test_cache_evicts_by_bytes_not_entries(monkeypatch):
+    """Large entries push out older ones once the byte budget is exceeded."""
+    monkeypatch.setattr(vs, "_delete_local_files", lambda cid: None)
+    small, large = _client_index(10), _client_index(1000)
+    cache = vs.LRUIndexCache(max_bytes=large.nbytes + 2 * small.nbytes)
+
+    for cid in ("a", "b", "c"):
+        cache.put(cid, small)
+    assert cache.stats()["entries"] == 3
+
+    cache.put("big", large)
+    stats = cache.stats()
+
+    assert cache.get("a") is None
+    assert cache.get("big") is large
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == large.nbytes + 2 * small.nbytes
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_memory_eviction_keeps_files_on_disk_tier(local_store, monkeypatch):
+    """An index dropped from memory reloads from local disk, not S3."""
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache(max_bytes=1))
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    vs.load_index("c1")
+    vs.add_to_index("c2", [[0.3, 0.2, 0.1]], [{"id": 2}])
+    vs.load_index("c2")
+    assert "c1" not in vs._index_cache
+
+    local_store.clear()
+
+    assert vs.search_index("c1", [0.1, 0.2, 0.3], top_k=1)[0]["id"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used(local_store, monkeypatch):
+    """The disk tier deletes the oldest client directory once over budget."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    one_client = vs._disk_cache.stats()["bytes"]
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+    monkeypatch.setattr(vs, "_disk_cache", vs.DiskIndexCache(one_client + 1))
+
+    vs.load_index("c1")
+    vs.add_to_index("c2", [[0.3, 0.2, 0.1]], [{"id": 2}])
+
+    assert not (BASE_TMP_DIR / "c1").exists()
+    assert (BASE_TMP_DIR / "c2").exists()
+    assert vs._disk_cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_counts_vault_files_and_spares_clients_in_use(
+    local_store, monkeypatch
+):
+    """Vault files count toward the budget and clients being written stay."""
+    vectors = np.random.default_rng(0).random((2, 4))
+    rows = [{"text": str(i), "document_id": "d1"} for i in range(2)]
+    vs.save_embeddings("c1", "d1", vectors.tolist(), rows)
+    assert vs.flush_index_uploads(timeout=5)
+    vs._disk_cache.touch("c1")
+
+    vault_bytes = (BASE_TMP_DIR / "c1" / "vault" / "d1.vec").stat().st_size
+    assert vs._disk_cache.stats()["bytes"] >= vault_bytes
+
+    monkeypatch.setattr(vs, "_disk_cache", vs.DiskIndexCache(1))
+    with vs._disk_cache.use("c1"):
+        vs.add_to_index("c2", [[0.3, 0.2, 0.1]], [{"id": 2}])
+        assert (BASE_TMP_DIR / "c1" / "vault" / "d1.vec").exists()
+
+    assert vs.flush_index_uploads(timeout=5)
+    vs._disk_cache.touch("c2")
+    assert not (BASE_TMP_DIR / "c1").exists()
+
+
+def test_concurrent_cold_loads_share_one_read(local_store, monkeypatch):
+    """Concurrent cache misses for one client trigger a single load."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+
+    reads = []
+    release = threading.Event()
+    real_read = vs._read_segment
+
+    def slow_read(client_id, entry):
+        reads.append(entry["name"])
+        release.wait(timeout=5)
+        return real_read(client_id, entry)
+
+    monkeypatch.setattr(vs, "_read_segment", slow_read)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(vs.load_index, "c1") for _ in range(8)]
+        while not reads:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        release.set()
+        loaded = [f.result() for f in futures]
+
+    assert len(reads) == 1
+    assert all(index is loaded[0] for index in loaded)
+
+
+@pytest.mark.asyncio
+async def test_async_search_runs_off_event_loop(local_store):
+    """asearch_index returns the same hits as the blocking path."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+
+    results = await vs.asearch_index("c1", [0.1, 0.2, 0.3], top_k=1)
+
+    assert results[0]["id"] == 1
+    assert vs.get_executor_stats()["search"]["completed"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor_rejects_when_queue_full():
+    """Work beyond the queue bound is rejected instead of piling up."""
+    executor = vs.BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    running = asyncio.ensure_future(executor.run(release.wait, 5))
+    while executor.stats()["running"] == 0:
+        await asyncio.sleep(0.01)
+    waiting = asyncio.ensure_future(executor.run(lambda: "done"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(vs.VectorstoreOverloadedError):
+        await executor.run(lambda: "rejected")
+
+    release.set()
+    assert await running is True
+    assert await waiting == "done"
+    assert executor.stats()["rejected"] == 1
+
+
+def test_uploads_are_write_behind_and_coalesced(local_store, monkeypatch):
+    """Saves return before S3 and repeated saves share one manifest upload."""
+    release = threading.Event()
+    uploads = []
+    real_upload = vs.upload_file
+
+    def slow_upload(data, key):
+        release.wait(timeout=5)
+        uploads.append(key)
+        return real_upload(data, key)
+
+    monkeypatch.setattr(vs, "upload_file", slow_upload)
+
+    for i in range(3):
+        vs.add_to_index("c1", [[0.1 * i, 0.2, 0.3]], [{"id": i}])
+
+    assert vs._index_uploader.has_pending("c1")
+    assert uploads == []
+
+    release.set()
+    assert vs.flush_index_uploads(timeout=5)
+
+    assert not vs._index_uploader.has_pending("c1")
+    assert uploads.count("indexes/c1/manifest.json") <= 2
+    assert len([k for k in uploads if k.endswith(".index")]) == 3
+    assert uploads[-1] == "indexes/c1/manifest.json"
+
+
+def test_flush_reports_failed_uploads(local_store, monkeypatch):
+    """Flush returns False while a failed upload waits for its retry."""
+    monkeypatch.setattr(
+        vs, "_index_uploader", vs.IndexUploader(retries=1, retry_delay=0.1)
+    )
+    real_upload = vs.upload_file
+    outage = threading.Event()
+    outage.set()
+
+    def flaky_upload(data, key):
+        if outage.is_set():
+            raise ConnectionError("S3 unavailable")
+        return real_upload(data, key)
+
+    monkeypatch.setattr(vs, "upload_file", flaky_upload)
+
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+
+    assert not vs.flush_index_uploads(timeout=5)
+    assert vs._index_uploader.has_pending("c1")
+    assert vs.get_upload_stats()["retrying"] == 1
+
+    outage.clear()
+    deadline = time.monotonic() + 5
+    while vs._index_uploader.has_pending("c1") and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert vs.flush_index_uploads(timeout=5)
+    assert vs.get_upload_stats()["retrying"] == 0
+    assert "indexes/c1/manifest.json" in local_store
+
+
+def test_manifest_updates_of_other_clients_do_not_wait(local_store):
+    """A client holding its manifest lock does not block other clients."""
+    assert vs._manifest_lock("c1") is vs._manifest_lock("c1")
+
+    write = threading.Thread(
+        target=vs.add_to_index, args=("c2", [[0.1, 0.2, 0.3]], [{"id": 1}]), daemon=True
+    )
+    with vs._manifest_lock("c1"):
+        write.start()
+        write.join(timeout=5)
+        assert not write.is_alive()
+
+    assert vs._fetch_manifest("c2")["generation"] == 1
+
+
+def test_missing_segment_file_blocks_manifest_upload(local_store, monkeypatch):
+    """A file the manifest still lists is never skipped on upload."""
+    monkeypatch.setattr(
+        vs, "_index_uploader", vs.IndexUploader(retries=1, retry_delay=0.05)
+    )
+    real_upload = vs.upload_file
+    outage = threading.Event()
+    outage.set()
+
+    def flaky_upload(data, key):
+        if outage.is_set():
+            raise ConnectionError("S3 unavailable")
+        return real_upload(data, key)
+
+    monkeypatch.setattr(vs, "upload_file", flaky_upload)
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert not vs.flush_index_uploads(timeout=5)
+
+    next(vs._get_client_dir("c1").glob("*.index")).unlink()
+    outage.clear()
+    deadline = time.monotonic() + 5
+    while vs.get_upload_stats()["failed"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert vs.get_upload_stats()["failed"] >= 2
+    assert vs._index_uploader.has_pending("c1")
+    assert "indexes/c1/manifest.json" not in local_store
+
+    # Stop the retries.
+    Path(vs._get_pending_upload_path("c1")).unlink()
+    vs.flush_index_uploads(timeout=5)
+
+
+def test_other_worker_write_invalidates_cached_index(
+    local_store, fake_redis, monkeypatch
+):
+    """A generation published by another worker replaces the stale copy."""
+    worker_a = BASE_TMP_DIR / "worker_a"
+    worker_b = BASE_TMP_DIR / "worker_b"
+    cache_a, cache_b = vs.LRUIndexCache(), vs.LRUIndexCache()
+
+    def use_worker(base, cache):
+        monkeypatch.setattr(vs, "_get_base_tmp_dir", lambda: base)
+        monkeypatch.setattr(vs, "_index_cache", cache)
+
+    use_worker(worker_a, cache_a)
+    vs.add_to_index("c1", [[1.0, 0.0, 0.0]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    assert vs.load_index("c1").generation == 1
+
+    use_worker(worker_b, cache_b)
+    vs.add_to_index("c1", [[0.0, 1.0, 0.0]], [{"id": 2}])
+    assert vs.flush_index_uploads(timeout=5)
+    channel, message = fake_redis.published[-1]
+    assert channel == vs.INVALIDATION_CHANNEL
+    assert json.loads(message) == {"client_id": "c1", "generation": 2}
+
+    use_worker(worker_a, cache_a)
+    assert vs.load_index("c1").ntotal == 1
+    vs.IndexInvalidationListener._handle(message)
+
+    reloaded = vs.load_index("c1")
+    assert reloaded.generation == 2
+    assert reloaded.ntotal == 2
+
+
+def test_concurrent_adds_are_serialized_and_batched(local_store, monkeypatch):
+    """Additions queued behind a running write share one segment."""
+    release = threading.Event()
+    real_append = vs._append_segment
+
+    def slow_append(*args):
+        release.wait(timeout=5)
+        return real_append(*args)
+
+    monkeypatch.setattr(vs, "_append_segment", slow_append)
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        futures = [
+            pool.submit(vs.add_to_index, "c1", [[0.1 * i, 0.2, 0.3]], [{"id": i}])
+            for i in range(5)
+        ]
+        while vs._index_writer.stats()["queued"] < 4:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            future.result()
+
+    client_index = vs.load_index("c1")
+    assert client_index.ntotal == 5
+    assert len(client_index.segments) == 2
+    assert vs._index_writer.stats()["batches"] == 2
+
+
+def test_write_lease_held_elsewhere_blocks_writes(local_store, fake_redis):
+    """A worker cannot mutate an index while another holds its lease."""
+    fake_redis.lock(vs.WRITE_LEASE_PREFIX + "c1").acquire()
+
+    with pytest.raises(vs.IndexLeaseError):
+        vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+
+    assert vs._fetch_manifest("c1") is None
+
+
+def test_write_lease_released_after_upload(local_store, fake_redis, monkeypatch):
+    """The lease is kept while uploads are pending, then released."""
+    release = threading.Event()
+    real_upload = vs.upload_file
+
+    def slow_upload(data, key):
+        release.wait(timeout=5)
+        return real_upload(data, key)
+
+    monkeypatch.setattr(vs, "upload_file", slow_upload)
+
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert vs.WRITE_LEASE_PREFIX + "c1" in fake_redis.locks
+
+    release.set()
+    assert vs.flush_index_uploads(timeout=5)
+    assert fake_redis.locks == {}
+
+
+def test_recover_leaves_uploads_of_leased_clients(local_store, fake_redis):
+    """Restarting workers adopt pending uploads only if the lease is free."""
+    lease = fake_redis.lock(vs.WRITE_LEASE_PREFIX + "c1")
+    lease.acquire()
+    vs._get_client_dir("c1").mkdir(parents=True, exist_ok=True)
+    vs.IndexUploader._write_pending("c1", {"files": [], "retired": [], "vault": []})
+
+    assert vs._index_uploader.recover() == 0
+    assert vs._index_uploader.has_pending("c1")
+    assert fake_redis.locks == {vs.WRITE_LEASE_PREFIX + "c1": lease}
+
+    lease.release()
+    assert vs._index_uploader.recover() == 1
+    assert vs.flush_index_uploads(timeout=5)
+    assert not vs._index_uploader.has_pending("c1")
+    assert fake_redis.locks == {}
+
+
+def test_manifest_records_sizes_checksums_and_counts(local_store):
+    """Each segment entry describes its files well enough to validate them."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]], [{"id": 1}, {"id": 2}])
+
+    manifest = vs._fetch_manifest("c1")
+    entry = manifest["segments"][0]
+
+    assert entry["ntotal"] == 2
+    assert manifest["checksum"] == vs._manifest_checksum(manifest)
+    for filename in vs._segment_filenames(entry["name"]):
+        path = vs._get_client_dir("c1") / filename
+        assert entry["files"][filename] == {
+            "size": path.stat().st_size,
+            "crc32": vs._file_checksum(str(path)),
+        }
+    assert not list(vs._get_client_dir("c1").glob("*.tmp"))
+
+
+def test_startup_removes_only_orphaned_temp_files(local_store):
+    """Partial writes of exited workers go; those of live siblings stay."""
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    client_dir = vs._get_client_dir("c1")
+    client_dir.mkdir(parents=True, exist_ok=True)
+    dead = client_dir / f"s.index.{exited.pid}.a.tmp"
+    live = client_dir / f"s.index.{os.getpid()}.b.tmp"
+    old = client_dir / "s.chunks.c.tmp"
+    fresh = client_dir / "s.terms.d.tmp"
+    for path in (dead, live, old, fresh):
+        path.write_bytes(b"partial")
+    os.utime(old, (time.time() - 2 * vs._PARTIAL_WRITE_MAX_AGE,) * 2)
+
+    assert vs._remove_partial_writes() == 2
+    assert sorted(p.name for p in client_dir.glob("*.tmp")) == sorted(
+        [live.name, fresh.name]
+    )
+
+
+def test_corrupt_local_file_is_refetched_alone(local_store, monkeypatch):
+    """A damaged segment file is re-downloaded; intact files are reused."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+
+    segment = vs._fetch_manifest("c1")["segments"][0]["name"]
+    chunks_path = Path(vs._get_segment_metadata_path("c1", segment))
+    data = bytearray(chunks_path.read_bytes())
+    data[-1] ^= 0xFF
+    chunks_path.write_bytes(bytes(data))
+
+    downloads = []
+    real_download = vs.download_file
+
+    def tracking_download(key):
+        downloads.append(key)
+        return real_download(key)
+
+    monkeypatch.setattr(vs, "download_file", tracking_download)
+
+    assert vs.search_index("c1", [0.1, 0.2, 0.3], top_k=1)[0]["id"] == 1
+    assert downloads == [f"indexes/c1/{segment}.chunks"]
+
+
+def test_corrupt_manifest_falls_back_to_s3(local_store, monkeypatch):
+    """A manifest failing its checksum is discarded and fetched again."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+
+    manifest_path = Path(vs._get_manifest_path("c1"))
+    manifest = json.loads(manifest_path.read_text())
+    manifest["segments"][0]["ntotal"] = 7
+    manifest_path.write_text(json.dumps(manifest))
+
+    assert vs.load_index("c1").ntotal == 1
+
+
+def test_stale_s3_manifest_is_never_accepted(local_store, monkeypatch):
+    """A manifest older than the committed generation is fetched again."""
+    monkeypatch.setattr(vs.settings, "FAISS_MANIFEST_FETCH_RETRIES", 1)
+    monkeypatch.setattr(vs.settings, "FAISS_MANIFEST_FETCH_RETRY_DELAY", 0)
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    stale = local_store["indexes/c1/manifest.json"]
+    manifest = json.loads(stale)
+    manifest["generation"] = 5
+    manifest["checksum"] = vs._manifest_checksum(manifest)
+    fresh = json.dumps(manifest).encode("utf-8")
+    vs._delete_local_files("c1")
+
+    with pytest.raises(vs.IndexIntegrityError):
+        vs._fetch_manifest("c1", min_generation=5)
+    assert not Path(vs._get_manifest_path("c1")).exists()
+
+    served = iter([stale, fresh])
+    monkeypatch.setattr(vs, "download_file", lambda key: next(served))
+    assert vs._fetch_manifest("c1", min_generation=5)["generation"] == 5
+
+
+def test_mismatched_s3_object_is_rejected(local_store, monkeypatch):
+    """A segment in S3 that disagrees with the manifest fails the load."""
+    vs.add_to_index("c1", [[0.1, 0.2, 0.3]], [{"id": 1}])
+    assert vs.flush_index_uploads(timeout=5)
+    segment = vs._fetch_manifest("c1")["segments"][0]["name"]
+    local_store[f"indexes/c1/{segment}.index"] += b"\0"
+
+    vs._delete_local_files("c1")
+    monkeypatch.setattr(vs, "_index_cache", vs.LRUIndexCache())
+
+    with pytest.raises(vs.IndexIntegrityError):
+        vs.load_index("c1")
+
+
+def _add_document(client_id, document_id, vectors):
+    """Index one chunk per vector for a document."""
+    vs.add_to_index(
+        client_id,
+        vectors,
+        [{"document_id": document_id, "chunk_index": i} for i in range(len(vectors))],
+    )
+
+
+def test_deleted_document_is_masked_from_search(local_store, monkeypatch):
+    """Tombstoned vectors never surface and top-k stays full."""
+    scheduled = []
+    monkeypatch.setattr(vs, "_schedule_compaction", scheduled.append)
+    _add_document("c1", "stale", [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]])
+    _add_document("c1", "fresh", [[0.0, 1.0, 0.0], [0.0, 0.9, 0.1]])
+
+    assert vs.delete_document("c1", "stale") == 2
+    assert vs.delete_document("c1", "stale") == 0
+
+    results = vs.search_index("c1", [1.0, 0.0, 0.0], top_k=2)
+    assert [r["document_id"] for r in results] == ["fresh", "fresh"]
+    assert vs._fetch_manifest("c1")["tombstones"] == [[0, 2]]
+    assert scheduled == ["c1"]
+
+
+def test_compaction_drops_tombstones_and_keeps_ids(local_store, monkeypatch):
+    """Compaction removes dead vectors without renumbering live ones."""
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    _add_document("c1", "a", [[1.0, 0.0, 0.0]])
+    _add_document("c1", "b", [[0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    vs.delete_document("c1", "a")
+
+    assert vs.compact_index("c1") is True
+
+    client_index = vs.load_index("c1")
+    assert client_index.ntotal == 2
+    assert client_index.n_deleted == 0
+    assert client_index.segments[0].ids.tolist() == [1, 2]
+    assert vs._fetch_manifest("c1")["tombstones"] == []
+    assert vs.search_index("c1", [0.0, 0.0, 1.0], top_k=1)[0]["chunk_index"] == 1
+
+
+def test_tombstone_range_arithmetic():
+    """Ranges merge, subtract and mask ids as half-open intervals."""
+    ranges = vs._merge_ranges(vs._ids_to_ranges(np.array([5, 1, 2, 3])) + [[3, 5]])
+    assert ranges == [[1, 6]]
+    assert vs._subtract_ranges(ranges, [[2, 4]]) == [[1, 2], [4, 6]]
+    assert vs._in_ranges(np.arange(8), [[1, 2], [4, 6]]).tolist() == [
+        False,
+        True,
+        False,
+        False,
+        True,
+        True,
+        False,
+        False,
+    ]
+
+
+@pytest.mark.parametrize(
+    "ntotal, plan, kind",
+    [
+        (10, "scale", "flat"),
+        (500, "growth", "hnsw"),
+        (500, "starter", "flat"),
+        (5000, "scale", "hnsw_sq8"),
+        (5000, None, "hnsw"),
+    ],
+)
+def test_index_kind_follows_size_and_plan(monkeypatch, ntotal, plan, kind):
+    """Small tenants search exactly; only SCALE tenants quantize."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 100)
+    monkeypatch.setattr(vs.settings, "FAISS_HNSW_MAX_VECTORS", 1000)
+
+    assert vs.choose_index_kind(ntotal, plan) == kind
+
+
+def test_tenant_migrates_when_crossing_threshold(local_store, monkeypatch):
+    """Growing past a threshold rebuilds every segment as the new kind."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 2)
+    monkeypatch.setattr(vs.settings, "FAISS_HNSW_MAX_VECTORS", 3)
+    monkeypatch.setattr(vs, "_schedule_compaction", vs.compact_index)
+    rng = np.random.default_rng(0)
+
+    vs.add_to_index("c1", rng.random((2, 3)).tolist(), [{"id": 0}, {"id": 1}])
+    assert vs._fetch_manifest("c1")["index_kind"] == "flat"
+
+    vs.add_to_index("c1", rng.random((1, 3)).tolist(), [{"id": 2}], plan="scale")
+    manifest = vs._fetch_manifest("c1")
+    assert manifest["index_kind"] == "hnsw"
+    assert [entry["kind"] for entry in manifest["segments"]] == ["hnsw"]
+
+    vs.add_to_index("c1", rng.random((1, 3)).tolist(), [{"id": 3}])
+    manifest = vs._fetch_manifest("c1")
+    assert manifest["plan"] == "scale"
+    assert [entry["kind"] for entry in manifest["segments"]] == ["hnsw_sq8"]
+    assert vs.load_index("c1").ntotal == 4
+
+
+@pytest.mark.parametrize(
+    "ntotal, plan, kind",
+    [
+        (10, "starter", "flat_sq8"),
+        (500, "growth", "hnsw_fp16"),
+        (5000, "scale", "hnsw_sq8"),
+        (500, None, "hnsw"),
+    ],
+)
+def test_vector_storage_is_opt_in_per_plan(monkeypatch, ntotal, plan, kind):
+    """Configured storage shrinks vectors but never widens forced SQ8."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 100)
+    monkeypatch.setattr(vs.settings, "FAISS_HNSW_MAX_VECTORS", 1000)
+    monkeypatch.setattr(
+        vs.settings,
+        "FAISS_VECTOR_STORAGE_BY_PLAN",
+        {"starter": "sq8", "growth": "fp16", "scale": "fp32"},
+    )
+
+    assert vs.choose_index_kind(ntotal, plan) == kind
+
+
+@pytest.mark.parametrize(
+    "kind", ["flat", "flat_fp16", "flat_sq8", "hnsw", "hnsw_fp16", "hnsw_sq8"]
+)
+def test_built_index_reports_its_kind(monkeypatch, kind):
+    """Every kind builds, trains if needed, and is detected on reload."""
+    monkeypatch.setattr(vs.settings, "FAISS_HNSW_M", 8)
+    training = np.random.default_rng(0).random((64, 4)).astype("float32")
+
+    index = vs.faiss.IndexIDMap(vs.create_index(4, kind, training))
+    index.add_with_ids(training, np.arange(64))
+    reloaded = vs.faiss.deserialize_index(vs.faiss.serialize_index(index))
+
+    assert vs.index_kind_of(reloaded) == kind
+    assert reloaded.ntotal == 64
+
+
+def test_existing_index_migrates_to_configured_storage(local_store, monkeypatch):
+    """Compaction with a plan rebuilds segments in the plan's storage."""
+    rng = np.random.default_rng(0)
+    vectors = rng.random((20, 3))
+    vs.add_to_index("c1", vectors.tolist(), [{"id": i} for i in range(20)])
+    assert vs._fetch_manifest("c1")["index_kind"] == "flat"
+
+    monkeypatch.setattr(vs.settings, "FAISS_VECTOR_STORAGE_BY_PLAN", {"growth": "fp16"})
+    assert vs.compact_index("c1", plan="growth")
+    assert not vs.compact_index("c1")
+
+    manifest = vs._fetch_manifest("c1")
+    assert manifest["plan"] == "growth"
+    assert [entry["kind"] for entry in manifest["segments"]] == ["flat_fp16"]
+    assert vs.search_index("c1", vectors[7].tolist(), top_k=1)[0]["id"] == 7
+
+
+def test_embeddings_are_restored_from_s3_vault(local_store):
+    """Raw embeddings survive losing local disk and vanish on delete."""
+    vectors = np.random.default_rng(0).random((3, 4))
+    rows = [{"text": str(i), "document_id": "d1"} for i in range(3)]
+
+    vs.save_embeddings("c1", "d1", vectors.tolist(), rows, model="m")
+    assert vs.flush_index_uploads(timeout=5)
+    assert "vault/c1/d1.vec.z" in local_store
+    shutil.rmtree(BASE_TMP_DIR / "c1")
+    vault = vs.load_embeddings("c1", "d1")
+
+    np.testing.assert_array_equal(vault.vectors, vectors.astype("float32"))
+    assert list(vault.chunks) == rows
+
+    vs.add_to_index("c1", vectors.tolist(), rows)
+    assert vs.delete_document("c1", "d1") == 3
+    assert "vault/c1/d1.vec.z" not in local_store
+    assert not (BASE_TMP_DIR / "c1" / "vault" / "d1.vec").exists()
+
+
+def test_vault_upload_is_written_behind(local_store, monkeypatch):
+    """Saving raw embeddings returns before their S3 upload runs."""
+    release = threading.Event()
+    real_upload = vs.upload_file
+
+    def slow_upload(data, key):
+        release.wait(5)
+        return real_upload(data, key)
+
+    monkeypatch.setattr(vs, "upload_file", slow_upload)
+    vectors = np.random.default_rng(0).random((2, 4))
+    rows = [{"text": str(i), "document_id": "d1"} for i in range(2)]
+
+    vs.save_embeddings("c1", "d1", vectors.tolist(), rows)
+
+    assert "vault/c1/d1.vec.z" not in local_store
+    assert vs._index_uploader.has_pending("c1")
+    release.set()
+    assert vs.flush_index_uploads(timeout=5)
+    assert "vault/c1/d1.vec.z" in local_store
+    assert not vs._index_uploader.has_pending("c1")
+
+
+def _ingest(client_id, document_id, vectors):
+    """Index a document and store its raw embeddings, as ingestion does."""
+    rows = [
+        {"text": f"{document_id}-{i}", "document_id": document_id, "chunk_index": i}
+        for i in range(len(vectors))
+    ]
+    vs.add_to_index(client_id, vectors.tolist(), rows)
+    vs.save_embeddings(client_id, document_id, vectors.tolist(), rows)
+
+
+def test_compaction_reencodes_raw_vault_vectors(local_store, monkeypatch, caplog):
+    """Compaction rebuilds from the vault, reconstructing only what is missing."""
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    monkeypatch.setattr(vs.settings, "FAISS_VECTOR_STORAGE_BY_PLAN", {"growth": "fp16"})
+    rng = np.random.default_rng(0)
+    stored, unstored = rng.random((3, 4)), rng.random((2, 4))
+    _ingest("c1", "d1", stored)
+    vs.add_to_index("c1", unstored.tolist(), [{"document_id": "d2"}] * 2)
+
+    assert vs.compact_index("c1", plan="growth")
+    with caplog.at_level("WARNING", logger=vs.logger.name):
+        assert vs.compact_index("c1", plan="free")
+
+    vectors = vs._reconstruct_vectors(vs.load_index("c1").segments[0].index)
+    np.testing.assert_array_equal(vectors[:3], stored.astype("float32"))
+    assert not np.array_equal(vectors[3:], unstored.astype("float32"))
+    np.testing.assert_allclose(vectors[3:], unstored, atol=1e-3)
+    assert "Compacting 2 of 5 vectors" in caplog.text
+
+
+def test_rebuild_from_vault_is_verified_then_swapped(local_store, monkeypatch):
+    """A rebuild replaces every segment only once counts check out."""
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    rng = np.random.default_rng(0)
+    _ingest("c1", "d1", rng.random((3, 4)))
+    _ingest("c1", "d2", rng.random((2, 4)))
+    vs.delete_document("c1", "d2")
+    before = vs._fetch_manifest("c1")
+
+    with pytest.raises(vs.IndexIntegrityError):
+        vs.rebuild_index("c1", expected={"d1": 4})
+    assert vs._fetch_manifest("c1")["generation"] == before["generation"]
+
+    monkeypatch.setattr(vs.settings, "FAISS_VECTOR_STORAGE_BY_PLAN", {"growth": "fp16"})
+    stats = vs.rebuild_index("c1", plan="growth", expected={"d1": 3})
+
+    manifest = vs._fetch_manifest("c1")
+    assert stats["vectors"] == 3
+    assert manifest["tombstones"] == []
+    assert [entry["kind"] for entry in manifest["segments"]] == ["flat_fp16"]
+    assert {r["text"] for r in vs.search_index("c1", [0.5] * 4, top_k=5)} == {
+        "d1-0",
+        "d1-1",
+        "d1-2",
+    }
+
+
+def test_rebuild_reembeds_chunks_missing_from_vault(local_store):
+    """Without vault vectors, stored chunk text is re-embedded and backfilled."""
+    vectors = np.random.default_rng(0).random((2, 4))
+    vs.add_to_index(
+        "c1",
+        vectors.tolist(),
+        [{"text": "a", "document_id": "d1"}, {"text": "b", "document_id": "d1"}],
+    )
+
+    with pytest.raises(vs.IndexIntegrityError):
+        vs.rebuild_index("c1")
+
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return vectors.tolist()
+
+    assert vs.rebuild_index("c1", embed=embed)["reembedded"] == 1
+    assert embedded == ["a", "b"]
+    assert vs.flush_index_uploads(timeout=5)
+    assert "vault/c1/d1.vec.z" in local_store
+
+
+def test_batch_search_matches_single_queries(local_store, monkeypatch):
+    """One batched search ranks each query like the single-query path."""
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    rng = np.random.default_rng(0)
+    for document_id in ("d1", "d2", "d3"):
+        vs.add_to_index(
+            "c1",
+            rng.random((4, 3)).tolist(),
+            [
+                {"text": f"{document_id}-{i}", "document_id": document_id}
+                for i in range(4)
+            ],
+        )
+    vs.delete_document("c1", "d2")
+    queries = rng.random((5, 3))
+
+    batch = vs.search_index_batch("c1", queries, top_k=6)
+
+    assert len(batch) == 5
+    for query, hits in zip(queries, batch):
+        assert len(hits) == 6
+        assert hits == vs.search_index("c1", query.tolist(), top_k=6)
+        assert not any(hit["document_id"] == "d2" for hit in hits)
+        assert [h["score"] for h in hits] == sorted(
+            (h["score"] for h in hits), reverse=True
+        )
+
+
+def test_cosine_scores_are_similarities_and_cut_off(local_store, monkeypatch):
+    """Cosine indexes score by similarity and drop hits below min_score."""
+    monkeypatch.setattr(vs.settings, "FAISS_METRIC", "cosine")
+    vectors = [[2.0, 0.0, 0.0], [1.0, 1.0, 0.0], [0.0, 0.0, -3.0]]
+    vs.add_to_index("c1", vectors, [{"id": i} for i in range(3)])
+
+    hits = vs.search_index("c1", [5.0, 0.0, 0.0], top_k=3)
+    assert [h["id"] for h in hits] == [0, 1, 2]
+    np.testing.assert_allclose(
+        [h["score"] for h in hits], [1.0, 0.5**0.5, 0.0], atol=1e-6
+    )
+
+    hits = vs.search_index("c1", [5.0, 0.0, 0.0], top_k=3, min_score=0.5)
+    assert [h["id"] for h in hits] == [0, 1]
+
+
+def test_changing_metric_migrates_existing_tenants(local_store, monkeypatch):
+    """An L2 tenant is rebuilt as cosine once the metric setting changes."""
+    monkeypatch.setattr(vs, "_schedule_compaction", vs.compact_index)
+    vs.add_to_index("c1", [[1.0, 0.0, 0.0]], [{"id": 0}])
+    assert vs._fetch_manifest("c1")["metric"] == "l2"
+
+    monkeypatch.setattr(vs.settings, "FAISS_METRIC", "cosine")
+    vs.add_to_index("c1", [[0.0, 3.0, 0.0]], [{"id": 1}])
+
+    manifest = vs._fetch_manifest("c1")
+    assert manifest["metric"] == "cosine"
+    assert [entry["metric"] for entry in manifest["segments"]] == ["cosine"]
+    assert vs.search_index("c1", [0.0, 1.0, 0.0], top_k=1)[0]["score"] == (
+        pytest.approx(1.0)
+    )
+
+
+def test_ef_search_resolves_from_request_tuning_and_plan(local_store, monkeypatch):
+    """An explicit efSearch beats tuning, which beats the plan default."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 0)
+    monkeypatch.setattr(vs.settings, "FAISS_HNSW_EF_SEARCH_BY_PLAN", {"growth": 40})
+    monkeypatch.setattr(vs.settings, "FAISS_EXACT_SEARCH_MAX_VECTORS", 0)
+    used = []
+    real_params = vs.search_params
+
+    def spy(index, ef_search):
+        used.append(ef_search)
+        return real_params(index, ef_search)
+
+    monkeypatch.setattr(vs, "search_params", spy)
+    vectors = np.random.default_rng(0).random((20, 3))
+    vs.add_to_index("c1", vectors.tolist(), [{"id": i} for i in range(20)], "growth")
+    query = vectors[3].tolist()
+
+    assert vs.search_index("c1", query, top_k=1)[0]["id"] == 3
+    assert vs.search_index("c1", query, top_k=1, ef_search=7)[0]["id"] == 3
+    assert used == [40, 7]
+
+    profile = [
+        {"ef_search": 32, "recall": 0.9},
+        {"ef_search": 64, "recall": 0.97},
+        {"ef_search": 128, "recall": 0.99},
+    ]
+    assert vs.save_search_tuning("c1", {"recommended": 64, "profile": profile})
+    assert vs._fetch_manifest("c1")["search_tuning"]["index_kind"] == "hnsw"
+
+    used.clear()
+    vs.search_index("c1", query)
+    vs.search_index("c1", query, recall_target=0.98)
+    vs.search_index("c1", query, recall_target=0.5)
+    vs.search_index("c1", query, recall_target=0.999)
+    assert used == [64, 128, 32, 128]
+
+
+def test_flat_segments_are_served_from_mapped_files(local_store, monkeypatch):
+    """Flat segments load as read-only maps and search like in-memory ones."""
+    vectors = np.random.default_rng(0).random((50, 3)).tolist()
+    vs.add_to_index("c1", vectors, [{"id": i} for i in range(50)])
+    query = [0.5, 0.5, 0.5]
+    mapped_hits = vs.search_index("c1", query, top_k=5)
+
+    vs._index_cache.discard("c1")
+    segment = vs.load_index("c1").segments[0]
+    assert isinstance(segment.index, MappedFlatIndex)
+    assert segment.searcher is segment.index
+
+    monkeypatch.setattr(vs.settings, "FAISS_MMAP_FLAT", False)
+    vs._index_cache.discard("c1")
+    assert not isinstance(vs.load_index("c1").segments[0].index, MappedFlatIndex)
+    assert vs.search_index("c1", query, top_k=5) == mapped_hits
+
+
+def test_generation_never_moves_backwards(fake_redis):
+    """A late commit of an older manifest keeps the newer generation."""
+    vs._commit_generation("c1", 3)
+    vs._commit_generation("c1", 2)
+
+    assert vs._committed_generation("c1") == 3
+
+
+def test_small_tenants_share_a_packed_shard(local_store, monkeypatch):
+    """Packed tenants share one index but only ever see their own rows."""
+    monkeypatch.setattr(vs.settings, "FAISS_PACKED_SHARDS", 1)
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    _add_document("c1", "a", [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]])
+    _add_document("c2", "b", [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
+    manifest = vs._fetch_manifest("packed_0000")
+    assert manifest["tenants"] == {"c1": 2, "c2": 2}
+    assert vs._fetch_manifest("c1") is None
+
+    hits = vs.search_index("c1", [1.0, 0.0, 0.0], top_k=5)
+    assert [h["document_id"] for h in hits] == ["a", "a"]
+    assert "client_id" not in hits[0]
+    assert vs.get_document_chunks("c2", "b") == [
+        {"document_id": "b", "chunk_index": 0},
+        {"document_id": "b", "chunk_index": 1},
+    ]
+
+    assert vs.delete_document("c1", "b") == 0
+    assert vs.delete_document("c2", "b") == 2
+    assert vs._fetch_manifest("packed_0000")["tenants"] == {"c1": 2}
+    with pytest.raises(FileNotFoundError):
+        vs.search_index("c2", [1.0, 0.0, 0.0])
+
+
+@pytest.mark.asyncio
+async def test_async_search_of_packed_tenant(local_store, monkeypatch):
+    """The async path warms and searches the shard serving a packed tenant."""
+    monkeypatch.setattr(vs.settings, "FAISS_PACKED_SHARDS", 1)
+    _add_document("c1", "a", [[1.0, 0.0, 0.0]])
+    vs._index_cache.discard("packed_0000")
+
+    results = await vs.asearch_index("c1", [1.0, 0.0, 0.0], top_k=1)
+
+    assert results[0]["document_id"] == "a"
+    assert "packed_0000" in vs._index_cache
+
+
+def test_growing_tenant_moves_to_its_own_index(local_store, monkeypatch):
+    """A tenant outgrowing the packed limit keeps its rows in its own index."""
+    monkeypatch.setattr(vs.settings, "FAISS_PACKED_SHARDS", 1)
+    monkeypatch.setattr(vs.settings, "FAISS_PACKED_MAX_VECTORS", 3)
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    _add_document("c1", "a", [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]])
+    _add_document("c2", "b", [[0.0, 1.0, 0.0]])
+
+    _add_document("c1", "c", [[0.0, 0.0, 1.0], [0.1, 0.0, 0.9]])
+
+    shard = vs._fetch_manifest("packed_0000")
+    assert shard["tenants"] == {"c2": 1}
+    assert shard["dedicated"] == ["c1"]
+    assert vs._fetch_manifest("c1") is not None
+    hits = vs.search_index("c1", [1.0, 0.0, 0.0], top_k=5)
+    assert sorted(h["document_id"] for h in hits) == ["a", "a", "c", "c"]
+    assert [h["document_id"] for h in vs.search_index("c2", [1.0, 0.0, 0.0])] == ["b"]
+
+    _add_document("c3", "d", [[0.0, 1.0, 0.0]] * 4)
+    assert "c3" not in vs._fetch_manifest("packed_0000")["tenants"]
+
+
+def test_rebuild_of_packed_tenant_stays_in_shard(local_store, monkeypatch):
+    """Rebuilding a packed tenant swaps only its rows inside the shard."""
+    monkeypatch.setattr(vs.settings, "FAISS_PACKED_SHARDS", 1)
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    rng = np.random.default_rng(0)
+    _ingest("c1", "d1", rng.random((3, 4)))
+    _ingest("c2", "d2", rng.random((2, 4)))
+
+    stats = vs.rebuild_index("c1", expected={"d1": 3})
+
+    manifest = vs._fetch_manifest("packed_0000")
+    assert stats["vectors"] == 3 and stats["replaced_vectors"] == 3
+    assert manifest["tenants"] == {"c1": 3, "c2": 2}
+    assert manifest["tombstones"] == [[0, 3]]
+    assert {h["text"] for h in vs.search_index("c1", [0.5] * 4, top_k=5)} == {
+        "d1-0",
+        "d1-1",
+        "d1-2",
+    }
+
+
+def test_document_filter_limits_search_to_selected_rows(local_store, monkeypatch):
+    """Filtered searches fill top-k from the selected documents only."""
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    _add_document("c1", "a", [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0]])
+    _add_document("c1", "b", [[0.0, 1.0, 0.0], [0.1, 0.9, 0.0], [0.0, 0.9, 0.1]])
+    _add_document("c1", "c", [[0.0, 0.0, 1.0]])
+    vs.delete_document("c1", "c")
+
+    def search(document_ids):
+        hits = vs.search_index("c1", [1.0, 0.0, 0.0], 5, document_ids=document_ids)
+        return [h["document_id"] for h in hits]
+
+    assert search(["b"]) == ["b", "b", "b"]
+    assert search(["a", "c", "missing"]) == ["a", "a"]
+    assert search([]) == []
+    assert len(search(None)) == 5
+
+
+def test_large_filters_search_hnsw_with_a_selector(local_store, monkeypatch):
+    """Selections above the exact-search limit use a bitmap selector."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 0)
+    monkeypatch.setattr(vs.settings, "FAISS_FILTER_EXACT_MAX_ROWS", 0)
+    vectors = np.random.default_rng(0).random((200, 8)).astype("float32")
+    rows = [{"document_id": f"d{i % 4}", "chunk_index": i} for i in range(200)]
+    vs.add_to_index("c1", vectors.tolist(), rows)
+    assert isinstance(vs.load_index("c1").segments[0].searcher, vs.faiss.IndexHNSW)
+
+    hits = vs.search_index(
+        "c1", vectors[2].tolist(), top_k=10, ef_search=64, document_ids=["d2"]
+    )
+
+    assert hits[0]["chunk_index"] == 2
+    assert len(hits) == 10
+    assert {h["document_id"] for h in hits} == {"d2"}
+
+
+def test_bulk_delete_does_not_widen_hnsw_search(local_store, monkeypatch):
+    """Tombstoned rows are skipped with a selector, not by raising k."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 0)
+    monkeypatch.setattr(vs.settings, "FAISS_EXACT_SEARCH_MAX_VECTORS", 0)
+    monkeypatch.setattr(vs.settings, "FAISS_FILTER_EXACT_MAX_ROWS", 0)
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    vectors = np.random.default_rng(0).random((400, 8)).astype("float32")
+    rows = [
+        {"document_id": "bulk" if i < 300 else f"d{i}", "chunk_index": i}
+        for i in range(400)
+    ]
+    vs.add_to_index("c1", vectors.tolist(), rows)
+    assert vs.delete_document("c1", "bulk") == 300
+
+    segment = vs.load_index("c1").segments[0]
+    searcher = segment.searcher
+    ks = []
+
+    class SpySearcher:
+        """Record the k of each search of the HNSW graph."""
+
+        def search(self, x, k, params=None):
+            ks.append(k)
+            return searcher.search(x, k, params=params)
+
+        def __getattr__(self, name):
+            return getattr(searcher, name)
+
+    spy = SpySearcher()
+    segment.searcher = spy
+    real_params = vs.search_params
+    monkeypatch.setattr(
+        vs,
+        "search_params",
+        lambda index, *args: real_params(searcher if index is spy else index, *args),
+    )
+
+    hits = vs.search_index("c1", vectors[0].tolist(), top_k=10, ef_search=64)
+
+    assert ks == [10]
+    assert len(hits) == 10
+    assert all(h["chunk_index"] >= 300 for h in hits)
+
+
+@pytest.mark.parametrize("metric", [vs.faiss.METRIC_L2, vs.faiss.METRIC_INNER_PRODUCT])
+def test_exact_search_matches_faiss_knn(metric):
+    """The matrix-product search returns the same neighbours as faiss.knn."""
+    rng = np.random.default_rng(0)
+    vectors = rng.random((300, 16)).astype("float32")
+    queries = rng.random((4, 16)).astype("float32")
+
+    distances, rows = vs.exact_search(queries, vectors, 10, metric)
+    expected_distances, expected_rows = vs.faiss.knn(
+        queries, vectors, 10, metric=metric
+    )
+
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4)
+    assert vs.exact_search(queries, vectors[:3], 10, metric)[1].shape == (4, 3)
+
+
+def test_small_hnsw_segments_search_exactly(local_store, monkeypatch):
+    """Segments under the exact-search limit bypass the graph."""
+    monkeypatch.setattr(vs.settings, "FAISS_FLAT_MAX_VECTORS", 0)
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    vectors = np.random.default_rng(0).random((200, 8)).astype("float32")
+    rows = [{"document_id": f"d{i}", "chunk_index": i} for i in range(200)]
+    vs.add_to_index("c1", vectors.tolist(), rows)
+    vs.delete_document("c1", "d2")
+
+    segment = vs.load_index("c1").segments[0]
+    assert isinstance(segment.searcher, vs.faiss.IndexHNSW)
+    assert segment.exact_vectors.shape == (200, 8)
+
+    def search(query):
+        return [h["chunk_index"] for h in vs.search_index("c1", query, top_k=10)]
+
+    query = vectors[2] + 0.01
+    _, expected = vs.faiss.knn(query[None], vectors, 11)
+    assert search(query.tolist()) == [i for i in expected[0] if i != 2]
+
+    monkeypatch.setattr(vs.settings, "FAISS_EXACT_SEARCH_MAX_VECTORS", 0)
+    vs._index_cache.discard("c1")
+    assert vs.load_index("c1").segments[0].exact_vectors is None
+    assert search(vectors[5].tolist())[0] == 5
+
+
+def test_lexical_search_ranks_exact_identifiers(local_store, monkeypatch):
+    """BM25 finds chunks naming an identifier and skips deleted ones."""
+    monkeypatch.setattr(vs, "_schedule_compaction", lambda client_id: None)
+    rows = [
+        {"text": "Reset your password from settings", "document_id": "a"},
+        {"text": "Error E1023 means the token expired", "document_id": "a"},
+        {"text": "Error E1023 also appears in old logs", "document_id": "b"},
+    ]
+    vs.add_to_index("c1", np.eye(3).tolist(), rows)
+    assert vs.flush_index_uploads(timeout=5)
+
+    hits = vs.search_lexical("c1", "what is e1023 token", top_k=5)
+    assert [h["text"] for h in hits] == [rows[1]["text"], rows[2]["text"]]
+    assert hits[0]["score"] == pytest.approx(1.0)
+    assert hits[1]["score"] < 1.0
+
+    segment = vs._fetch_manifest("c1")["segments"][0]["name"]
+    assert f"indexes/c1/{segment}.terms" in local_store
+
+    vs.delete_document("c1", "a")
+    assert [h["document_id"] for h in vs.search_lexical("c1", "e1023")] == ["b"]
+    assert vs.search_lexical("c1", "e1023", document_ids=["a"]) == []
+
+
+def test_segments_without_terms_file_are_indexed_offline(local_store):
+    """Old segments are skipped lexically until their terms file is built."""
+    vs.add_to_index("c1", [[1.0, 0.0]], [{"text": "Refund policy for SKU-9"}])
+    manifest = vs._fetch_manifest("c1")
+    entry = manifest["segments"][0]
+    del entry["files"][f"{entry['name']}.terms"]
+    vs._write_manifest("c1", manifest)
+    vs._index_cache.discard("c1")
+    vs.os.remove(vs._get_segment_terms_path("c1", entry["name"]))
+
+    assert vs.load_index("c1").segments[0].lexical is None
+    assert vs.search_lexical("c1", "sku-9") == []
+
+    assert vs.build_lexical_indexes("c1") == 1
+    assert vs.build_lexical_indexes("c1") == 0
+    assert vs.load_index("c1").segments[0].lexical is not None
+    assert vs.search_lexical("c1", "sku-9")[0]["text"] == "Refund policy for SKU-9"
+    assert vs.flush_index_uploads(timeout=5)
+    assert f"indexes/c1/{entry['name']}.terms" in local_store